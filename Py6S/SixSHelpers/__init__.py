@@ -20,7 +20,8 @@
 from .aeronet import Aeronet
 from .all_angles import Angles
 from .all_wavelengths import Wavelengths
+from .lambertian_surfaces import LambertianSurfaces
 from .radiosonde import Radiosonde
 from .spectra import Spectra
 
-__all__ = ["Angles", "Wavelengths", "Radiosonde", "Aeronet", "Spectra"]
+__all__ = ["Angles", "Wavelengths", "Radiosonde", "Aeronet", "Spectra", "LambertianSurfaces"]
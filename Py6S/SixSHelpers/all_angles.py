@@ -17,29 +17,109 @@
 
 import copy
 import itertools
-from multiprocessing.dummy import Pool
 
 import numpy as np
 
+from ..batch import results_array, results_dataset, run_batch
 from ..sixs_exceptions import ParameterError
 
 
+def _canonical_angles(azimuth, zenith, reference_azimuth=None):
+    """Returns a canonical ``(azimuth, zenith)`` for a direction, so that directions which are geometrically
+    identical (eg. azimuths of 0 and 360 degrees, or any azimuth at a zenith of 0) give the same result.
+
+    If ``reference_azimuth`` is given then directions which are mirror images of each other about this azimuth
+    also give the same result."""
+    if zenith == 0:
+        return (0.0, 0.0)
+
+    azimuth = azimuth % 360.0
+    if reference_azimuth is not None:
+        relative = (azimuth - reference_azimuth) % 360.0
+        if relative > 180.0:
+            azimuth = (reference_azimuth + 360.0 - relative) % 360.0
+
+    return (round(azimuth, 6), round(zenith, 6))
+
+
 class Angles:
     @classmethod
-    def run360(cls, s, solar_or_view, na=36, nz=10, output_name=None, n=None):
+    def _run_angles(
+        cls, s, points, solar_or_view, reference_azimuth, output_name, n, progress, **kwargs
+    ):
+        """Runs for each of the given ``(azimuth, zenith)`` points, running each unique configuration only once
+        (see :func:`_canonical_angles`), and returns the results for every point in the same way as
+        :func:`Py6S.batch.run_batch`."""
+        unique = {}
+        index = []
+        for azimuth, zenith in points:
+            key = _canonical_angles(azimuth, zenith, reference_azimuth)
+            index.append(unique.setdefault(key, len(unique)))
+
+        s.outputs = None
+        runs = []
+        for azimuth, zenith in unique:
+            a = copy.deepcopy(s)
+
+            if solar_or_view == "view":
+                a.geometry.view_a = azimuth
+                a.geometry.view_z = zenith
+            else:
+                a.geometry.solar_a = azimuth
+                a.geometry.solar_z = zenith
+
+            runs.append(a)
+
+        if output_name is not None:
+            # The runs are our own copies, so there is no need to keep their outputs
+            kwargs.setdefault("keep_outputs", False)
+
+        results = run_batch(runs, output_name, n, progress=progress, **kwargs)
+
+        # Scatter the results back to all of the points (unless they were written to a writer instead)
+        if results is None:
+            return None
+        elif isinstance(results, np.ma.MaskedArray):
+            return results[index]
+        return [results[i] for i in index]
+
+    @classmethod
+    def run360(
+        cls,
+        s,
+        solar_or_view,
+        na=36,
+        nz=10,
+        output_name=None,
+        n=None,
+        progress=None,
+        as_dataset=False,
+        symmetric=False,
+        **kwargs
+    ):
         """Runs Py6S for lots of angles to produce a polar contour plot.
 
         The calls to 6S for each angle will be run in parallel, making this function far faster than simply
-        running a for loop over all of the angles.
+        running a for loop over all of the angles. Angles which give identical geometries (azimuths of 0 and 360 degrees,
+        and all of the azimuths at a zenith of 0) are only simulated once. If ``output_name`` is not set then these points
+        share the same :class:`.Outputs` instance.
 
         Arguments:
 
         * ``s`` -- A :class:`.SixS` instance configured with all of the parameters you want to run the simulation with
         * ``solar_or_view`` -- Set to ``'solar'`` if you want to iterate over the solar zenith/azimuth angles or ``'view'`` if you want to iterate over the view zenith/azimuth angles
-        * ``output_name`` -- (Optional) The name of the output from the 6S simulation to plot. This should be a string containing exactly what you would put after ``s.outputs`` to print the output. For example `pixel_reflectance`.
+        * ``output_name`` -- (Optional) The name of the output from the 6S simulation to plot. This should be a string containing exactly what you would put after ``s.outputs`` to print the output. For example `pixel_reflectance`. To extract several outputs from the same runs, give a list of these strings, or a dictionary mapping the names you want for the results to these strings - the results are then a dictionary containing an array for each output.
         * ``na`` -- (Optional) The number of azimuth angles to iterate over to generate the data for the plot (defaults to 36, giving data every 10 degrees)
         * ``nz`` -- (Optional) The number of zenith angles to iterate over to generate the data for the plot (defaults to 10, giving data every 10 degrees)
         * ``n`` -- (Optional) The number of threads to run in parallel. This defaults to the number of CPU cores in your system, and is unlikely to need changing.
+        * ``progress`` -- (Optional) How to report the progress of the runs, as either an instance of one of the classes in :mod:`Py6S.progress` (for example, :class:`.BarProgress`) or a function to be called with a :class:`.ProgressReport` as each run finishes. Nothing is reported by default.
+        * ``as_dataset`` -- (Optional) Return the results as a labelled :class:`xarray.Dataset` with dimensions ``view_a`` and ``view_z`` (or ``solar_a`` and ``solar_z``) and one variable for each output, instead of the tuple described below. ``output_name`` must be set, and can be a list of outputs. The fixed angles are stored in the dataset's attributes. Requires xarray to be installed.
+        * ``symmetric`` -- (Optional) Assume that the results depend only on the relative azimuth between the sun and the view direction, and are symmetric about the principal plane (which is true for a Lambertian surface, and for most BRDF models). Each pair of mirror-image angles is then only simulated once, roughly halving the number of runs. Defaults to False.
+
+        Any other keyword arguments (for example, ``timeout``, ``retries`` and ``on_error``) are passed on to :func:`Py6S.batch.run_batch`.
+        If a ``writer`` is given (see :mod:`Py6S.streaming`) then the results are written to it as the runs finish, and ``None`` is returned in place of the results.
+        Setting ``on_error="mask"`` returns the results of any failed runs as masked values, rather than losing all of the results
+        when a single run fails.
 
         For example::
 
@@ -50,47 +130,56 @@ class Angles:
           data = SixSHelpers.Angles.run360(s, 'view', output_name='pixel_reflectance')
         """
 
-        results = []
+        if solar_or_view not in ("view", "solar"):
+            raise ParameterError(
+                "all_angles",
+                "You must choose to vary either the solar or view angle.",
+            )
+
+        if as_dataset and output_name is None:
+            raise ParameterError(
+                "output_name", "Must be set to get the results as a labelled dataset"
+            )
+
+        if as_dataset and kwargs.get("writer") is not None:
+            raise ParameterError(
+                "writer", "Can't be used when getting the results as a labelled dataset"
+            )
 
         azimuths = np.linspace(0, 360, na)
         zeniths = np.linspace(0, 89, nz)
 
-        def f(args):
-            azimuth, zenith = args
-            s.outputs = None
-            a = copy.deepcopy(s)
-
+        reference_azimuth = None
+        if symmetric:
             if solar_or_view == "view":
-                a.geometry.view_a = azimuth
-                a.geometry.view_z = zenith
-            elif solar_or_view == "solar":
-                a.geometry.solar_a = azimuth
-                a.geometry.solar_z = zenith
-            else:
-                raise ParameterError(
-                    "all_angles",
-                    "You must choose to vary either the solar or view angle.",
-                )
-
-            a.run()
-
-            if output_name is None:
-                return a.outputs
+                reference_azimuth = s.geometry.solar_a
             else:
-                return getattr(a.outputs, output_name)
-
-        # Run the map
-        if n is None:
-            pool = Pool()
-        else:
-            pool = Pool(n)
-
-        print("Running for many angles - this may take a long time")
-        results = pool.map(f, itertools.product(azimuths, zeniths))
-        pool.close()
-        pool.join()
+                reference_azimuth = s.geometry.view_a
+
+        results = cls._run_angles(
+            s,
+            itertools.product(azimuths, zeniths),
+            solar_or_view,
+            reference_azimuth,
+            output_name,
+            n,
+            progress,
+            **kwargs
+        )
+
+        if as_dataset:
+            fixed = "solar" if solar_or_view == "view" else "view"
+            dims = [solar_or_view + "_a", solar_or_view + "_z"]
+            attrs = {
+                fixed + "_a": getattr(s.geometry, fixed + "_a"),
+                fixed + "_z": getattr(s.geometry, fixed + "_z"),
+            }
+            return results_dataset(
+                results, output_name, dims, {dims[0]: azimuths, dims[1]: zeniths}, attrs
+            )
 
-        results = np.array(results)
+        if results is not None:
+            results = results_array(results, output_name)
 
         return (results, azimuths, zeniths, s.geometry.solar_a, s.geometry.solar_z)
 
@@ -244,7 +333,9 @@ class Angles:
         return fig, ax, cax
 
     @classmethod
-    def run_principal_plane(cls, s, output_name=None, n=None):
+    def run_principal_plane(
+        cls, s, output_name=None, n=None, progress=None, as_dataset=False, **kwargs
+    ):
         """Runs the given 6S simulation to get the outputs for the solar principal plane.
 
         This function runs the simulation for all zenith angles in the azimuthal line of the sun. For example,
@@ -273,8 +364,15 @@ class Angles:
         Arguments:
 
         * ``s`` -- A :class:`.SixS` instance configured with all of the parameters you want to run the simulation with
-        * ``output_name`` -- (Optional) The output name to extract (eg. "pixel_reflectance") if the given data is provided as instances of the Outputs class
+        * ``output_name`` -- (Optional) The output name to extract (eg. "pixel_reflectance") if the given data is provided as instances of the Outputs class. To extract several outputs from the same runs, give a list of these strings, or a dictionary mapping the names you want for the results to these strings - the results are then a dictionary containing an array for each output.
         * ``n`` -- (Optional) The number of threads to run in parallel. This defaults to the number of CPU cores in your system, and is unlikely to need changing.
+        * ``progress`` -- (Optional) How to report the progress of the runs, as either an instance of one of the classes in :mod:`Py6S.progress` (for example, :class:`.BarProgress`) or a function to be called with a :class:`.ProgressReport` as each run finishes. Nothing is reported by default.
+        * ``as_dataset`` -- (Optional) Return the results as a labelled :class:`xarray.Dataset` with one variable for each output, instead of the tuple described below. The dataset has a ``view_z`` dimension, with the signed zenith angles described below as its coordinate, and a ``view_a`` coordinate giving the actual view azimuth of each point. ``output_name`` must be set, and can be a list of outputs. Requires xarray to be installed.
+
+        Any other keyword arguments (for example, ``timeout``, ``retries`` and ``on_error``) are passed on to :func:`Py6S.batch.run_batch`.
+        If a ``writer`` is given (see :mod:`Py6S.streaming`) then the results are written to it as the runs finish, and ``None`` is returned in place of the results.
+        Setting ``on_error="mask"`` returns the results of any failed runs as masked values, rather than losing all of the results
+        when a single run fails.
 
         Return values:
 
@@ -284,6 +382,16 @@ class Angles:
 
         """
 
+        if as_dataset and output_name is None:
+            raise ParameterError(
+                "output_name", "Must be set to get the results as a labelled dataset"
+            )
+
+        if as_dataset and kwargs.get("writer") is not None:
+            raise ParameterError(
+                "writer", "Can't be used when getting the results as a labelled dataset"
+            )
+
         # Get the solar azimuth and zenith angles from the SixS instance
         sa = s.geometry.solar_a
 
@@ -306,34 +414,17 @@ class Angles:
         all_zeniths_for_return = np.hstack((first_side_z, -1 * second_side_z))
         all_azimuths = np.hstack((first_side_a, second_side_a))
 
-        def f(arg):
-            zenith, azimuth = arg
-            s.outputs = None
-            a = copy.deepcopy(s)
-
-            a.geometry.view_z = zenith
-            a.geometry.view_a = azimuth
-            a.run()
-
-            if output_name is None:
-                return a.outputs
-            else:
-                return getattr(a.outputs, output_name)
-
-        # Run the map
-        if n is None:
-            pool = Pool()
-        else:
-            pool = Pool(n)
-
-        print("Running for many angles - this may take a long time")
-        results = pool.map(f, zip(all_zeniths, all_azimuths))
-        pool.close()
-        pool.join()
+        results = cls._run_angles(
+            s, zip(all_azimuths, all_zeniths), "view", None, output_name, n, progress, **kwargs
+        )
 
-        results = np.array(results)
+        if as_dataset:
+            coords = {"view_z": all_zeniths_for_return, "view_a": ("view_z", all_azimuths)}
+            attrs = {"solar_a": s.geometry.solar_a, "solar_z": s.geometry.solar_z}
+            return results_dataset(results, output_name, ["view_z"], coords, attrs)
 
-        results = np.array(results)
+        if results is not None:
+            results = results_array(results, output_name)
 
         return all_zeniths_for_return, results
 
@@ -22,13 +22,26 @@ import numpy as np
 
 from Py6S.Params import PredefinedWavelengths, Wavelength
 
+from ..batch import recursive_getattr, results_array, results_dataset, run_batch
+from ..sixs_exceptions import ParameterError
+
 
 class Wavelengths:
 
     """Helper functions for running the 6S model for a range of wavelengths, and plotting the result"""
 
     @classmethod
-    def run_wavelengths(cls, s, wavelengths, output_name=None, n=None, verbose=False):
+    def run_wavelengths(
+        cls,
+        s,
+        wavelengths,
+        output_name=None,
+        n=None,
+        verbose=False,
+        progress=None,
+        as_dataset=False,
+        **kwargs
+    ):
         """Runs the given SixS parameterisation for each of the wavelengths given, optionally extracting a specific output.
 
         This function is used by all of the other wavelengths running functions, such as :method:`run_vnir`, and thus
@@ -41,14 +54,23 @@ class Wavelengths:
 
         * ``s`` -- A :class:`.SixS` instance with the parameters set as required
         * ``wavelengths`` -- An iterable containing the wavelengths to iterate over
-        * ``output_name`` -- (Optional) The output to extract from ``s.outputs``, as a string that could be placed after ``s.outputs.``, for example ``pixel_reflectance``
+        * ``output_name`` -- (Optional) The output to extract from ``s.outputs``, as a string that could be placed after ``s.outputs.``, for example ``pixel_reflectance``. To extract several outputs from the same runs, give a list of these strings, or a dictionary mapping the names you want for the results to these strings.
         * ``n`` -- (Optional) The number of threads to run in parallel. This defaults to the number of CPU cores in your system, and is unlikely to need changing.
         * ``verbose`` -- (Optional) Print wavelengths as Py6S is running (default=False)
+        * ``progress`` -- (Optional) How to report the progress of the runs, as either an instance of one of the classes in :mod:`Py6S.progress` (for example, :class:`.BarProgress`) or a function to be called with a :class:`.ProgressReport` as each run finishes. Nothing is reported by default.
+        * ``as_dataset`` -- (Optional) Return the results as a labelled :class:`xarray.Dataset`, with a ``wavelength`` dimension (giving the centre wavelength of each run) and one variable for each output. ``output_name`` must be set, and can be a list of outputs. Requires xarray to be installed.
+
+        Any other keyword arguments (for example, ``timeout``, ``retries`` and ``on_error``) are passed on to :func:`Py6S.batch.run_batch`.
+        If a ``writer`` is given (see :mod:`Py6S.streaming`) then the results are written to it as the runs finish, and ``None`` is returned in place of the results.
+        Setting ``on_error="mask"`` returns the results of any failed runs as masked values, rather than losing all of the results
+        when a single run fails.
 
         Return value:
 
         A tuple containing the wavelengths used for the run and the results of the simulations. The results will be a list of :class:`SixS.Outputs` instances if ``output_name`` is not set,
-        or a list of values of the selected output if ``output_name`` is set.
+        or a list of values of the selected output if ``output_name`` is set. If ``output_name`` is a list or dictionary then the results are a dictionary
+        containing an array of values for each output (keyed by the output name, or by the key in the ``output_name`` dictionary).
+        If ``as_dataset`` is set then a :class:`xarray.Dataset` is returned instead.
 
         Example usage::
 
@@ -58,48 +80,57 @@ class Wavelengths:
           wavelengths, results = SixSHelpers.PredefinedWavelengths.run_wavelengths(s, np.arange(0.400, 0.500, 0.001), output_name='pixel_radiance')
           # Run for the first three Landsat TM bands
           wavelengths, results = SixSHelpers.PredefinedWavelengths.run_wavelengths(s, [PredefinedWavelengths.LANDSAT_TM_B1, PredefinedWavelengths.LANDSAT_TM_B2, PredefinedWavelengths.LANDSAT_TM_B3)
+          # Run for all wavelengths from 0.4 to 0.5 micrometers, returning arrays of pixel radiance and total transmittance
+          wavelengths, results = SixSHelpers.Wavelengths.run_wavelengths(s, np.arange(0.400, 0.500, 0.001), output_name={'rad': 'pixel_radiance', 'trans': 'transmittance_total_scattering.total'})
+          # Run for all wavelengths from 0.4 to 0.5 micrometers, returning a dataset of pixel and path radiance
+          ds = SixSHelpers.Wavelengths.run_wavelengths(s, np.arange(0.400, 0.500, 0.001), output_name=['pixel_radiance', 'atmospheric_intrinsic_radiance'], as_dataset=True)
 
         """
-        # Create a function to be called by the map
-        def f(wv):
-            s.outputs = None
+        if verbose:
+            print("wavelengths pass:")
+            print(wavelengths)
+            print(type(wavelengths))
+
+        if as_dataset and output_name is None:
+            raise ParameterError("output_name", "Must be set to get the results as a labelled dataset")
+
+        if as_dataset and kwargs.get("writer") is not None:
+            raise ParameterError(
+                "writer", "Can't be used when getting the results as a labelled dataset"
+            )
+
+        s.outputs = None
+        runs = []
+        centres = []
+        for wv in wavelengths:
             a = copy.deepcopy(s)
             a.wavelength = Wavelength(wv)
             if verbose:
                 print(wv)
-            a.run()
-            if output_name is None:
-                return a.outputs
-            else:
-                return cls.recursive_getattr(a.outputs, output_name)
+            runs.append(a)
+            centres.append(cls.to_centre_wavelengths(a.wavelength))
 
-        # Run the map
-        from multiprocessing.dummy import Pool
+        if output_name is not None:
+            # The runs are our own copies, so there is no need to keep their outputs
+            kwargs.setdefault("keep_outputs", False)
 
-        if n is None:
-            pool = Pool()
-        else:
-            pool = Pool(n)
+        results = run_batch(runs, output_name, n, progress=progress, **kwargs)
 
-        if verbose:
-            print("wavelengths pass:")
-            print(wavelengths)
-            print(type(wavelengths))
+        if as_dataset:
+            return results_dataset(results, output_name, ["wavelength"], {"wavelength": centres})
 
-        print("Running for many wavelengths - this may take a long time")
-        results = pool.map(f, wavelengths)
-
-        pool.close()
-        pool.join()
+        if results is None:
+            # The results were written to a writer instead
+            return np.array(centres), None
 
         try:
             if len(wavelengths[0]) == 4:
                 cleaned_wavelengths = list(map(lambda x: x[:3], wavelengths))
-                return np.array(cleaned_wavelengths), np.array(results)
+                return np.array(cleaned_wavelengths), results_array(results, output_name)
             else:
-                return np.array(wavelengths), np.array(results)
+                return np.array(wavelengths), results_array(results, output_name)
         except Exception:
-            return np.array(wavelengths), np.array(results)
+            return np.array(wavelengths), results_array(results, output_name)
 
     @classmethod
     def run_vnir(cls, s, spacing=0.005, **kwargs):
@@ -158,6 +189,22 @@ class Wavelengths:
         wv = np.arange(0.2, 4.0, spacing)
         return cls.run_wavelengths(s, wv, **kwargs)
 
+    @classmethod
+    def _bands_result(cls, s, wv, **kwargs):
+        """Runs for the given list of predefined bands, returning the centre wavelength of each band with the
+        results (or a dataset, if ``as_dataset`` is set)."""
+        if kwargs.get("as_dataset"):
+            return cls.run_wavelengths(s, wv, **kwargs)
+
+        wv, res = cls.run_wavelengths(s, wv, **kwargs)
+
+        centre_wvs = map(cls.to_centre_wavelengths, wv)
+
+        if sys.version_info[0] >= 3:
+            centre_wvs = list(centre_wvs)
+
+        return (centre_wvs, res)
+
     @classmethod
     def to_centre_wavelengths(cls, item):
         """Get centre wavelengths for a sensor from a list of the wavelength tuples.
@@ -193,14 +240,7 @@ class Wavelengths:
             PredefinedWavelengths.LANDSAT_TM_B7,
         ]
 
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_landsat_oli(cls, s, **kwargs):
@@ -229,14 +269,7 @@ class Wavelengths:
             PredefinedWavelengths.LANDSAT_OLI_B9,
         ]
 
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_landsat_etm(cls, s, **kwargs):
@@ -260,14 +293,7 @@ class Wavelengths:
             PredefinedWavelengths.LANDSAT_ETM_B5,
             PredefinedWavelengths.LANDSAT_ETM_B7,
         ]
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_landsat_mss(cls, s, **kwargs):
@@ -289,14 +315,7 @@ class Wavelengths:
             PredefinedWavelengths.LANDSAT_MSS_B3,
             PredefinedWavelengths.LANDSAT_MSS_B4,
         ]
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_s2a_msi(cls, s, **kwargs):
@@ -328,14 +347,7 @@ class Wavelengths:
             PredefinedWavelengths.S2A_MSI_12,
         ]
 
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_s2b_msi(cls, s, **kwargs):
@@ -367,14 +379,7 @@ class Wavelengths:
             PredefinedWavelengths.S2B_MSI_12,
         ]
 
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_s3a_olci(cls, s, **kwargs):
@@ -414,14 +419,7 @@ class Wavelengths:
             PredefinedWavelengths.S3A_OLCI_21,
         ]
 
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_s3a_slstr(cls, s, **kwargs):
@@ -446,14 +444,7 @@ class Wavelengths:
             PredefinedWavelengths.S3A_SLSTR_06,
         ]
 
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_s3b_olci(cls, s, **kwargs):
@@ -493,14 +484,7 @@ class Wavelengths:
             PredefinedWavelengths.S3B_OLCI_21,
         ]
 
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_s3b_slstr(cls, s, **kwargs):
@@ -525,14 +509,7 @@ class Wavelengths:
             PredefinedWavelengths.S3B_SLSTR_06,
         ]
 
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_meris(cls, s, **kwargs):
@@ -565,14 +542,7 @@ class Wavelengths:
             PredefinedWavelengths.MERIS_B14,
             PredefinedWavelengths.MERIS_B15,
         ]
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_modis(cls, s, **kwargs):
@@ -598,14 +568,7 @@ class Wavelengths:
             PredefinedWavelengths.MODIS_B6,
             PredefinedWavelengths.MODIS_B7,
         ]
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_aqua(cls, s, **kwargs):
@@ -636,14 +599,7 @@ class Wavelengths:
             PredefinedWavelengths.ACCURATE_MODIS_AQUA_15,
         ]
 
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_terra(cls, s, **kwargs):
@@ -674,14 +630,7 @@ class Wavelengths:
             PredefinedWavelengths.ACCURATE_MODIS_TERRA_15,
         ]
 
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_spot_hrv(cls, s, **kwargs):
@@ -702,14 +651,7 @@ class Wavelengths:
             PredefinedWavelengths.SPOT_HRV1_B2,
             PredefinedWavelengths.SPOT_HRV1_B3,
         ]
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_spot_vgt(cls, s, **kwargs):
@@ -731,14 +673,7 @@ class Wavelengths:
             PredefinedWavelengths.SPOT_VGT_B3,
             PredefinedWavelengths.SPOT_VGT_B4,
         ]
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_probav_1(cls, s, **kwargs):
@@ -761,14 +696,7 @@ class Wavelengths:
             PredefinedWavelengths.PROBAV_1_04,
         ]
 
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_probav_2(cls, s, **kwargs):
@@ -791,14 +719,7 @@ class Wavelengths:
             PredefinedWavelengths.PROBAV_2_04,
         ]
 
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_probav_3(cls, s, **kwargs):
@@ -821,14 +742,7 @@ class Wavelengths:
             PredefinedWavelengths.PROBAV_3_04,
         ]
 
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_polder(cls, s, **kwargs):
@@ -854,14 +768,7 @@ class Wavelengths:
             PredefinedWavelengths.POLDER_B7,
             PredefinedWavelengths.POLDER_B8,
         ]
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_seawifs(cls, s, **kwargs):
@@ -887,14 +794,7 @@ class Wavelengths:
             PredefinedWavelengths.SEAWIFS_B7,
             PredefinedWavelengths.SEAWIFS_B8,
         ]
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_aatsr(cls, s, **kwargs):
@@ -916,14 +816,7 @@ class Wavelengths:
             PredefinedWavelengths.AATSR_B3,
             PredefinedWavelengths.AATSR_B4,
         ]
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_aster(cls, s, **kwargs):
@@ -951,14 +844,7 @@ class Wavelengths:
             PredefinedWavelengths.ASTER_B8,
             PredefinedWavelengths.ASTER_B9,
         ]
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_viirs(cls, s, **kwargs):
@@ -990,14 +876,7 @@ class Wavelengths:
             PredefinedWavelengths.VIIRS_BM12,
             PredefinedWavelengths.VIIRS_BI4,
         ]
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_er2_mas(cls, s, **kwargs):
@@ -1022,14 +901,7 @@ class Wavelengths:
             PredefinedWavelengths.ER2_MAS_B6,
             PredefinedWavelengths.ER2_MAS_B7,
         ]
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_ali(cls, s, **kwargs):
@@ -1056,14 +928,7 @@ class Wavelengths:
             PredefinedWavelengths.ALI_B5,
             PredefinedWavelengths.ALI_B7,
         ]
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def run_gli(cls, s, **kwargs):
@@ -1109,23 +974,11 @@ class Wavelengths:
             PredefinedWavelengths.GLI_B29,
             PredefinedWavelengths.GLI_B30,
         ]
-        wv, res = cls.run_wavelengths(s, wv, **kwargs)
-
-        centre_wvs = map(cls.to_centre_wavelengths, wv)
-
-        if sys.version_info[0] >= 3:
-            centre_wvs = list(centre_wvs)
-
-        return (centre_wvs, res)
+        return cls._bands_result(s, wv, **kwargs)
 
     @classmethod
     def recursive_getattr(cls, obj, attr):
-        prev_part = obj
-
-        for part in attr.split("."):
-            prev_part = getattr(prev_part, part)
-
-        return prev_part
+        return recursive_getattr(obj, attr)
 
     @classmethod
     def extract_output(cls, results, output_name):
@@ -0,0 +1,239 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+import copy
+
+import numpy as np
+
+from ..batch import run_batch
+from ..Params import AtmosCorr, GroundReflectance, Wavelength
+from ..sixs_exceptions import ParameterError
+
+# The surface reflectances used to fit the atmospheric terms
+FIT_REFLECTANCES = (0.0, 0.4, 0.8)
+
+
+class LambertianTerms(object):
+    """The atmospheric terms which relate the reflectance of a homogeneous Lambertian surface to the signal at the sensor.
+
+    For a surface reflectance ``rho``, the apparent (top-of-atmosphere) reflectance is::
+
+      path_reflectance + transmittance * rho / (1 - spherical_albedo * rho)
+
+    and the apparent radiance is this multiplied by ``radiance_factor``.
+
+    Attributes:
+
+    * ``path_reflectance`` -- The apparent reflectance of a black surface (ie. the atmospheric intrinsic reflectance)
+    * ``transmittance`` -- The combined downward and upward transmittance, including gaseous absorption
+    * ``spherical_albedo`` -- The spherical albedo of the atmosphere
+    * ``radiance_factor`` -- The factor converting apparent reflectance to apparent radiance (in W/m^2/sr/um)
+
+    Each attribute is either a single value or, if the terms were calculated for many wavelengths, an array with
+    one value per wavelength.
+
+    """
+
+    def __init__(self, path_reflectance, transmittance, spherical_albedo, radiance_factor):
+        self.path_reflectance = path_reflectance
+        self.transmittance = transmittance
+        self.spherical_albedo = spherical_albedo
+        self.radiance_factor = radiance_factor
+
+    @classmethod
+    def fit(cls, reflectances, apparent_reflectances, apparent_radiances):
+        """Calculates the terms from 6S runs for three different surface reflectances.
+
+        Arguments:
+
+        * ``reflectances`` -- The three surface reflectances used, the first of which must be zero
+        * ``apparent_reflectances`` -- The apparent reflectance from each run (with an extra trailing dimension of
+          length three if there were runs for many wavelengths)
+        * ``apparent_radiances`` -- The apparent radiance from each run, in the same form
+
+        """
+        rho1, rho2 = reflectances[1], reflectances[2]
+        y = np.asarray(apparent_reflectances, dtype=float)
+        radiances = np.asarray(apparent_radiances, dtype=float)
+
+        path = y[..., 0]
+        f1 = y[..., 1] - path
+        f2 = y[..., 2] - path
+
+        # Solve b * rho + S * f * rho = f for the two non-zero reflectances. If the
+        # transmittance is zero (eg. in a strong absorption band) then both terms are zero.
+        denominator = rho1 * rho2 * (f2 - f1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            transmittance = np.where(denominator != 0, f1 * f2 * (rho2 - rho1) / denominator, 0.0)
+            albedo = np.where(denominator != 0, (rho1 * f2 - rho2 * f1) / denominator, 0.0)
+            radiance_factor = radiances[..., 2] / y[..., 2]
+
+        return cls(path, transmittance, albedo, radiance_factor)
+
+    def _terms(self, reflectances):
+        reflectances = np.asarray(reflectances, dtype=float)
+        return reflectances, [
+            np.asarray(t)
+            for t in (self.path_reflectance, self.transmittance, self.spherical_albedo)
+        ]
+
+    def apparent_reflectance(self, reflectances):
+        """Returns the apparent (top-of-atmosphere) reflectance for the given surface reflectances.
+
+        ``reflectances`` can be a single value or any NumPy array. If the terms are for many wavelengths then the
+        last dimension of ``reflectances`` must be the wavelength."""
+        rho, (path, transmittance, albedo) = self._terms(reflectances)
+        return path + transmittance * rho / (1 - albedo * rho)
+
+    def apparent_radiance(self, reflectances):
+        """Returns the apparent (top-of-atmosphere) radiance for the given surface reflectances, in the same way as
+        :meth:`apparent_reflectance`."""
+        return self.apparent_reflectance(reflectances) * np.asarray(self.radiance_factor)
+
+
+class LambertianSurfaces:
+    """Helper functions for simulating the signal from many different homogeneous Lambertian surfaces under the same
+    atmosphere, geometry and wavelength, without running 6S for each surface.
+
+    The signal from a homogeneous Lambertian surface depends on its reflectance in a simple way (see
+    :class:`LambertianTerms`), so 6S only needs to be run for a few reflectances to characterise the atmosphere.
+    These runs are done in parallel, so take about as long as a single run. The results for any number of surfaces
+    can then be calculated with NumPy. For example::
+
+      s = SixS()
+      s.aero_profile = AeroProfile.PredefinedType(AeroProfile.Continental)
+      refl, rad = SixSHelpers.LambertianSurfaces.run(s, np.linspace(0, 1, 10000))
+
+    The ``ground_reflectance`` and ``atmos_corr`` settings of the given :class:`.SixS` instance are ignored.
+
+    """
+
+    @classmethod
+    def _fit_runs(cls, s):
+        s.outputs = None
+        runs = []
+        for rho in FIT_REFLECTANCES:
+            a = copy.deepcopy(s)
+            a.ground_reflectance = GroundReflectance.HomogeneousLambertian(rho)
+            a.atmos_corr = AtmosCorr.NoAtmosCorr()
+            runs.append(a)
+
+        return runs
+
+    @classmethod
+    def _terms_from_results(cls, results, shape):
+        refl = np.array([o.apparent_reflectance for o in results]).reshape(shape)
+        rad = np.array([o.apparent_radiance for o in results]).reshape(shape)
+        return LambertianTerms.fit(FIT_REFLECTANCES, refl, rad)
+
+    @classmethod
+    def terms(cls, s, n=None, **kwargs):
+        """Runs 6S to calculate the :class:`LambertianTerms` for the atmosphere, geometry and wavelength configured in
+        the given :class:`.SixS` instance.
+
+        Arguments:
+
+        * ``s`` -- A :class:`.SixS` instance with the parameters set as required
+        * ``n`` -- (Optional) The number of threads to run in parallel
+
+        Any other keyword arguments are passed on to :func:`Py6S.batch.run_batch`.
+
+        """
+        results = run_batch(cls._fit_runs(s), n=n, **kwargs)
+        return cls._terms_from_results(results, (len(FIT_REFLECTANCES),))
+
+    @classmethod
+    def run(cls, s, reflectances, n=None, **kwargs):
+        """Simulates the apparent reflectance and radiance for many homogeneous Lambertian surfaces.
+
+        Arguments:
+
+        * ``s`` -- A :class:`.SixS` instance with the parameters set as required
+        * ``reflectances`` -- A NumPy array of any shape containing surface reflectances
+        * ``n`` -- (Optional) The number of threads to run in parallel
+
+        Return value:
+
+        A tuple of the apparent reflectances and apparent radiances, as arrays of the same shape as ``reflectances``.
+
+        """
+        terms = cls.terms(s, n=n, **kwargs)
+        return terms.apparent_reflectance(reflectances), terms.apparent_radiance(reflectances)
+
+    @classmethod
+    def run_wavelengths(cls, s, wavelengths, spectra=None, reflectances=None, n=None, **kwargs):
+        """Simulates the apparent reflectance and radiance for many homogeneous Lambertian surfaces, each with its own
+        reflectance spectrum, at many wavelengths.
+
+        Arguments:
+
+        * ``s`` -- A :class:`.SixS` instance with the parameters set as required
+        * ``wavelengths`` -- An iterable containing the wavelengths to simulate (in the same form as for
+          :meth:`.Wavelengths.run_wavelengths`)
+        * ``spectra`` -- A list of spectra as 2D arrays of wavelength (column 0) and reflectance (column 1), such as
+          those returned by the :class:`.Spectra` import functions, which are interpolated to the centre of each
+          wavelength range. A single spectrum can also be given as one 2D array, and is treated as one surface.
+        * ``reflectances`` -- Alternatively to ``spectra``, a 2D array of reflectances, with one row per surface and
+          one column per wavelength. This must be given by name, so that it can't be mistaken for a single spectrum.
+        * ``n`` -- (Optional) The number of threads to run in parallel
+
+        Return value:
+
+        A tuple of the wavelengths, the apparent reflectances and the apparent radiances. The reflectances and
+        radiances are arrays with one row per surface and one column per wavelength.
+
+        """
+        wavelengths = list(wavelengths)
+
+        if (spectra is None) == (reflectances is None):
+            raise ParameterError("spectra", "Exactly one of spectra and reflectances must be given")
+
+        if reflectances is not None:
+            reflectances = np.asarray(reflectances, dtype=float)
+            if reflectances.ndim != 2 or reflectances.shape[1] != len(wavelengths):
+                raise ParameterError(
+                    "reflectances", "Must have one row per surface and one column per wavelength"
+                )
+        elif isinstance(spectra, np.ndarray) and spectra.ndim == 2:
+            spectra = [spectra]
+
+        s.outputs = None
+        runs = []
+        centres = []
+        for wv in wavelengths:
+            a = copy.deepcopy(s)
+            a.wavelength = Wavelength(wv)
+            wv_lines = a.wavelength
+            centres.append((wv_lines[1] + wv_lines[2]) / 2.0)
+            runs.extend(cls._fit_runs(a))
+
+        results = run_batch(runs, n=n, **kwargs)
+        terms = cls._terms_from_results(results, (len(wavelengths), len(FIT_REFLECTANCES)))
+
+        if reflectances is None:
+            reflectances = np.array(
+                [
+                    np.interp(centres, spectrum[:, 0], spectrum[:, 1], left=0.0, right=0.0)
+                    for spectrum in spectra
+                ]
+            )
+
+        return (
+            np.array(centres),
+            terms.apparent_reflectance(reflectances),
+            terms.apparent_radiance(reflectances),
+        )
@@ -28,10 +28,23 @@ from .Params import (  # noqa
     Wavelength,
 )
 from .sixs import SixS
-from .sixs_exceptions import ExecutionError, OutputParsingError, ParameterError
-from .SixSHelpers import Aeronet, Angles, Radiosonde, Spectra, Wavelengths  # noqa
+from .sixs_exceptions import (
+    ExecutionError,
+    ExecutionTimeoutError,
+    OutputParsingError,
+    ParameterError,
+)
+from .SixSHelpers import (  # noqa
+    Aeronet,
+    Angles,
+    LambertianSurfaces,
+    Radiosonde,
+    Spectra,
+    Wavelengths,
+)
 
 __all__ = ["SixS", "Outputs", "ParameterError", "OutputParsingError", "ExecutionError"]
+__all__ += ["ExecutionTimeoutError"]
 __all__ += ["Params"]
 __all__ += ["SixSHelpers"]
 
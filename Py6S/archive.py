@@ -0,0 +1,368 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+"""An archive of the raw input files and textual outputs of many 6S runs, stored in a single compressed file.
+
+Writing the output of every run to its own file with :meth:`.Outputs.write_output_file` creates huge numbers of small
+files when running large batches. An archive instead stores the input files and outputs in chunks of many runs, each
+of which is compressed with zlib, and appends them to a single file. Each run is identified by the hash of its input
+file (see :meth:`.SixS.input_hash`), and is only stored once.
+
+To archive every run performed (whether directly or by the helper functions)::
+
+  from Py6S.archive import ArchiveReader, ArchiveWriter
+
+  with ArchiveWriter("runs.py6s") as archive:
+      archive.enable()
+      SixSHelpers.Wavelengths.run_vnir(s, output_name="pixel_radiance")
+
+The runs can then be read back, either as the raw text or as :class:`.Outputs` instances::
+
+  with ArchiveReader("runs.py6s") as archive:
+      deck, fulltext = archive.read(s.input_hash())
+      outputs = archive.load_outputs()
+
+The archive file starts with a short signature, followed by any number of chunks. Each chunk has an uncompressed
+header listing the hash of each run in it and the length of its input file and output, followed by the compressed
+input files and outputs. The index of the whole archive can therefore be built by reading only the chunk headers,
+and any run can be read by decompressing just the chunk containing it. If writing is interrupted then any partially
+written chunk is ignored, and is overwritten when the archive is next opened for writing.
+
+"""
+
+import hashlib
+import os
+import struct
+import threading
+import warnings
+import zlib
+
+from . import hooks
+from .outputs import Outputs
+from .sixs_exceptions import OutputParsingError, ParameterError
+
+# The signature at the start of every archive file
+SIGNATURE = b"PY6SARC1"
+
+# The default number of runs stored in each compressed chunk
+DEFAULT_CHUNK_SIZE = 1000
+
+_CHUNK_MAGIC = b"CHNK"
+
+# The chunk header: magic, number of runs, length of the compressed data
+_CHUNK_HEADER = struct.Struct(">4sIQ")
+
+# The entry for each run in the chunk header: SHA-256 digest of the input file, length of the input file, length
+# of the output (both in bytes once decompressed)
+_RECORD = struct.Struct(">32sII")
+
+
+def _digest(key):
+    try:
+        digest = bytes.fromhex(key)
+    except (TypeError, ValueError):
+        raise KeyError(key)
+
+    if len(digest) != 32:
+        raise KeyError(key)
+
+    return digest
+
+
+def _scan(f, filename):
+    """Reads the headers of all of the complete chunks in an archive file.
+
+    Returns a tuple of the list of chunks, as tuples of ``(offset, length, records)`` where ``records`` is a list of
+    ``(digest, deck_length, output_length)`` tuples, and the position of the end of the last complete chunk."""
+    size = os.fstat(f.fileno()).st_size
+
+    f.seek(0)
+    if f.read(len(SIGNATURE)) != SIGNATURE:
+        raise OutputParsingError("%s is not a Py6S archive" % filename)
+
+    chunks = []
+    end = f.tell()
+    while True:
+        header = f.read(_CHUNK_HEADER.size)
+        if len(header) < _CHUNK_HEADER.size:
+            break
+
+        magic, n_records, length = _CHUNK_HEADER.unpack(header)
+        if magic != _CHUNK_MAGIC:
+            break
+
+        data = f.read(n_records * _RECORD.size)
+        if len(data) < n_records * _RECORD.size:
+            break
+
+        offset = f.tell()
+        if offset + length > size:
+            break
+
+        records = [_RECORD.unpack_from(data, i * _RECORD.size) for i in range(n_records)]
+        chunks.append((offset, length, records))
+        end = offset + length
+        f.seek(end)
+
+    return chunks, end
+
+
+class ArchiveWriter(object):
+
+    """Appends the input files and outputs of 6S runs to an archive file.
+
+    Arguments:
+
+    * ``filename`` -- The archive file to write. If it already exists then runs are appended to it.
+    * ``chunk_size`` -- (Optional) The number of runs to store in each compressed chunk. Larger chunks compress
+      better, but take longer to read a single run from. Defaults to 1000.
+    * ``level`` -- (Optional) The zlib compression level, from 1 (fastest) to 9 (smallest). Defaults to 6.
+
+    Runs are held in memory until a full chunk has been collected, so :meth:`close` must be called (or the writer
+    used as a context manager) to write the final chunk. The writer can be used from many threads at once.
+
+    """
+
+    def __init__(self, filename, chunk_size=DEFAULT_CHUNK_SIZE, level=6):
+        if chunk_size < 1:
+            raise ParameterError("chunk_size", "Must be at least 1")
+
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.level = level
+
+        self._keys = set()
+        self._pending = []
+        self._lock = threading.Lock()
+
+        if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            self._file = open(filename, "r+b")
+            chunks, end = _scan(self._file, filename)
+            for offset, length, records in chunks:
+                self._keys.update(record[0] for record in records)
+
+            # Remove any partially written chunk
+            self._file.truncate(end)
+            self._file.seek(end)
+        else:
+            self._file = open(filename, "wb")
+            self._file.write(SIGNATURE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, key):
+        try:
+            digest = _digest(key)
+        except KeyError:
+            return False
+
+        with self._lock:
+            return digest in self._keys
+
+    def add_text(self, deck, fulltext):
+        """Adds the given input file and textual output (both as strings) to the archive.
+
+        Returns True if the run was added, or False if a run with the same input file was already in the archive."""
+        deck = deck.encode("utf-8")
+        digest = hashlib.sha256(deck).digest()
+
+        with self._lock:
+            if digest in self._keys:
+                return False
+
+            self._keys.add(digest)
+            self._pending.append((digest, deck, fulltext.encode("utf-8")))
+            if len(self._pending) >= self.chunk_size:
+                self._write_chunk()
+
+        return True
+
+    def add(self, s):
+        """Adds a :class:`.SixS` instance which has been run to the archive.
+
+        Returns True if the run was added, or False if a run with the same input file was already in the archive.
+        Raises an :class:`.OutputParsingError` if the full textual output of the run has been dropped (see the
+        ``fulltext_policy`` attribute of :class:`.SixS`)."""
+        if s.outputs is None:
+            raise ParameterError("s", "Must have been run before it can be archived")
+
+        return self.add_text(s.generate_input_file(), s.outputs.fulltext)
+
+    def _write_chunk(self):
+        if not self._pending:
+            return
+
+        records = b"".join(
+            _RECORD.pack(digest, len(deck), len(output)) for digest, deck, output in self._pending
+        )
+        data = zlib.compress(
+            b"".join(deck + output for digest, deck, output in self._pending), self.level
+        )
+
+        self._file.write(_CHUNK_HEADER.pack(_CHUNK_MAGIC, len(self._pending), len(data)))
+        self._file.write(records)
+        self._file.write(data)
+        self._file.flush()
+
+        self._pending = []
+
+    def flush(self):
+        """Writes any runs held in memory to the archive file, as a (possibly smaller than usual) chunk."""
+        with self._lock:
+            self._write_chunk()
+
+    def close(self):
+        """Writes any runs held in memory, stops archiving runs automatically and closes the archive file."""
+        self.disable()
+        with self._lock:
+            if not self._file.closed:
+                self._write_chunk()
+                self._file.close()
+
+    def handle_event(self, event, info):
+        """Archives each successful run. This is the hook registered by :meth:`enable`.
+
+        Runs whose full output was dropped (see the ``fulltext_policy`` of :class:`.Outputs`) can't be archived, so
+        they are skipped with a warning."""
+        if event == "run_timings":
+            try:
+                fulltext = info["sixs"].outputs.fulltext
+            except OutputParsingError:
+                warnings.warn("Not archiving a run whose full output was dropped (fulltext_policy='drop')")
+                return
+            self.add_text(info["input_file"], fulltext)
+
+    def enable(self):
+        """Starts archiving every successful run automatically, by registering with :mod:`Py6S.hooks`.
+
+        This only works for runs performed in this process, so not for the ``"process"`` backend of
+        :func:`Py6S.batch.run_batch`."""
+        hooks.add_hook(self.handle_event)
+
+    def disable(self):
+        """Stops archiving runs automatically."""
+        hooks.remove_hook(self.handle_event)
+
+
+class ArchiveReader(object):
+
+    """Reads runs from an archive file written by :class:`ArchiveWriter`.
+
+    Runs are identified by the hash of their input file, as returned by :meth:`.SixS.input_hash`. Reading runs in
+    bulk with :meth:`load_outputs` decompresses each chunk only once.
+
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, "rb")
+        self._lock = threading.Lock()
+        self._cached_chunk = (None, None)
+
+        chunks, end = _scan(self._file, filename)
+        self._chunks = [(offset, length) for offset, length, records in chunks]
+
+        # The chunk number, position within the decompressed chunk, and input file and output lengths of each run
+        self._index = {}
+        self._order = []
+        for i, (offset, length, records) in enumerate(chunks):
+            position = 0
+            for digest, deck_length, output_length in records:
+                if digest not in self._index:
+                    self._index[digest] = (i, position, deck_length, output_length)
+                    self._order.append(digest)
+                position += deck_length + output_length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._order)
+
+    def __contains__(self, key):
+        try:
+            return _digest(key) in self._index
+        except KeyError:
+            return False
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        """Returns the hashes of the input files of all of the runs in the archive, in the order they were added."""
+        return [digest.hex() for digest in self._order]
+
+    def close(self):
+        """Closes the archive file."""
+        self._file.close()
+
+    def _chunk(self, i):
+        with self._lock:
+            if self._cached_chunk[0] == i:
+                return self._cached_chunk[1]
+
+            offset, length = self._chunks[i]
+            self._file.seek(offset)
+            data = zlib.decompress(self._file.read(length))
+            self._cached_chunk = (i, data)
+
+        return data
+
+    def read(self, key):
+        """Returns the input file and textual output of the run with the given hash, as a tuple of strings.
+
+        Raises a KeyError if there is no such run in the archive."""
+        i, position, deck_length, output_length = self._index[_digest(key)]
+        data = self._chunk(i)
+
+        deck = data[position : position + deck_length]
+        output = data[position + deck_length : position + deck_length + output_length]
+
+        return deck.decode("utf-8"), output.decode("utf-8")
+
+    def outputs(self, key, fulltext_policy=None):
+        """Returns an :class:`.Outputs` instance for the run with the given hash, by parsing its textual output.
+
+        ``fulltext_policy`` sets what the instance does with the textual output once parsed (see :class:`.Outputs`).
+        Raises a KeyError if there is no such run in the archive."""
+        deck, output = self.read(key)
+        return Outputs(output.encode("utf-8"), b"", fulltext_policy)
+
+    def load_outputs(self, keys=None, fulltext_policy=None):
+        """Returns a list of :class:`.Outputs` instances for the runs with the given hashes (or for all of the runs,
+        in the order they were added, if ``keys`` is not given).
+
+        The runs are read chunk by chunk, so each chunk is only decompressed once however the keys are ordered.
+        Raises a KeyError if any of the runs are not in the archive."""
+        if keys is None:
+            keys = self.keys()
+        keys = list(keys)
+
+        order = sorted(range(len(keys)), key=lambda j: self._index[_digest(keys[j])][:2])
+
+        results = [None] * len(keys)
+        for j in order:
+            results[j] = self.outputs(keys[j], fulltext_policy)
+
+        return results
@@ -0,0 +1,250 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Running batches of 6S simulations as array jobs on a cluster, without needing Python on the compute nodes.
+
+:func:`write_batch` writes the input file for each simulation to a directory, along with a manifest listing them
+and a shell script which runs 6S for a range of them. Each task of the array job then runs the script, and once
+they have finished :func:`ingest_outputs` reads all of the outputs back. For example::
+
+  from Py6S.arrayjobs import ingest_outputs, write_batch
+
+  write_batch(runs, "/scratch/batch1")
+
+then submit the array job (for example with Slurm, running 100 simulations in each task)::
+
+  sbatch --array=0-99 --wrap 'sh /scratch/batch1/run_task.sh $((SLURM_ARRAY_TASK_ID * 100)) 100'
+
+and once it has finished::
+
+  results = ingest_outputs("/scratch/batch1", output_name="pixel_radiance")
+
+The directory contains:
+
+* ``manifest.json`` -- The number of simulations, and the input file, output files and input file hash
+  (see :meth:`.SixS.input_hash`) of each of them
+* ``inputs/`` -- The 6S input file for each simulation, named by its (zero-padded) index
+* ``outputs/`` and ``errors/`` -- Where the script writes the standard output and standard error of 6S, along with
+  the hash of the input file it ran (in ``outputs/``, with a ``.sha256`` extension). Outputs whose hash does not
+  match the manifest, for example because they were left over from an earlier batch, are treated as failed.
+* ``run_task.sh`` -- The script to run 6S, which is called as ``run_task.sh FIRST [COUNT]`` to run ``COUNT``
+  simulations (defaulting to 1) starting at index ``FIRST``. The 6S executable is taken from the ``SIXS``
+  environment variable, or found on the ``PATH`` as ``sixsV1.1``.
+
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+
+from .batch import ERROR_POLICIES, RunFailure, _mask_results, _vector_result
+from .bulk import _parse_output_file
+from .progress import get_progress
+from .sixs_exceptions import Error, ExecutionError, ParameterError
+
+MANIFEST_NAME = "manifest.json"
+
+# The version of the manifest format
+MANIFEST_VERSION = 1
+
+_SCRIPT = """#!/bin/sh
+# Runs 6S for the input files written by Py6S.arrayjobs.write_batch.
+# Usage: run_task.sh FIRST [COUNT]
+cd "$(dirname "$0")" || exit 1
+i=$1
+last=$(($1 + ${2:-1}))
+while [ "$i" -lt "$last" ] && [ "$i" -lt %(count)d ]; do
+    name=$(printf "%%0%(width)dd" "$i")
+    hash=$( (sha256sum || shasum -a 256) < "inputs/$name.txt" 2> /dev/null | cut -c1-64)
+    "${SIXS:-sixsV1.1}" < "inputs/$name.txt" > "outputs/$name.txt" 2> "errors/$name.txt"
+    echo "$hash" > "outputs/$name.sha256"
+    i=$((i + 1))
+done
+"""
+
+
+def write_batch(runs, directory):
+    """Writes the input files for a batch of simulations, for running as an array job.
+
+    Arguments:
+
+    * ``runs`` -- A list of :class:`.SixS` instances, each configured with the parameters for one simulation
+    * ``directory`` -- The directory to write the batch to, which is created if necessary. Any batch already in the
+      directory is replaced, including its outputs.
+
+    Returns the number of simulations written. See the module documentation for the files that are written.
+
+    """
+    runs = list(runs)
+    width = max(6, len(str(len(runs) - 1)))
+
+    # Remove the manifest first, so that the directory is never left with the manifest of one batch and the files
+    # of another
+    manifest_name = os.path.join(directory, MANIFEST_NAME)
+    if os.path.exists(manifest_name):
+        os.remove(manifest_name)
+
+    for subdirectory in ("inputs", "outputs", "errors"):
+        path = os.path.join(directory, subdirectory)
+        os.makedirs(path, exist_ok=True)
+        for filename in os.listdir(path):
+            if os.path.isfile(os.path.join(path, filename)):
+                os.remove(os.path.join(path, filename))
+
+    entries = []
+    for i, run in enumerate(runs):
+        name = "%0*d" % (width, i)
+        input_file = run.generate_input_file()
+        run._write_input_file(input_file, os.path.join(directory, "inputs", name + ".txt"))
+        entries.append(
+            {
+                "input": "inputs/%s.txt" % name,
+                "output": "outputs/%s.txt" % name,
+                "errors": "errors/%s.txt" % name,
+                "output_hash": "outputs/%s.sha256" % name,
+                "hash": hashlib.sha256(input_file.encode("utf-8")).hexdigest(),
+            }
+        )
+
+    script_name = os.path.join(directory, "run_task.sh")
+    with open(script_name, "w") as f:
+        f.write(_SCRIPT % {"count": len(runs), "width": width})
+    os.chmod(script_name, 0o755)
+
+    # The manifest is written last, so that a directory with a manifest always has all of its input files
+    manifest = {"version": MANIFEST_VERSION, "count": len(runs), "runs": entries}
+    with open(manifest_name, "w") as f:
+        json.dump(manifest, f, indent=1)
+
+    return len(runs)
+
+
+def read_manifest(directory):
+    """Returns the manifest of a batch written by :func:`write_batch`, as a dictionary."""
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError) as e:
+        raise ParameterError("directory", "Could not read the batch manifest: %s" % e)
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ParameterError(
+            "directory", "Unsupported batch manifest version %s" % manifest.get("version")
+        )
+
+    return manifest
+
+
+def _ingest_task(args):
+    """Parses the output of a single simulation, returning it as a vector (or a :class:`.RunFailure`)."""
+    j, output_filename, errors_filename, hash_filename, input_hash = args
+
+    if not os.path.exists(output_filename):
+        return j, RunFailure(ExecutionError("6S output file %s not found" % output_filename), None)
+
+    try:
+        with open(hash_filename) as f:
+            output_hash = f.read().strip()
+    except (IOError, OSError):
+        output_hash = None
+
+    if output_hash != input_hash:
+        return j, RunFailure(
+            ExecutionError(
+                "6S output file %s was not produced from the input file in the manifest"
+                % output_filename
+            ),
+            None,
+        )
+
+    try:
+        return j, _parse_output_file(output_filename, errors_filename)
+    except (IOError, OSError):
+        return j, RunFailure(ExecutionError("6S output file %s not found" % output_filename), None)
+    except Error as e:
+        return j, RunFailure(e, None)
+
+
+def ingest_outputs(directory, output_name=None, n=None, progress=None, on_error="mask"):
+    """Reads the outputs of a batch of simulations written by :func:`write_batch`, once they have been run.
+
+    The outputs are parsed in parallel, in a pool of worker processes.
+
+    Arguments:
+
+    * ``directory`` -- The directory the batch was written to
+    * ``output_name`` -- (Optional) The output to extract from each run, in any of the forms accepted by
+      :func:`Py6S.batch.run_batch`
+    * ``n`` -- (Optional) The number of processes to use. Defaults to the number of CPU cores in your system.
+    * ``progress`` -- (Optional) How to report the progress, in the same way as for :func:`Py6S.batch.run_batch`
+    * ``on_error`` -- (Optional) What to do about simulations whose output is missing, could not be parsed or was not
+      produced from the input file in the manifest, as for :func:`Py6S.batch.run_batch`. Defaults to ``"mask"``, as
+      it is common for a few tasks of an array job to fail.
+      With ``"collect"`` the :class:`.RunFailure` for each failed simulation includes its input file.
+
+    Return value:
+
+    The results in the same form as :func:`Py6S.batch.run_batch`, in the order of the simulations in the manifest.
+    When ``output_name`` is not set the :class:`.Outputs` instances are recreated from the parsed values, without
+    their ``fulltext``.
+
+    """
+    if on_error not in ERROR_POLICIES:
+        raise ParameterError("on_error", "Must be one of: %s" % ", ".join(ERROR_POLICIES))
+
+    entries = read_manifest(directory)["runs"]
+    tasks = [
+        (
+            j,
+            os.path.join(directory, entry["output"]),
+            os.path.join(directory, entry["errors"]),
+            os.path.join(directory, entry["output_hash"]),
+            entry["hash"],
+        )
+        for j, entry in enumerate(entries)
+    ]
+
+    progress = get_progress(progress)
+    progress.start(len(tasks))
+
+    results = [None] * len(tasks)
+    pool = multiprocessing.Pool(n)
+    try:
+        for j, vector in pool.imap_unordered(_ingest_task, tasks, chunksize=16):
+            if isinstance(vector, RunFailure):
+                if on_error == "raise":
+                    raise vector.error
+                with open(os.path.join(directory, entries[j]["input"])) as f:
+                    vector.input_file = f.read()
+
+            results[j] = _vector_result(vector, output_name)
+            progress.update()
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+    progress.finish()
+
+    if on_error == "mask":
+        return _mask_results(results, output_name)
+
+    return results
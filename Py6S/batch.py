@@ -0,0 +1,608 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Functions for running many 6S simulations in parallel.
+
+These are used by the helper functions in :mod:`Py6S.SixSHelpers`, but can also be used directly to run any
+set of simulations - for example, to build a lookup table."""
+
+import copy
+import multiprocessing
+import threading
+import time
+from multiprocessing.dummy import Pool
+
+import numpy as np
+
+from . import hooks
+from .outputs import FULLTEXT_POLICIES, VECTOR_FIELDS, Outputs
+from .progress import get_progress
+from .sixs_exceptions import Error, ExecutionError, ParameterError
+
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:
+    # Only available in Python 3.8 or later
+    SharedMemory = None
+
+ERROR_POLICIES = ("raise", "mask", "collect")
+
+BACKENDS = ("thread", "process", "distributed")
+
+# The time in seconds between checks for finished jobs when using the distributed backend
+DISTRIBUTED_POLL_INTERVAL = 0.5
+
+
+class RunFailure(object):
+
+    """Stands in for the result of a run which failed, when running a batch with ``on_error="collect"``.
+
+    Attributes:
+
+    * ``error`` -- The exception raised by the run
+    * ``input_file`` -- The text of the 6S input file for the run, so that it can be investigated or re-run by hand
+      (or ``None`` if the input file itself couldn't be created)
+
+    """
+
+    def __init__(self, error, input_file):
+        self.error = error
+        self.input_file = input_file
+
+    def __repr__(self):
+        return "RunFailure(%s: %s)" % (type(self.error).__name__, self.error)
+
+
+def recursive_getattr(obj, attr):
+    """Gets an attribute given as a dotted path, for example ``transmittance_total_scattering.total``."""
+    prev_part = obj
+
+    for part in attr.split("."):
+        prev_part = getattr(prev_part, part)
+
+    return prev_part
+
+
+def _is_multiple(output_name):
+    return isinstance(output_name, (list, tuple, dict))
+
+
+def _output_keys(output_name):
+    if isinstance(output_name, dict):
+        return list(output_name.keys())
+    return list(output_name)
+
+
+def _output_paths(output_name):
+    if isinstance(output_name, dict):
+        return list(output_name.values())
+    return list(output_name)
+
+
+def _execute(run, timeout, retries, backoff, on_error):
+    """Runs a single :class:`.SixS` instance, retrying if required. Returns ``None`` if the run succeeded, or a
+    :class:`RunFailure` if it failed and ``on_error`` is not ``"raise"``."""
+    if timeout is not None:
+        run.timeout = timeout
+
+    try:
+        for attempt in range(retries + 1):
+            try:
+                run.run()
+                break
+            except ExecutionError:
+                if attempt == retries:
+                    raise
+                time.sleep(backoff * 2 ** attempt)
+    except Error as e:
+        if on_error == "raise":
+            raise
+
+        try:
+            input_file = run.generate_input_file()
+        except Error:
+            input_file = None
+        return RunFailure(e, input_file)
+
+    return None
+
+
+# The position of each output in the vectors produced by Outputs.to_vector
+_FIELD_INDEX = dict((name, i) for i, name in enumerate(VECTOR_FIELDS))
+
+
+def _vector_value(vector, path):
+    """Gets an output from a vector produced by :meth:`.Outputs.to_vector`, given its path."""
+    if path in _FIELD_INDEX:
+        return float(vector[_FIELD_INDEX[path]])
+    return recursive_getattr(Outputs.from_vector(vector), path)
+
+
+def _process_task(args):
+    """Runs a single simulation in a worker process, returning the outputs as a vector (or writing them to the shared
+    memory buffer, if one is given)."""
+    j, n_runs, run, timeout, retries, backoff, on_error, buffer_name = args
+
+    failure = _execute(run, timeout, retries, backoff, on_error)
+    if failure is not None:
+        return j, failure
+
+    vector = run.outputs.to_vector()
+    if buffer_name is None:
+        return j, vector
+
+    buffer = SharedMemory(name=buffer_name)
+    try:
+        table = np.ndarray((n_runs, len(VECTOR_FIELDS)), dtype=np.float64, buffer=buffer.buf)
+        table[j] = vector
+        del table
+    finally:
+        buffer.close()
+
+    return j, None
+
+
+def _run_processes(
+    runs, n, progress, timeout, retries, backoff, on_error, use_shared_memory, on_result
+):
+    """Runs the given simulations in a pool of worker processes, calling ``on_result(j, vector)`` with the output
+    vector (or :class:`RunFailure`) of each run as it finishes."""
+    buffer = None
+    if use_shared_memory and len(runs) > 0:
+        buffer = SharedMemory(create=True, size=len(runs) * len(VECTOR_FIELDS) * 8)
+        table = np.ndarray((len(runs), len(VECTOR_FIELDS)), dtype=np.float64, buffer=buffer.buf)
+        table[:] = np.nan
+
+    tasks = [
+        (j, len(runs), run, timeout, retries, backoff, on_error, buffer.name if buffer else None)
+        for j, run in enumerate(runs)
+    ]
+
+    pool = multiprocessing.Pool(n)
+    try:
+        completed = 0
+        for j, result in pool.imap_unordered(_process_task, tasks):
+            if result is None:
+                result = table[j].copy()
+            on_result(j, result)
+            completed += 1
+            hooks.emit("queue_depth", depth=len(runs) - completed)
+            progress.update()
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+        if buffer is not None:
+            del table
+            buffer.close()
+            buffer.unlink()
+
+
+def _run_distributed(runs, coordinator, progress, timeout, retries, on_error, on_result):
+    """Runs the given simulations on the workers of a :class:`.Coordinator`, calling ``on_result(j, vector)`` with
+    the output vector (or :class:`RunFailure`) of each run as it finishes."""
+    decks = []
+    for j, run in enumerate(runs):
+        try:
+            decks.append((j, run.generate_input_file()))
+        except Error as e:
+            if on_error == "raise":
+                raise
+            on_result(j, RunFailure(e, None))
+            progress.update()
+
+    ids = coordinator.submit(
+        [deck for j, deck in decks],
+        timeout=[timeout if timeout is not None else runs[j].timeout for j, deck in decks],
+        retries=retries,
+    )
+    jobs = dict((job_id, (j, deck)) for job_id, (j, deck) in zip(ids, decks))
+
+    try:
+        while jobs:
+            finished = coordinator.results(list(jobs.keys()))
+            for job_id, (vector, error) in finished.items():
+                j, deck = jobs.pop(job_id)
+                if error is not None:
+                    if on_error == "raise":
+                        raise error
+                    on_result(j, RunFailure(error, deck))
+                else:
+                    on_result(j, vector)
+                progress.update()
+
+            if jobs:
+                hooks.emit("queue_depth", depth=coordinator.counts(jobs.keys())["pending"])
+            if not finished:
+                time.sleep(DISTRIBUTED_POLL_INTERVAL)
+    except BaseException:
+        coordinator.cancel(list(jobs.keys()))
+        raise
+
+
+def run_batch(
+    runs,
+    output_name=None,
+    n=None,
+    progress=None,
+    timeout=None,
+    retries=0,
+    backoff=1.0,
+    on_error="raise",
+    keep_outputs=True,
+    deduplicate=True,
+    backend="thread",
+    shared_memory=False,
+    fulltext_policy=None,
+    coordinator=None,
+    writer=None,
+):
+    """Runs each of the given :class:`.SixS` instances, in parallel, and returns their outputs.
+
+    Arguments:
+
+    * ``runs`` -- A list of :class:`.SixS` instances, each configured with the parameters for one simulation. These
+      instances are run in place, so will have their ``outputs`` attribute set afterwards.
+    * ``output_name`` -- (Optional) The output to extract from each run, as a string that could be placed after
+      ``s.outputs.``, for example ``pixel_reflectance`` or ``transmittance_total_scattering.total``. This can also
+      be a list of such strings, or a dictionary with such strings as its values, to extract several outputs from
+      each run.
+    * ``n`` -- (Optional) The number of threads (or processes) to run in parallel. This defaults to the number of
+      CPU cores in your system, and is unlikely to need changing.
+    * ``progress`` -- (Optional) How to report the progress of the runs: either an instance of one of the classes
+      in :mod:`Py6S.progress` (such as :class:`.BarProgress`), or a function to be called with a
+      :class:`.ProgressReport` each time a run finishes. Nothing is reported by default.
+    * ``timeout`` -- (Optional) The maximum time, in seconds, that each run may take before it is stopped. If not
+      given then the ``timeout`` attribute of each :class:`.SixS` instance is used.
+    * ``retries`` -- (Optional) The number of times to retry a run which fails with an :class:`.ExecutionError`
+      (including an :class:`.ExecutionTimeoutError`) before giving up. Defaults to 0 - ie. no retries.
+    * ``backoff`` -- (Optional) The time in seconds to wait before the first retry of a run. This doubles for each
+      subsequent retry of the same run. Defaults to 1 second.
+    * ``on_error`` -- (Optional) What to do when a run fails (after any retries). One of:
+
+      * ``"raise"`` -- (the default) Raise the error, abandoning any runs which have not yet been started
+      * ``"mask"`` -- Carry on with the other runs, and return a NumPy masked array with the failed runs masked. The
+        underlying values for failed runs are NaN if ``output_name`` is set, or ``None`` otherwise.
+      * ``"collect"`` -- Carry on with the other runs, and put a :class:`RunFailure` instance (giving the error and the
+        6S input file) in the results in place of each failed run
+
+    * ``keep_outputs`` -- (Optional) Whether to keep the :class:`.Outputs` instance in the ``outputs`` attribute of
+      each run once the selected outputs have been extracted (defaults to True). Setting this to False saves memory
+      when running large batches. It has no effect if ``output_name`` is not set.
+    * ``deduplicate`` -- (Optional) Whether to run 6S only once for runs with identical input files (see
+      :meth:`.SixS.input_hash`), copying the results to the other identical runs. Defaults to True.
+    * ``backend`` -- (Optional) How to run the simulations in parallel: either ``"thread"`` (the default), which
+      runs them from a pool of threads, or ``"process"``, which runs them in a pool of worker processes. The process
+      backend avoids any contention for Python's global interpreter lock when running on many cores. The workers
+      send back only a compact vector of the numerical outputs (see :meth:`.Outputs.to_vector`), and
+      :class:`.Outputs` instances are only recreated (without their ``fulltext``) if ``output_name`` is not set.
+      With this backend the ``outputs`` attribute of the runs is only set if ``output_name`` is not set, and the
+      hooks in :mod:`Py6S.hooks` are called in the worker processes for events about individual runs. The
+      ``"distributed"`` backend sends the simulations to the workers of a :class:`.Coordinator` (see
+      :mod:`Py6S.distributed`), which may be on other machines. This works in the same way as the process backend,
+      except that ``n``, ``backoff`` and ``shared_memory`` are ignored, and failed runs are retried immediately.
+    * ``shared_memory`` -- (Optional) When using the process backend, have the workers write their results directly
+      into a :mod:`multiprocessing.shared_memory` buffer rather than sending them back. Defaults to False.
+    * ``fulltext_policy`` -- (Optional) What to do with the full textual output of each run once it has been
+      parsed: ``"keep"``, ``"compress"`` or ``"drop"`` (see :class:`.Outputs`). If not given then the
+      ``fulltext_policy`` attribute of each :class:`.SixS` instance is used.
+    * ``coordinator`` -- (Optional) The :class:`.Coordinator` to send the simulations to, when using the
+      ``"distributed"`` backend
+    * ``writer`` -- (Optional) A :class:`.ResultWriter` to write a row to for each run as it finishes (see
+      :mod:`Py6S.streaming`), rather than returning the results. This keeps the memory used by large batches
+      bounded. ``output_name`` should be set, as otherwise all of the numerical outputs are written.
+
+    Return value:
+
+    A list containing the :class:`.Outputs` instance from each run if ``output_name`` is not set, or the value of
+    the selected output from each run if ``output_name`` is set, in the same order as ``runs``. If ``output_name`` is
+    a list or dictionary then the value for each run is a tuple of the selected outputs (in the order of the list or
+    of the dictionary's values), which can be split into separate arrays with :func:`results_array`. If ``on_error`` is ``"mask"`` then this is
+    a NumPy masked array instead (with one column per output if ``output_name`` is a list).
+
+    If ``writer`` is set then the results are written to it instead, and ``None`` is returned.
+
+    While running, the number of simulations which have not yet been started is reported to the hooks in
+    :mod:`Py6S.hooks` as ``queue_depth`` events. Duplicate runs which are not run are not counted, either here or in
+    the progress reports.
+
+    """
+    if on_error not in ERROR_POLICIES:
+        raise ParameterError("on_error", "Must be one of: %s" % ", ".join(ERROR_POLICIES))
+
+    if backend not in BACKENDS:
+        raise ParameterError("backend", "Must be one of: %s" % ", ".join(BACKENDS))
+
+    if shared_memory and SharedMemory is None:
+        raise ParameterError("shared_memory", "Shared memory requires Python 3.8 or later")
+
+    if backend == "distributed" and coordinator is None:
+        raise ParameterError("coordinator", "Must be given to use the distributed backend")
+
+    if fulltext_policy is not None and fulltext_policy not in FULLTEXT_POLICIES:
+        raise ParameterError("fulltext_policy", "Must be one of: %s" % ", ".join(FULLTEXT_POLICIES))
+
+    runs = list(runs)
+    if fulltext_policy is not None:
+        for run in runs:
+            run.fulltext_policy = fulltext_policy
+    paths = _output_paths(output_name) if _is_multiple(output_name) else None
+
+    # The index of the run which will actually be run for each run
+    leaders = list(range(len(runs)))
+    if deduplicate:
+        first = {}
+        for i, run in enumerate(runs):
+            try:
+                key = (run.sixs_path, run.input_hash())
+            except Error:
+                # The error will be raised (or recorded) when this run is started
+                continue
+            leaders[i] = first.setdefault(key, i)
+    unique = sorted(set(leaders))
+
+    # The duplicates of each run which is actually run
+    followers = {}
+    for i, leader in enumerate(leaders):
+        if leader != i:
+            followers.setdefault(leader, []).append(i)
+
+    lock = threading.Lock()
+    started = [0]
+
+    def extract(run):
+        if output_name is None:
+            return run.outputs
+
+        if _is_multiple(output_name):
+            result = tuple(recursive_getattr(run.outputs, path) for path in paths)
+        else:
+            result = recursive_getattr(run.outputs, output_name)
+
+        if not keep_outputs:
+            run.outputs = None
+
+        return result
+
+    def f(args):
+        i, run = args
+        with lock:
+            started[0] += 1
+            depth = len(unique) - started[0]
+        hooks.emit("queue_depth", depth=depth)
+
+        failure = _execute(run, timeout, retries, backoff, on_error)
+        if failure is not None:
+            return i, failure
+
+        return i, extract(run)
+
+    progress = get_progress(progress)
+
+    hooks.emit("queue_depth", depth=len(unique))
+    progress.start(len(unique))
+
+    results = [None] * len(runs) if writer is None else None
+    if writer is not None:
+        writer.start(runs, _row_keys(output_name))
+
+    # The runs (from those which are actually run) which failed
+    failed = set()
+
+    def handle(i, result):
+        if isinstance(result, RunFailure):
+            failed.add(i)
+
+        if writer is None:
+            results[i] = result
+            return
+
+        row = _result_row(result, output_name)
+        error = result.error if isinstance(result, RunFailure) else None
+        for k in [i] + followers.get(i, []):
+            writer.write(k, runs[k], row, error)
+
+    def handle_vector(j, vector):
+        i = unique[j]
+        result = _vector_result(vector, output_name)
+        if output_name is None and not isinstance(vector, RunFailure):
+            runs[i].outputs = result
+        handle(i, result)
+
+    if backend == "thread":
+        pool = Pool(n)
+        try:
+            for i, result in pool.imap_unordered(f, [(i, runs[i]) for i in unique]):
+                handle(i, result)
+                progress.update()
+        except BaseException:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+    elif backend == "process":
+        _run_processes(
+            [runs[i] for i in unique],
+            n,
+            progress,
+            timeout,
+            retries,
+            backoff,
+            on_error,
+            shared_memory,
+            handle_vector,
+        )
+    else:
+        _run_distributed(
+            [runs[i] for i in unique],
+            coordinator,
+            progress,
+            timeout,
+            retries,
+            on_error,
+            handle_vector,
+        )
+
+    progress.finish()
+
+    # Each duplicate gets its own copy of the outputs, so that changing one run's outputs doesn't change the others.
+    # The duplicates of a failed run share its RunFailure.
+    for leader, duplicates in followers.items():
+        for i in duplicates:
+            if leader in failed:
+                runs[i].outputs = None
+                if results is not None:
+                    results[i] = results[leader]
+                continue
+
+            runs[i].outputs = copy.deepcopy(runs[leader].outputs)
+            if results is not None:
+                if output_name is None:
+                    results[i] = runs[i].outputs
+                else:
+                    results[i] = copy.deepcopy(results[leader])
+
+    if writer is not None:
+        return None
+
+    if on_error == "mask":
+        return _mask_results(results, output_name)
+
+    return results
+
+
+def _vector_result(vector, output_name):
+    """Converts a vector produced by :meth:`.Outputs.to_vector` (or a :class:`RunFailure`) to a result, in the form
+    returned by :func:`run_batch`."""
+    if isinstance(vector, RunFailure):
+        return vector
+    elif output_name is None:
+        return Outputs.from_vector(vector)
+    elif _is_multiple(output_name):
+        return tuple(_vector_value(vector, path) for path in _output_paths(output_name))
+    else:
+        return _vector_value(vector, output_name)
+
+
+def _row_keys(output_name):
+    """Returns the names of the outputs in the rows written to a :class:`.ResultWriter`."""
+    if output_name is None:
+        return list(VECTOR_FIELDS)
+    elif _is_multiple(output_name):
+        return _output_keys(output_name)
+    else:
+        return [output_name]
+
+
+def _result_row(result, output_name):
+    """Converts a result (or a :class:`RunFailure`) to a dictionary of output values, for a :class:`.ResultWriter`."""
+    keys = _row_keys(output_name)
+    if isinstance(result, RunFailure):
+        values = [float("nan")] * len(keys)
+    elif output_name is None:
+        values = result.to_vector()
+    elif _is_multiple(output_name):
+        values = result
+    else:
+        values = [result]
+
+    return dict(zip(keys, values))
+
+
+def _mask_results(results, output_name):
+    """Converts a list of results (including :class:`RunFailure` instances) to a masked array, as returned by
+    :func:`run_batch` with ``on_error="mask"``."""
+    mask = [isinstance(result, RunFailure) for result in results]
+    if output_name is None:
+        fill = None
+    elif _is_multiple(output_name):
+        n_outputs = len(_output_paths(output_name))
+        fill = (float("nan"),) * n_outputs
+        mask = [(failed,) * n_outputs for failed in mask]
+    else:
+        fill = float("nan")
+    values = [fill if isinstance(result, RunFailure) else result for result in results]
+    if output_name is None:
+        values = np.array(values, dtype=object)
+    return np.ma.masked_array(values, mask=mask)
+
+
+def results_array(results, output_name=None):
+    """Converts the results returned by :func:`run_batch` to a NumPy array, keeping the mask if they are masked.
+
+    If the ``output_name`` passed to :func:`run_batch` was a list or dictionary then this should be passed here too,
+    and the results are returned as a dictionary of arrays, one for each output. The keys of the dictionary are the
+    output names in the list, or the keys of the ``output_name`` dictionary."""
+    if isinstance(results, np.ma.MaskedArray):
+        values = results
+    else:
+        values = np.array(results)
+
+    if not _is_multiple(output_name):
+        return values
+
+    keys = _output_keys(output_name)
+    values = values.reshape(len(values), len(keys))
+
+    return {key: values[:, i] for i, key in enumerate(keys)}
+
+
+def results_dataset(results, output_name, dims, coords, attrs=None):
+    """Converts the results returned by :func:`run_batch` to a labelled :class:`xarray.Dataset`, with one variable
+    for each output.
+
+    Requires the xarray module to be installed.
+
+    Arguments:
+
+    * ``results`` -- The results from :func:`run_batch`, which must have been called with ``output_name`` set
+    * ``output_name`` -- The ``output_name`` passed to :func:`run_batch`. The variables are named after the outputs,
+      or after the keys if this is a dictionary.
+    * ``dims`` -- A list of the names of the dimensions of the results. The runs must have been given to
+      :func:`run_batch` in C order over these dimensions (ie. with the last dimension varying fastest).
+    * ``coords`` -- A dictionary of coordinates, as accepted by :class:`xarray.Dataset`, which must include a
+      1D array of the values of each dimension
+    * ``attrs`` -- (Optional) A dictionary of attributes to store in the dataset
+
+    Failed runs (if ``on_error="mask"`` or ``on_error="collect"`` was used) are given NaN values.
+
+    """
+    try:
+        import xarray
+    except ImportError:
+        raise ImportError("You must install xarray to get the results as a labelled dataset")
+
+    if output_name is None:
+        raise ParameterError("output_name", "Must be set to get the results as a labelled dataset")
+
+    names = _output_keys(output_name) if _is_multiple(output_name) else [output_name]
+    shape = tuple(len(coords[dim]) for dim in dims)
+
+    if not isinstance(results, np.ma.MaskedArray):
+        results = _mask_results(list(results), output_name)
+
+    values = np.ma.filled(np.ma.asarray(results, dtype=float), np.nan)
+    values = values.reshape(shape + (len(names),))
+
+    data_vars = {name: (dims, values[..., i]) for i, name in enumerate(names)}
+
+    return xarray.Dataset(data_vars, coords=coords, attrs=attrs or {})
@@ -0,0 +1,210 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Reading large numbers of saved 6S output files (such as those written by :meth:`.Outputs.write_output_file`) into a
+table with a column for each output.
+
+The files are parsed in parallel, in a pool of worker processes, and any which can't be parsed are skipped. For
+example::
+
+  from Py6S.bulk import read_outputs
+
+  table = read_outputs("/data/6s_outputs/*.txt", output_name=["pixel_radiance", "solar_z"])
+  print(table["pixel_radiance"].mean())
+  table.to_parquet("outputs.parquet")
+
+"""
+
+import glob
+import multiprocessing
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from .batch import _FIELD_INDEX, _is_multiple, _output_keys, _output_paths
+from .outputs import VECTOR_FIELDS, Outputs
+from .progress import get_progress
+from .sixs_exceptions import Error, OutputParsingError, ParameterError
+
+
+def _parse_output_file(filename, errors_filename=None):
+    """Parses a saved 6S output file (and, optionally, a file containing the standard error of 6S), returning the
+    outputs as a vector (see :meth:`.Outputs.to_vector`). Raises an :class:`.Error` if the file can't be parsed."""
+    with open(filename, "rb") as f:
+        stdout = f.read()
+
+    stderr = b""
+    if errors_filename is not None and os.path.exists(errors_filename):
+        with open(errors_filename, "rb") as f:
+            stderr = f.read()
+
+    try:
+        outputs = Outputs(stdout, stderr, "drop")
+    except Error:
+        raise
+    except Exception as e:
+        raise OutputParsingError("Could not parse 6S output file %s: %s" % (filename, e))
+
+    return outputs.to_vector()
+
+
+def _parse_task(args):
+    j, filename = args
+
+    try:
+        return j, _parse_output_file(filename), None
+    except (Error, IOError, OSError) as e:
+        return j, None, e
+
+
+def _find_files(source, recursive):
+    if isinstance(source, (list, tuple)):
+        return list(source)
+
+    if os.path.isdir(source):
+        pattern = os.path.join(source, "**", "*") if recursive else os.path.join(source, "*")
+    else:
+        pattern = source
+
+    return sorted(f for f in glob.glob(pattern, recursive=recursive) if os.path.isfile(f))
+
+
+class OutputTable(object):
+
+    """A table of outputs read from many 6S output files, as returned by :func:`read_outputs`.
+
+    Attributes:
+
+    * ``filenames`` -- A list of the files which were parsed successfully, one for each row of the table
+    * ``columns`` -- An ordered dictionary of the columns of the table, each of which is a NumPy array with a value
+      for each file. Missing outputs are NaN.
+    * ``skipped`` -- A list of ``(filename, error)`` tuples for the files which couldn't be read or parsed
+
+    Columns can also be accessed as ``table[name]``.
+
+    """
+
+    def __init__(self, filenames, columns, skipped):
+        self.filenames = filenames
+        self.columns = columns
+        self.skipped = skipped
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def to_pandas(self):
+        """Returns the table as a :class:`pandas.DataFrame`, with a ``filename`` column as well as the outputs.
+
+        Requires the pandas module to be installed."""
+        try:
+            import pandas
+        except ImportError:
+            raise ImportError("You must install pandas to get the outputs as a DataFrame")
+
+        data = OrderedDict([("filename", self.filenames)])
+        data.update(self.columns)
+
+        return pandas.DataFrame(data)
+
+    def to_parquet(self, filename, compression="snappy"):
+        """Writes the table to a Parquet file, with a ``filename`` column as well as the outputs.
+
+        Requires the pyarrow module to be installed."""
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("You must install pyarrow to write the outputs to a Parquet file")
+
+        data = OrderedDict([("filename", self.filenames)])
+        data.update(self.columns)
+
+        pyarrow.parquet.write_table(pyarrow.table(data), filename, compression=compression)
+
+
+def read_outputs(source, output_name=None, n=None, progress=None, recursive=False):
+    """Reads many saved 6S output files into an :class:`OutputTable`, parsing them in parallel.
+
+    Arguments:
+
+    * ``source`` -- A directory (all of whose files are read), a glob pattern such as ``"/data/*/output_*.txt"``, or
+      a list of filenames
+    * ``output_name`` -- (Optional) The outputs to read, as a single output name or a list or dictionary of them, in
+      the same form as for :func:`Py6S.batch.run_batch`. The columns are named after the outputs, or after the keys
+      if this is a dictionary. These must be numerical outputs listed in :data:`Py6S.outputs.VECTOR_FIELDS`, all of
+      which are read by default.
+    * ``n`` -- (Optional) The number of processes to use. Defaults to the number of CPU cores in your system.
+    * ``progress`` -- (Optional) How to report the progress, in the same way as for :func:`Py6S.batch.run_batch`
+    * ``recursive`` -- (Optional) Whether to read the files in all subdirectories of a directory (or to allow
+      ``**`` in a glob pattern). Defaults to False.
+
+    Files which can't be read or parsed are skipped, and listed in the ``skipped`` attribute of the table.
+
+    """
+    if output_name is None:
+        names = paths = list(VECTOR_FIELDS)
+    elif _is_multiple(output_name):
+        names = _output_keys(output_name)
+        paths = _output_paths(output_name)
+    else:
+        names = paths = [output_name]
+
+    for path in paths:
+        if path not in _FIELD_INDEX:
+            raise ParameterError(
+                "output_name", "%s is not one of the numerical outputs in VECTOR_FIELDS" % path
+            )
+    indices = [_FIELD_INDEX[path] for path in paths]
+
+    filenames = _find_files(source, recursive)
+
+    values = np.full((len(filenames), len(paths)), np.nan)
+    parsed = np.zeros(len(filenames), dtype=bool)
+    skipped = []
+
+    progress = get_progress(progress)
+    progress.start(len(filenames))
+
+    pool = multiprocessing.Pool(n)
+    try:
+        tasks = enumerate(filenames)
+        for j, vector, error in pool.imap_unordered(_parse_task, tasks, chunksize=64):
+            if error is not None:
+                skipped.append((filenames[j], error))
+            else:
+                values[j] = vector[indices]
+                parsed[j] = True
+            progress.update()
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+    progress.finish()
+
+    values = values[parsed]
+    columns = OrderedDict((name, values[:, i].copy()) for i, name in enumerate(names))
+    skipped.sort(key=lambda item: item[0])
+
+    return OutputTable([f for f, ok in zip(filenames, parsed) if ok], columns, skipped)
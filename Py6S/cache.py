@@ -0,0 +1,576 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Caching the outputs of 6S runs, so that physically equivalent runs only need 6S to be run once.
+
+Runs are looked up by a *canonical key*: a hash of the 6S input file in which each value has been rounded to a
+quantisation step chosen for the kind of parameter it is. Two runs whose angles differ by ``1e-9`` degrees (or which
+were computed slightly differently by :meth:`.Geometry.User.from_time_and_location`) therefore share a key, and the
+second is answered from the cache. For example::
+
+  from Py6S.cache import ResultCache
+
+  s.cache = ResultCache(steps={"angle": 0.1})
+  s.run()  # Runs 6S
+  s.geometry.solar_z += 0.01
+  s.run()  # Uses the outputs of the first run
+
+The steps are given as a dictionary with any of the following keys, each of which applies to the decimal values in
+one part of the input file (integer codes, such as the type of an aerosol profile, are never rounded):
+
+* ``angle`` -- The geometry, including the solar and view angles
+* ``aot`` -- The AOT at 550nm (or the visibility)
+* ``wavelength`` -- The wavelength (or the filter function)
+* ``reflectance`` -- The ground reflectance, including the parameters of BRDF models and spectra
+
+A step of ``None`` means that the values are compared exactly (to the precision of the input file). Any steps not
+given are taken from ``DEFAULT_STEPS``, and all other parts of the input file (such as the atmospheric profile) are
+always compared exactly. The key also includes a hash of the contents of the 6S executable, so runs with different
+builds of 6S never share outputs.
+
+The outputs of runs can be shared between many processes (and machines) with a :class:`SQLiteCache`, stored in a
+database file on shared storage, or a :class:`CacheServer` serving a cache over HTTP to :class:`RemoteCache`
+clients. For example, on one machine::
+
+  python -m Py6S.cache serve cache.db --port 8766
+
+and then in every process running 6S::
+
+  s.cache = RemoteCache("http://cache-host:8766")
+
+Note that values lying either side of the boundary between two steps are still given different keys, however close
+together they are, so the steps should be chosen so that any value within a step gives effectively the same outputs.
+
+"""
+
+import abc
+import argparse
+import collections
+import copy
+import hashlib
+import json
+import math
+import os
+import re
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+
+from .outputs import VECTOR_VERSION, Outputs
+from .sixs_exceptions import ParameterError
+
+# The default quantisation step for each kind of parameter
+DEFAULT_STEPS = {"angle": 0.01, "aot": 0.0001, "wavelength": 0.0001, "reflectance": 0.0001}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+# The quantisation step used for each part of the input file (see _input_sections)
+_SECTION_STEPS = {
+    "geometry": "angle",
+    "aot": "aot",
+    "wavelength": "wavelength",
+    "reflectance": "reflectance",
+}
+
+# The hashes of the 6S executables used in keys, keyed by their path, size and modification time
+_executable_hashes = {}
+_executable_hashes_lock = threading.Lock()
+
+_NUMBER = re.compile(r"(?<![\w.])[-+]?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?(?![\w.])")
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _quantise_token(match, step):
+    token = match.group(0)
+    if "." not in token and "e" not in token and "E" not in token:
+        # Integers are codes or counts, rather than measurements, so are kept as they are
+        return token
+
+    value = float(token)
+    if step is not None and math.isfinite(value):
+        value = round(value / step) * step
+        # Remove the floating point noise introduced by the multiplication
+        value = float("%.12g" % value)
+
+    # Avoid distinguishing between 0.0 and -0.0
+    return repr(value + 0.0)
+
+
+def _quantise(text, step):
+    return _NUMBER.sub(lambda match: _quantise_token(match, step), text)
+
+
+def _get_steps(steps):
+    if steps is None:
+        return dict(DEFAULT_STEPS)
+
+    for name, step in steps.items():
+        if name not in DEFAULT_STEPS:
+            raise ParameterError(
+                "steps",
+                "Unknown parameter %s, must be one of: %s" % (name, ", ".join(DEFAULT_STEPS)),
+            )
+        if step is not None and not step > 0:
+            raise ParameterError("steps", "The step for %s must be positive or None" % name)
+
+    result = dict(DEFAULT_STEPS)
+    result.update(steps)
+    return result
+
+
+def _input_sections(sixs):
+    """Returns the 6S input file for a :class:`.SixS` instance split into its parts, as a list of ``(name, text)``
+    tuples. The names are ``geometry``, ``atmos_aero``, ``aot``, ``altitudes``, ``wavelength``, ``reflectance`` and
+    ``atmos_corr``."""
+    input_file = sixs.generate_input_file()
+
+    # The ground reflectance lines can't be generated on their own (as they need the wavelengths filling in), so
+    # they are taken from whatever is between the wavelength and atmospheric correction lines
+    sections = [
+        ("geometry", sixs._create_geom_lines()),
+        ("atmos_aero", sixs._create_atmos_aero_lines()),
+        ("aot", sixs._create_aot_vis_lines()),
+        ("altitudes", sixs._create_elevation_lines()),
+        ("wavelength", sixs._create_wavelength_lines()[0]),
+    ]
+    start = sum(len(text) for name, text in sections)
+    atmos_corr = str(sixs._create_atmos_corr_lines())
+    sections.append(("reflectance", input_file[start : len(input_file) - len(atmos_corr)]))
+    sections.append(("atmos_corr", atmos_corr))
+
+    return sections
+
+
+def canonical_input(sixs, steps=None):
+    """Returns the 6S input file for a :class:`.SixS` instance with its values rounded to the quantisation steps.
+
+    Arguments:
+
+    * ``sixs`` -- The :class:`.SixS` instance
+    * ``steps`` -- (Optional) A dictionary of the quantisation steps, as described in the module documentation
+
+    """
+    steps = _get_steps(steps)
+
+    return "".join(
+        _quantise(text, steps.get(_SECTION_STEPS.get(name))) for name, text in _input_sections(sixs)
+    )
+
+
+def _executable_hash(path):
+    """Returns a hash of the contents of the 6S executable at the given path (or ``"none"`` if there isn't one),
+    which is only recalculated if the file changes."""
+    if path is None:
+        return "none"
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "missing:" + path
+    identity = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+
+    with _executable_hashes_lock:
+        digest = _executable_hashes.get(identity)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1048576), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        with _executable_hashes_lock:
+            _executable_hashes[identity] = digest
+
+    return digest
+
+
+def canonical_key(sixs, steps=None):
+    """Returns the canonical key of a :class:`.SixS` instance, as a hexadecimal string.
+
+    Runs with the same key are equivalent to within the quantisation steps (see the module documentation), which are
+    themselves part of the key, and are run with the same 6S executable (identified by a hash of its contents, so
+    the same build installed in different places on different machines still shares keys).
+
+    """
+    steps = _get_steps(steps)
+    header = " ".join("%s=%r" % (name, steps[name]) for name in sorted(steps))
+    header += " sixs=" + _executable_hash(sixs.sixs_path)
+    text = header + "\n" + canonical_input(sixs, steps)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class Cache(abc.ABC):
+
+    """The interface shared by all of the caches, which can be subclassed to store outputs elsewhere.
+
+    Subclasses must set the ``steps`` attribute (using ``DEFAULT_STEPS`` for any steps not given) and implement
+    :meth:`get_many` and :meth:`put`, and must be safe to use from many threads at once. Subclasses which don't
+    implement them can't be created.
+
+    """
+
+    steps = DEFAULT_STEPS
+
+    def key(self, sixs):
+        """Returns the key for a :class:`.SixS` instance, using the quantisation steps of this cache."""
+        return canonical_key(sixs, self.steps)
+
+    def get(self, key):
+        """Returns the cached :class:`.Outputs` for a key, or None if there aren't any."""
+        return self.get_many([key]).get(key)
+
+    @abc.abstractmethod
+    def get_many(self, keys):
+        """Returns a dictionary of the cached :class:`.Outputs` for those of the given keys which are in the cache."""
+
+    @abc.abstractmethod
+    def put(self, key, outputs):
+        """Stores the :class:`.Outputs` for a key."""
+
+
+class ResultCache(Cache):
+
+    """An in-memory cache of the outputs of 6S runs, keyed by their canonical keys.
+
+    Set this as the ``cache`` attribute of a :class:`.SixS` instance (or of many of them - the cache is safe to use
+    from many threads at once) and :meth:`.SixS.run` uses the cached outputs of any equivalent run, rather than
+    running 6S. Each lookup is reported to the hooks in :mod:`Py6S.hooks` as a ``cache_hit`` or ``cache_miss`` event.
+
+    Arguments:
+
+    * ``size`` -- (Optional) The maximum number of outputs to keep, with the least recently used discarded first.
+      Defaults to 1024.
+    * ``steps`` -- (Optional) A dictionary of the quantisation steps, as described in the module documentation
+
+    The cache only lives in memory, and is emptied when it is copied to another process (for example, by the
+    ``"process"`` backend of :func:`Py6S.batch.run_batch`). It stores a copy of each :class:`.Outputs` instance, and
+    returns a new copy from each lookup, so that changing the outputs of one run never changes those of another.
+
+    """
+
+    def __init__(self, size=1024, steps=None):
+        if size < 1:
+            raise ParameterError("size", "Must be at least 1")
+
+        self.size = size
+        self.steps = _get_steps(steps)
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"size": self.size, "steps": self.steps}
+
+    def __setstate__(self, state):
+        self.__init__(state["size"], state["steps"])
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, keys):
+        results = {}
+        with self._lock:
+            for key in keys:
+                outputs = self._entries.get(key)
+                if outputs is not None:
+                    self._entries.move_to_end(key)
+                    results[key] = outputs
+        return {key: copy.deepcopy(outputs) for key, outputs in results.items()}
+
+    def put(self, key, outputs):
+        outputs = copy.deepcopy(outputs)
+        with self._lock:
+            self._entries[key] = outputs
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Removes all of the cached outputs."""
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache(Cache):
+
+    """A cache of the outputs of 6S runs stored in an SQLite database file, which can be shared between many
+    processes - including processes on other machines, if the file is on shared storage.
+
+    Arguments:
+
+    * ``database`` -- The SQLite database file, which is created if it doesn't exist
+    * ``steps`` -- (Optional) A dictionary of the quantisation steps, as described in the module documentation
+    * ``timeout`` -- (Optional) How long to wait, in seconds, for another process which is writing to the database
+      to finish before giving up. Defaults to 60 seconds.
+
+    The outputs are stored as vectors (see :meth:`.Outputs.to_vector`), so the :class:`.Outputs` instances returned
+    from the cache have all of the numerical outputs, but not the ``fulltext``. SQLite's own locking is used to
+    make sure that processes writing to the database at the same time don't interfere with each other, although
+    note that this relies on the file locking of the shared file system working properly.
+
+    """
+
+    def __init__(self, database, steps=None, timeout=60.0):
+        self.database = database
+        self.steps = _get_steps(steps)
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(database, timeout=timeout, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.executescript(_SCHEMA)
+
+    def __getstate__(self):
+        return {"database": self.database, "steps": self.steps, "timeout": self.timeout}
+
+    def __setstate__(self, state):
+        self.__init__(state["database"], state["steps"], state["timeout"])
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def get_many(self, keys):
+        keys = list(keys)
+        results = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows = self._db.execute(
+                    "SELECT key, vector FROM results WHERE version = ? AND key IN (%s)"
+                    % ",".join("?" * len(chunk)),
+                    [VECTOR_VERSION] + chunk,
+                ).fetchall()
+                for key, vector in rows:
+                    results[key] = Outputs.from_vector(np.frombuffer(vector, dtype=np.float64))
+
+        return results
+
+    def put(self, key, outputs):
+        self.put_many({key: outputs})
+
+    def put_many(self, items):
+        """Stores the :class:`.Outputs` for many keys at once, given as a dictionary."""
+        rows = [
+            (key, VECTOR_VERSION, outputs.to_vector().tobytes(), time.time())
+            for key, outputs in items.items()
+        ]
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO results (key, version, vector, created) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def clear(self):
+        """Removes all of the cached outputs."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM results")
+
+    def close(self):
+        """Closes the database."""
+        with self._lock:
+            self._db.close()
+
+
+class CacheServer(object):
+
+    """Serves a cache over HTTP, so that many processes on many machines can share it through a
+    :class:`RemoteCache`.
+
+    Arguments:
+
+    * ``cache`` -- The cache to serve, such as a :class:`ResultCache` or :class:`SQLiteCache`
+    * ``token`` -- (Optional) A secret which clients must give to use the cache
+
+    As with :class:`.Coordinator`, the HTTP interface has no encryption, and should only be used on a trusted network.
+    The server can also be started from the command line, with ``python -m Py6S.cache serve``.
+
+    """
+
+    def __init__(self, cache, token=None):
+        self.cache = cache
+        self.token = token
+        self.url = None
+
+        self._server = None
+
+    def serve(self, port=0, addr=""):
+        """Serves the cache in a background thread.
+
+        If ``port`` is 0 then a free port is chosen. Returns the URL which clients should connect to (which is also
+        stored in the ``url`` attribute)."""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if server.token is not None and self.headers.get("X-Py6S-Token") != server.token:
+                    self.send_error(403)
+                    return
+
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length).decode("utf-8"))
+
+                if self.path == "/get":
+                    found = server.cache.get_many(request["keys"])
+                    response = {
+                        "version": VECTOR_VERSION,
+                        "results": dict(
+                            (key, outputs.to_vector().tolist()) for key, outputs in found.items()
+                        ),
+                    }
+                elif self.path == "/put":
+                    if request.get("version") == VECTOR_VERSION:
+                        for key, vector in request["results"].items():
+                            server.cache.put(key, Outputs.from_vector(vector))
+                    response = {}
+                else:
+                    self.send_error(404)
+                    return
+
+                body = json.dumps(response).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = _ThreadingHTTPServer((addr, port), Handler)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        host = addr or socket.gethostname()
+        self.url = "http://%s:%d" % (host, self._server.server_address[1])
+
+        return self.url
+
+    def shutdown(self):
+        """Stops serving the cache."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class RemoteCache(Cache):
+
+    """A cache served by a :class:`CacheServer`.
+
+    Arguments:
+
+    * ``url`` -- The URL of the server, as returned by :meth:`CacheServer.serve`
+    * ``steps`` -- (Optional) A dictionary of the quantisation steps, as described in the module documentation
+    * ``token`` -- (Optional) The secret required by the server, if it has one
+    * ``timeout`` -- (Optional) How long to wait for the server to respond, in seconds. Defaults to 10 seconds.
+
+    If the server can't be reached then lookups are treated as misses and new outputs aren't stored, so the runs
+    continue (running 6S themselves) rather than failing. As with :class:`SQLiteCache`, the :class:`.Outputs`
+    instances returned don't have their ``fulltext``.
+
+    """
+
+    def __init__(self, url, steps=None, token=None, timeout=10.0):
+        self.url = url.rstrip("/")
+        self.steps = _get_steps(steps)
+        self.token = token
+        self.timeout = timeout
+
+    def _request(self, path, data):
+        request = urllib.request.Request(
+            self.url + path,
+            data=json.dumps(data).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        if self.token is not None:
+            request.add_header("X-Py6S-Token", self.token)
+
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def get_many(self, keys):
+        try:
+            response = self._request("/get", {"keys": list(keys)})
+        except (urllib.error.URLError, OSError):
+            return {}
+
+        if response["version"] != VECTOR_VERSION:
+            return {}
+
+        return dict(
+            (key, Outputs.from_vector(vector)) for key, vector in response["results"].items()
+        )
+
+    def put(self, key, outputs):
+        self.put_many({key: outputs})
+
+    def put_many(self, items):
+        """Stores the :class:`.Outputs` for many keys at once, given as a dictionary."""
+        results = dict((key, outputs.to_vector().tolist()) for key, outputs in items.items())
+        try:
+            self._request("/put", {"version": VECTOR_VERSION, "results": results})
+        except (urllib.error.URLError, OSError):
+            pass
+
+
+def main(argv=None):
+    """Serves a shared cache from the command line. Run ``python -m Py6S.cache --help`` for details."""
+    parser = argparse.ArgumentParser(prog="python -m Py6S.cache")
+    subparsers = parser.add_subparsers(dest="command")
+
+    serve_parser = subparsers.add_parser("serve", help="Serve a cache stored in an SQLite database")
+    serve_parser.add_argument("database", help="The SQLite database to store the cache in")
+    serve_parser.add_argument("--port", type=int, default=8766)
+    serve_parser.add_argument("--addr", default="")
+    serve_parser.add_argument("--token")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        cache = SQLiteCache(args.database)
+        server = CacheServer(cache, args.token)
+        print("Serving cache at %s" % server.serve(args.port, args.addr))
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            server.shutdown()
+            cache.close()
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
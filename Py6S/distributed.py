@@ -0,0 +1,496 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Running batches of 6S simulations on many machines.
+
+A :class:`Coordinator` keeps a queue of 6S input files (jobs) in an SQLite database, and serves it over HTTP.
+:class:`Worker` processes - on the same machine or on any others which can connect to it - repeatedly take jobs from
+the queue, run 6S and send back the outputs as a compact vector of numbers (see :meth:`.Outputs.to_vector`).
+
+The easiest way to use this is through the ``"distributed"`` backend of :func:`Py6S.batch.run_batch`, which is also
+available from all of the helper functions. On the machine running the simulations::
+
+  from Py6S.distributed import Coordinator
+
+  coordinator = Coordinator("jobs.db")
+  coordinator.serve(8765)
+  SixSHelpers.Wavelengths.run_vnir(s, output_name="pixel_radiance", backend="distributed", coordinator=coordinator)
+
+and then on each of the worker machines (which need Py6S and 6S installed, but nothing else)::
+
+  python -m Py6S.distributed worker http://coordinator-host:8765 -n 8
+
+If a worker stops while running a job then the job is given to another worker once its lease has expired. The HTTP
+interface has no encryption, and should only be used on a trusted network - setting a ``token`` on the coordinator
+and workers stops anyone without the token from taking or completing jobs.
+
+"""
+
+import argparse
+import json
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+
+from . import hooks
+from .outputs import VECTOR_VERSION
+from .sixs import SixS
+from .sixs_exceptions import Error, ExecutionError, ExecutionTimeoutError, OutputParsingError
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    deck TEXT NOT NULL,
+    timeout REAL,
+    retries INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    leased_at REAL,
+    vector BLOB,
+    error_type TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+"""
+
+# The errors which can be recreated from the name of their type and their message
+_ERROR_TYPES = {
+    "ExecutionError": ExecutionError,
+    "ExecutionTimeoutError": ExecutionTimeoutError,
+    "OutputParsingError": OutputParsingError,
+}
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _make_error(error_type, message):
+    if error_type in _ERROR_TYPES:
+        return _ERROR_TYPES[error_type](message)
+    return ExecutionError("%s: %s" % (error_type, message))
+
+
+def _chunks(items, size=500):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+class Coordinator(object):
+
+    """Stores a queue of 6S jobs in an SQLite database, and hands them out to :class:`Worker` processes.
+
+    Arguments:
+
+    * ``database`` -- (Optional) The SQLite database file to store the jobs and their results in. If the file
+      already exists then any jobs in it are kept, so a batch can be continued after the coordinator is restarted.
+      Defaults to ``":memory:"``, which keeps the jobs in memory only.
+    * ``lease_time`` -- (Optional) The time in seconds after which a job which has been taken by a worker, but not
+      completed, is given to another worker. Defaults to 600 seconds.
+    * ``token`` -- (Optional) A secret which workers must give to take or complete jobs
+
+    The jobs can be managed directly with :meth:`submit`, :meth:`results` and :meth:`cancel`, although most
+    users will only need to pass the coordinator to :func:`Py6S.batch.run_batch`. :meth:`serve` must be called
+    before workers can connect.
+
+    """
+
+    def __init__(self, database=":memory:", lease_time=600.0, token=None):
+        self.database = database
+        self.lease_time = lease_time
+        self.token = token
+        self.url = None
+
+        self._server = None
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(database, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.executescript(_SCHEMA)
+
+    def submit(self, decks, timeout=None, retries=0):
+        """Adds jobs to the queue, and returns a list of their IDs.
+
+        Arguments:
+
+        * ``decks`` -- A list of 6S input files, as strings (see :meth:`.SixS.generate_input_file`)
+        * ``timeout`` -- (Optional) The maximum time in seconds that each run of 6S may take, either as a single value
+          or a list with a value for each job
+        * ``retries`` -- (Optional) The number of times to retry a job which fails with an :class:`.ExecutionError`
+
+        """
+        decks = list(decks)
+        if timeout is None or np.isscalar(timeout):
+            timeout = [timeout] * len(decks)
+
+        ids = []
+        with self._lock, self._db:
+            for deck, run_timeout in zip(decks, timeout):
+                cursor = self._db.execute(
+                    "INSERT INTO jobs (deck, timeout, retries) VALUES (?, ?, ?)",
+                    (deck, run_timeout, retries),
+                )
+                ids.append(cursor.lastrowid)
+
+        return ids
+
+    def claim(self, worker, count=1):
+        """Takes up to ``count`` jobs from the queue for the named worker, and returns a list of dictionaries with
+        the ``id``, ``deck`` and ``timeout`` of each job. Jobs whose lease has expired are handed out again.
+        """
+        now = time.time()
+        with self._lock, self._db:
+            rows = self._db.execute(
+                "SELECT id, deck, timeout FROM jobs WHERE status = 'pending' "
+                "OR (status = 'running' AND leased_at < ?) ORDER BY id LIMIT ?",
+                (now - self.lease_time, count),
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE jobs SET status = 'running', worker = ?, leased_at = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                [(worker, now, row[0]) for row in rows],
+            )
+
+        return [{"id": row[0], "deck": row[1], "timeout": row[2]} for row in rows]
+
+    def complete(self, job_id, vector=None, error_type=None, error=None, version=VECTOR_VERSION):
+        """Records the result of a job: either the vector of its outputs (in the given version of the vector
+        format), or the name of the type of error that it failed with and the error message.
+
+        Jobs which failed with an :class:`.ExecutionError` are put back in the queue if they have been tried fewer
+        times than the number of retries allowed. Results for jobs which are no longer running (for example, because
+        they have been cancelled or completed by another worker) are ignored."""
+        if vector is not None and version != VECTOR_VERSION:
+            vector = None
+            error_type = "OutputParsingError"
+            error = "The worker produced version %s output vectors, but version %s is required" % (
+                version,
+                VECTOR_VERSION,
+            )
+
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT status, attempts, retries FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None or row[0] != "running":
+                return
+
+            if vector is not None:
+                blob = np.asarray(vector, dtype=np.float64).tobytes()
+                self._db.execute(
+                    "UPDATE jobs SET status = 'done', vector = ? WHERE id = ?", (blob, job_id)
+                )
+            elif error_type in ("ExecutionError", "ExecutionTimeoutError") and row[1] <= row[2]:
+                self._db.execute("UPDATE jobs SET status = 'pending' WHERE id = ?", (job_id,))
+            else:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'failed', error_type = ?, error = ? WHERE id = ?",
+                    (error_type, error, job_id),
+                )
+
+    def results(self, ids):
+        """Returns a dictionary of the results of those jobs (out of the given IDs) which have finished.
+
+        The value for each job is a tuple of ``(vector, error)``: either the NumPy array of its outputs and ``None``,
+        or ``None`` and the exception it failed with."""
+        results = {}
+        with self._lock:
+            for chunk in _chunks(list(ids)):
+                rows = self._db.execute(
+                    "SELECT id, status, vector, error_type, error FROM jobs WHERE status IN ('done', 'failed') "
+                    "AND id IN (%s)" % ",".join("?" * len(chunk)),
+                    chunk,
+                ).fetchall()
+                for job_id, status, vector, error_type, error in rows:
+                    if status == "done":
+                        results[job_id] = (np.frombuffer(vector, dtype=np.float64), None)
+                    else:
+                        results[job_id] = (None, _make_error(error_type, error))
+
+        return results
+
+    def counts(self, ids=None):
+        """Returns a dictionary of the number of jobs with each status (``pending``, ``running``, ``done``,
+        ``failed`` and ``cancelled``), out of the given IDs or all of the jobs."""
+        counts = dict(
+            (status, 0) for status in ("pending", "running", "done", "failed", "cancelled")
+        )
+        with self._lock:
+            if ids is None:
+                rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+                counts.update(dict(rows.fetchall()))
+            else:
+                for chunk in _chunks(list(ids)):
+                    rows = self._db.execute(
+                        "SELECT status, COUNT(*) FROM jobs WHERE id IN (%s) GROUP BY status"
+                        % ",".join("?" * len(chunk)),
+                        chunk,
+                    )
+                    for status, count in rows.fetchall():
+                        counts[status] += count
+
+        return counts
+
+    def cancel(self, ids):
+        """Removes the given jobs from the queue, if they have not already finished."""
+        with self._lock, self._db:
+            for chunk in _chunks(list(ids)):
+                self._db.execute(
+                    "UPDATE jobs SET status = 'cancelled' WHERE status IN ('pending', 'running') "
+                    "AND id IN (%s)" % ",".join("?" * len(chunk)),
+                    chunk,
+                )
+
+    def serve(self, port=0, addr=""):
+        """Serves the queue over HTTP in a background thread, so that workers can connect to it.
+
+        If ``port`` is 0 then a free port is chosen. Returns the URL which workers should connect to (which is also
+        stored in the ``url`` attribute)."""
+        coordinator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if (
+                    coordinator.token is not None
+                    and self.headers.get("X-Py6S-Token") != coordinator.token
+                ):
+                    self.send_error(403)
+                    return
+
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length).decode("utf-8"))
+
+                if self.path == "/claim":
+                    response = coordinator.claim(request["worker"], request.get("count", 1))
+                elif self.path == "/complete":
+                    coordinator.complete(
+                        request["id"],
+                        request.get("vector"),
+                        request.get("error_type"),
+                        request.get("error"),
+                        request.get("version", VECTOR_VERSION),
+                    )
+                    response = {}
+                else:
+                    self.send_error(404)
+                    return
+
+                body = json.dumps(response).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = _ThreadingHTTPServer((addr, port), Handler)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        host = addr or socket.gethostname()
+        self.url = "http://%s:%d" % (host, self._server.server_address[1])
+
+        return self.url
+
+    def shutdown(self):
+        """Stops serving the queue over HTTP. The jobs are kept."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def close(self):
+        """Stops serving the queue and closes the database."""
+        self.shutdown()
+        with self._lock:
+            self._db.close()
+
+
+class Worker(object):
+
+    """Takes jobs from a :class:`Coordinator`, runs them with 6S, and sends back the results.
+
+    Arguments:
+
+    * ``url`` -- The URL of the coordinator, as returned by :meth:`Coordinator.serve`
+    * ``sixs_path`` -- (Optional) The path to the 6S executable. If not given then it is found in the same way as
+      for :class:`.SixS`.
+    * ``n`` -- (Optional) The number of jobs to run at once. Defaults to 1.
+    * ``name`` -- (Optional) The name of the worker, recorded against the jobs it runs. Defaults to the host name
+      and a number.
+    * ``poll_interval`` -- (Optional) The time in seconds to wait before asking again when the queue is empty (or
+      the coordinator can't be reached). Defaults to 1 second.
+    * ``idle_timeout`` -- (Optional) Stop once there have been no jobs for this many seconds. By default the worker
+      runs until it is interrupted.
+    * ``token`` -- (Optional) The secret required by the coordinator, if it has one
+
+    """
+
+    def __init__(
+        self,
+        url,
+        sixs_path=None,
+        n=1,
+        name=None,
+        poll_interval=1.0,
+        idle_timeout=None,
+        token=None,
+    ):
+        self.url = url.rstrip("/")
+        self.sixs_path = SixS(sixs_path).sixs_path
+        if self.sixs_path is None:
+            raise ExecutionError("6S executable not found.")
+
+        self.n = n
+        self.name = name if name is not None else "%s-%d" % (socket.gethostname(), id(self))
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.token = token
+
+    def _request(self, path, data):
+        request = urllib.request.Request(
+            self.url + path,
+            data=json.dumps(data).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        if self.token is not None:
+            request.add_header("X-Py6S-Token", self.token)
+
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def run_job(self, job):
+        """Runs a single job (as returned by :meth:`Coordinator.claim`), and returns the result to send back to the
+        coordinator."""
+        s = SixS(self.sixs_path)
+        s.timeout = job["timeout"]
+        s.fulltext_policy = "drop"
+
+        hooks.emit("run_started", sixs=s)
+        try:
+            s._run(job["deck"])
+        except Exception as e:
+            if isinstance(e, Error):
+                hooks.emit("run_failed", sixs=s, error=e)
+            return {"id": job["id"], "error_type": type(e).__name__, "error": str(e)}
+
+        return {
+            "id": job["id"],
+            "vector": s.outputs.to_vector().tolist(),
+            "version": VECTOR_VERSION,
+        }
+
+    def _loop(self, thread_number):
+        name = "%s/%d" % (self.name, thread_number)
+        idle_since = time.time()
+
+        while True:
+            try:
+                jobs = self._request("/claim", {"worker": name, "count": 1})
+            except (urllib.error.URLError, OSError):
+                jobs = []
+
+            if not jobs:
+                if self.idle_timeout is not None and time.time() - idle_since > self.idle_timeout:
+                    return
+                time.sleep(self.poll_interval)
+                continue
+
+            for job in jobs:
+                result = self.run_job(job)
+                try:
+                    self._request("/complete", result)
+                except (urllib.error.URLError, OSError):
+                    # The job will be given to another worker once its lease expires
+                    pass
+
+            idle_since = time.time()
+
+    def run(self):
+        """Runs jobs until the worker is interrupted (or has been idle for ``idle_timeout`` seconds)."""
+        threads = [threading.Thread(target=self._loop, args=(i,)) for i in range(self.n)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1.0)
+
+
+def main(argv=None):
+    """Runs a coordinator or a worker from the command line. Run ``python -m Py6S.distributed --help`` for
+    details."""
+    parser = argparse.ArgumentParser(prog="python -m Py6S.distributed")
+    subparsers = parser.add_subparsers(dest="command")
+
+    coordinator_parser = subparsers.add_parser("coordinator", help="Serve a queue of jobs")
+    coordinator_parser.add_argument("database", help="The SQLite database to store the jobs in")
+    coordinator_parser.add_argument("--port", type=int, default=8765)
+    coordinator_parser.add_argument("--addr", default="")
+    coordinator_parser.add_argument("--lease-time", type=float, default=600.0)
+    coordinator_parser.add_argument("--token")
+
+    worker_parser = subparsers.add_parser("worker", help="Run jobs from a coordinator")
+    worker_parser.add_argument("url", help="The URL of the coordinator")
+    worker_parser.add_argument("-n", type=int, default=1, help="The number of jobs to run at once")
+    worker_parser.add_argument("--sixs-path", help="The path to the 6S executable")
+    worker_parser.add_argument("--name")
+    worker_parser.add_argument("--poll-interval", type=float, default=1.0)
+    worker_parser.add_argument("--idle-timeout", type=float)
+    worker_parser.add_argument("--token")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "coordinator":
+        coordinator = Coordinator(args.database, args.lease_time, args.token)
+        print("Serving jobs at %s" % coordinator.serve(args.port, args.addr))
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            coordinator.close()
+    elif args.command == "worker":
+        worker = Worker(
+            args.url,
+            args.sixs_path,
+            args.n,
+            args.name,
+            args.poll_interval,
+            args.idle_timeout,
+            args.token,
+        )
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            pass
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Emulators: compact statistical models of 6S, trained from a sweep of runs, which predict selected outputs for
+large batches of parameter values far more quickly than running 6S or interpolating in a lookup table.
+
+An :class:`Emulator` is a polynomial in the (scaled) parameters, fitted by ridge regression to the principal
+components of the (standardised) outputs. It only needs NumPy to evaluate, and is small enough to save in a few
+kilobytes. For example::
+
+  from Py6S.emulator import Emulator
+
+  emulator = Emulator.train(
+      s,
+      {"geometry.solar_z": (0, 70), "geometry.view_z": (0, 50), "aot550": (0.05, 1.0)},
+      n_samples=2000,
+      output_name=["pixel_radiance", "coef_xa", "coef_xb", "coef_xc"],
+      degree=4,
+  )
+  print(emulator.validation)
+  coefficients = emulator.predict({"geometry.solar_z": sza, "geometry.view_z": vza, "aot550": aot})
+
+The parameters are named as for the axes of a :class:`.LookupTable` (see :mod:`Py6S.lut`). Some of the runs are held
+out of the fitting, and the errors of the emulator on them are reported in the ``validation`` attribute - these
+should always be checked before using an emulator, and the ``degree`` or number of samples increased if they are too
+large. Emulators should not be used outside the ranges they were trained on.
+
+"""
+
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+
+from .batch import run_batch
+from .lut import _with_values
+from .sixs_exceptions import ParameterError
+
+# The version of the file format written by Emulator.save
+EMULATOR_VERSION = 1
+
+# The number of points to predict at once, which limits the memory used by Emulator.predict
+PREDICT_CHUNK_SIZE = 65536
+
+
+def _exponents(n_parameters, degree):
+    """Returns the exponents of each parameter in each term of a polynomial of the given degree, as a 2D array."""
+    exponents = []
+    for total in range(degree + 1):
+        for combination in itertools.combinations_with_replacement(range(n_parameters), total):
+            exponents.append(np.bincount(combination, minlength=n_parameters))
+
+    return np.array(exponents, dtype=np.int64).reshape(len(exponents), n_parameters)
+
+
+def _features(x, exponents):
+    """Evaluates each term of the polynomial for each row of ``x``."""
+    degree = int(exponents.max()) if exponents.size else 0
+    powers = [np.ones_like(x)]
+    for i in range(degree):
+        powers.append(powers[-1] * x)
+
+    features = np.ones((len(x), len(exponents)))
+    for j in range(x.shape[1]):
+        for k in range(1, degree + 1):
+            features[:, exponents[:, j] == k] *= powers[k][:, j : j + 1]
+
+    return features
+
+
+def _scale_points(points, ranges):
+    """Scales the points so that the range of each parameter is -1 to 1."""
+    width = ranges[:, 1] - ranges[:, 0]
+    width[width == 0] = 1.0
+    return 2 * (points - ranges[:, 0]) / width - 1
+
+
+def latin_hypercube(ranges, n_samples, seed=None):
+    """Returns a Latin hypercube sample of parameter values, as a 2D array with a row for each sample.
+
+    Arguments:
+
+    * ``ranges`` -- A list of ``(low, high)`` tuples giving the range of each parameter
+    * ``n_samples`` -- The number of samples
+    * ``seed`` -- (Optional) The seed for the random number generator
+
+    """
+    rng = np.random.RandomState(seed)
+    samples = np.empty((n_samples, len(ranges)))
+    for j, (low, high) in enumerate(ranges):
+        strata = (rng.permutation(n_samples) + rng.random_sample(n_samples)) / n_samples
+        samples[:, j] = low + strata * (high - low)
+
+    return samples
+
+
+class Emulator(object):
+
+    """A polynomial emulator of selected 6S outputs.
+
+    Attributes:
+
+    * ``parameters`` -- The names of the parameters, in the order of the columns of the points given to
+      :meth:`predict`
+    * ``outputs`` -- The names of the outputs, in the order of the columns returned by :meth:`predict`
+    * ``ranges`` -- An array of the ``(low, high)`` range of each parameter in the training data
+    * ``degree`` -- The degree of the polynomial
+    * ``validation`` -- An ordered dictionary giving, for each output, a dictionary of the ``rmse``, ``max_error``
+      and ``max_relative_error`` of the emulator on the held-out runs (or None if none were held out)
+
+    Most users will create emulators with :meth:`train`, :meth:`fit` or :meth:`load` rather than directly.
+
+    """
+
+    def __init__(
+        self,
+        parameters,
+        outputs,
+        ranges,
+        degree,
+        y_mean,
+        y_scale,
+        components,
+        coefficients,
+        validation=None,
+    ):
+        self.parameters = list(parameters)
+        self.outputs = list(outputs)
+        self.ranges = np.asarray(ranges, dtype=float)
+        self.degree = int(degree)
+        self.y_mean = np.asarray(y_mean, dtype=float)
+        self.y_scale = np.asarray(y_scale, dtype=float)
+        self.components = np.asarray(components, dtype=float)
+        self.coefficients = np.asarray(coefficients, dtype=float)
+        self.validation = validation
+
+        self._exponents = _exponents(len(self.parameters), self.degree)
+
+        # The outputs are predicted by a single matrix multiplication from the polynomial terms, combining the
+        # regression coefficients, the principal components and the standardisation
+        self._weights = np.dot(self.coefficients, self.components) * self.y_scale
+
+    @classmethod
+    def fit(
+        cls,
+        points,
+        values,
+        parameters,
+        outputs,
+        degree=3,
+        n_components=None,
+        ridge=1e-8,
+        holdout=0.2,
+        seed=None,
+    ):
+        """Fits an emulator to a set of runs.
+
+        Arguments:
+
+        * ``points`` -- A 2D array of the parameter values of each run, with a row for each run
+        * ``values`` -- A 2D array of the outputs of each run, with a row for each run. Runs with any NaN values
+          are ignored.
+        * ``parameters`` -- The names of the parameters (the columns of ``points``)
+        * ``outputs`` -- The names of the outputs (the columns of ``values``)
+        * ``degree`` -- (Optional) The degree of the polynomial. Defaults to 3.
+        * ``n_components`` -- (Optional) The number of principal components of the outputs to fit. By default all of
+          them are used, so the only error is in the polynomial fit.
+        * ``ridge`` -- (Optional) The ridge regularisation parameter, which stops high degree polynomials from
+          oscillating wildly when there are few runs. The constant term isn't penalised. Defaults to ``1e-8``.
+        * ``holdout`` -- (Optional) The fraction of the runs to hold out of the fitting, to measure the errors of
+          the emulator with. Defaults to 0.2.
+        * ``seed`` -- (Optional) The seed for the random number generator used to choose the held-out runs
+
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        values = np.asarray(values, dtype=float).reshape(len(points), -1)
+        parameters = list(parameters)
+        outputs = list(outputs)
+
+        if points.shape[1] != len(parameters):
+            raise ParameterError("points", "Must have a column for each of the parameters")
+        if values.shape[1] != len(outputs):
+            raise ParameterError("values", "Must have a column for each of the outputs")
+        if not 0 <= holdout < 1:
+            raise ParameterError("holdout", "Must be at least 0 and less than 1")
+
+        usable = np.all(np.isfinite(points), axis=1) & np.all(np.isfinite(values), axis=1)
+        points = points[usable]
+        values = values[usable]
+
+        order = np.random.RandomState(seed).permutation(len(points))
+        n_test = int(round(holdout * len(points)))
+        test, train = order[:n_test], order[n_test:]
+
+        exponents = _exponents(len(parameters), degree)
+        if len(train) < len(exponents):
+            raise ParameterError(
+                "points",
+                "At least %d runs are needed to fit a polynomial of degree %d (excluding held-out runs)"
+                % (len(exponents), degree),
+            )
+
+        ranges = np.stack([points[train].min(axis=0), points[train].max(axis=0)], axis=1)
+
+        y_mean = values[train].mean(axis=0)
+        y_scale = values[train].std(axis=0)
+        y_scale[y_scale == 0] = 1.0
+        standardised = (values[train] - y_mean) / y_scale
+
+        components = np.linalg.svd(standardised, full_matrices=False)[2]
+        if n_components is not None:
+            components = components[:n_components]
+        scores = np.dot(standardised, components.T)
+
+        x = _scale_points(points[train], ranges)
+        features = _features(x, exponents)
+        n_features = features.shape[1]
+        # The constant term is the first feature, and isn't penalised so that the mean isn't biased
+        penalty = np.sqrt(ridge) * np.eye(n_features)
+        penalty[0, 0] = 0.0
+        a = np.vstack([features, penalty])
+        b = np.vstack([scores, np.zeros((n_features, scores.shape[1]))])
+        coefficients = np.linalg.lstsq(a, b, rcond=None)[0]
+
+        emulator = cls(
+            parameters, outputs, ranges, degree, y_mean, y_scale, components, coefficients
+        )
+
+        if n_test > 0:
+            error = emulator.predict(points[test]) - values[test]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                relative = np.abs(error) / np.abs(values[test])
+            emulator.validation = OrderedDict(
+                (
+                    name,
+                    {
+                        "rmse": float(np.sqrt(np.mean(error[:, i] ** 2))),
+                        "max_error": float(np.max(np.abs(error[:, i]))),
+                        "max_relative_error": float(np.nanmax(relative[:, i])),
+                    },
+                )
+                for i, name in enumerate(outputs)
+            )
+
+        return emulator
+
+    @classmethod
+    def train(
+        cls,
+        sixs,
+        ranges,
+        n_samples,
+        output_name,
+        degree=3,
+        n_components=None,
+        ridge=1e-8,
+        holdout=0.2,
+        seed=None,
+        **kwargs
+    ):
+        """Trains an emulator by running 6S for a Latin hypercube sample of parameter values.
+
+        Arguments:
+
+        * ``sixs`` -- The base :class:`.SixS` instance, from which all other parameters are taken
+        * ``ranges`` -- A dictionary of the ``(low, high)`` range of each parameter to vary, named as for the axes of
+          a :class:`.LookupTable`. An :class:`~collections.OrderedDict` should be used to control the order of the
+          parameters.
+        * ``n_samples`` -- The number of runs of 6S (including those held out)
+        * ``output_name`` -- The output, or list of outputs, to emulate, in the form accepted by
+          :func:`Py6S.batch.run_batch`
+
+        The ``degree``, ``n_components``, ``ridge``, ``holdout`` and ``seed`` arguments are as for :meth:`fit`, and
+        any other keyword arguments (such as ``n``, ``progress`` or ``backend``) are passed to
+        :func:`Py6S.batch.run_batch`. Runs which fail are left out.
+
+        """
+        names = list(ranges.keys())
+        outputs = [output_name] if isinstance(output_name, str) else list(output_name)
+
+        points = latin_hypercube([ranges[name] for name in names], n_samples, seed)
+        runs = [_with_values(sixs, dict(zip(names, point))) for point in points]
+
+        kwargs.setdefault("on_error", "mask")
+        kwargs.setdefault("keep_outputs", False)
+        values = run_batch(runs, output_name=outputs, **kwargs)
+        values = np.ma.asarray(values, dtype=float).filled(np.nan).reshape(len(runs), len(outputs))
+
+        return cls.fit(points, values, names, outputs, degree, n_components, ridge, holdout, seed)
+
+    def predict(self, points):
+        """Predicts the outputs at many points.
+
+        Arguments:
+
+        * ``points`` -- The points, as a 2D array with a row for each point and a column for each parameter (in the
+          order of ``parameters``), or as a dictionary of arrays of the values of each parameter
+
+        Return value:
+
+        A 2D array with a row for each point and a column for each output.
+
+        """
+        if isinstance(points, dict):
+            missing = [name for name in self.parameters if name not in points]
+            if missing:
+                raise ParameterError("points", "Missing values for: %s" % ", ".join(missing))
+            points = np.stack(
+                [np.atleast_1d(np.asarray(points[name], dtype=float)) for name in self.parameters],
+                axis=-1,
+            )
+
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        if points.shape[1] != len(self.parameters):
+            raise ParameterError("points", "Each point must have %d values" % len(self.parameters))
+
+        result = np.empty((len(points), len(self.outputs)))
+        for start in range(0, len(points), PREDICT_CHUNK_SIZE):
+            x = _scale_points(points[start : start + PREDICT_CHUNK_SIZE], self.ranges)
+            result[start : start + PREDICT_CHUNK_SIZE] = (
+                np.dot(_features(x, self._exponents), self._weights) + self.y_mean
+            )
+
+        return result
+
+    def save(self, filename):
+        """Saves the emulator to a NumPy ``.npz`` file, which can be read with :meth:`load`."""
+        validation = np.full((len(self.outputs), 3), np.nan)
+        if self.validation is not None:
+            for i, name in enumerate(self.outputs):
+                errors = self.validation[name]
+                validation[i] = (errors["rmse"], errors["max_error"], errors["max_relative_error"])
+
+        np.savez(
+            filename,
+            emulator_version=EMULATOR_VERSION,
+            parameters=np.array(self.parameters),
+            outputs=np.array(self.outputs),
+            ranges=self.ranges,
+            degree=self.degree,
+            y_mean=self.y_mean,
+            y_scale=self.y_scale,
+            components=self.components,
+            coefficients=self.coefficients,
+            validation=validation,
+        )
+
+    @classmethod
+    def load(cls, filename):
+        """Loads an emulator saved by :meth:`save`."""
+        with np.load(filename) as data:
+            if int(data["emulator_version"]) != EMULATOR_VERSION:
+                raise ParameterError(
+                    "filename", "Unsupported emulator version %s" % data["emulator_version"]
+                )
+
+            outputs = [str(name) for name in data["outputs"]]
+            validation = None
+            if not np.all(np.isnan(data["validation"])):
+                validation = OrderedDict(
+                    (name, dict(zip(("rmse", "max_error", "max_relative_error"), row.tolist())))
+                    for name, row in zip(outputs, data["validation"])
+                )
+
+            return cls(
+                [str(name) for name in data["parameters"]],
+                outputs,
+                data["ranges"],
+                int(data["degree"]),
+                data["y_mean"],
+                data["y_scale"],
+                data["components"],
+                data["coefficients"],
+                validation,
+            )
@@ -0,0 +1,94 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A global registry of callbacks which are notified about events that happen while running 6S.
+
+A hook is any callable taking two arguments: the name of the event and a dictionary of information
+about it. For example, to print the timings of every 6S run::
+
+  from Py6S import hooks
+
+  def print_timings(event, info):
+      if event == "run_timings":
+          print(info["timings"])
+
+  hooks.add_hook(print_timings)
+
+Events currently emitted are:
+
+* ``run_started`` -- Emitted at the start of every :meth:`.SixS.run`. The ``info`` dictionary contains ``sixs`` (the
+  :class:`.SixS` instance being run).
+* ``run_timings`` -- Emitted at the end of every successful :meth:`.SixS.run`. The ``info`` dictionary contains
+  ``timings`` (the same dictionary as :attr:`.Outputs.timings`), ``sixs`` (the :class:`.SixS` instance that was run)
+  and ``input_file`` (the text of the input file that 6S was run with). Runs of a ready-made input file, such as
+  those of :class:`.distributed.Worker`, don't have their parameters set in ``sixs``, so ``input_file`` should be
+  used to tell which run it was.
+  Runs which shared the outputs of an identical run that was already in progress (see the ``single_flight``
+  attribute of :class:`.SixS`), rather than running 6S themselves, also have ``shared`` set to True, and their
+  ``timings`` are those of the run they shared.
+* ``run_failed`` -- Emitted when :meth:`.SixS.run` raises an error. The ``info`` dictionary contains ``sixs`` and
+  ``error`` (the exception that was raised).
+* ``run_approximated`` -- Emitted at the end of a :meth:`.SixS.run` whose outputs were approximated from a lookup
+  table (see :mod:`Py6S.lut`), rather than running 6S. The ``info`` dictionary contains ``sixs``.
+* ``queue_depth`` -- Emitted by :func:`Py6S.batch.run_batch` as simulations are started. The ``info`` dictionary
+  contains ``depth`` (the number of simulations in the batch that have not yet been started).
+* ``cache_hit`` and ``cache_miss`` -- Emitted by :meth:`.SixS.run` when it looks for the outputs of an equivalent run
+  in its ``cache`` (see :mod:`Py6S.cache`), depending on whether they were found. The ``info`` dictionary contains
+  ``sixs`` and ``key`` (the key that was looked up).
+
+Hooks are called synchronously, in the thread which emitted the event. Any exception raised by a hook is turned into a
+warning, so that a faulty hook can't make a successful run fail.
+
+"""
+
+import threading
+import warnings
+
+_hooks = []
+_lock = threading.Lock()
+
+
+def add_hook(func):
+    """Registers a callable to be called for every event. It will be called as ``func(event, info)``."""
+    with _lock:
+        if func not in _hooks:
+            _hooks.append(func)
+
+
+def remove_hook(func):
+    """Removes a callable previously registered with :func:`add_hook`. Does nothing if it isn't registered."""
+    with _lock:
+        if func in _hooks:
+            _hooks.remove(func)
+
+
+def clear_hooks():
+    """Removes all registered hooks."""
+    with _lock:
+        del _hooks[:]
+
+
+def emit(event, **info):
+    """Calls every registered hook with the given event name and keyword arguments (as a dictionary)."""
+    with _lock:
+        current = list(_hooks)
+
+    for func in current:
+        try:
+            func(event, info)
+        except Exception as e:
+            warnings.warn("Hook %r raised an error for the %s event: %r" % (func, event, e))
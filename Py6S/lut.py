@@ -0,0 +1,574 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Lookup tables of 6S outputs over a grid of parameter values, which can be interpolated to approximate the outputs
+of runs much more quickly than running 6S.
+
+A :class:`LookupTable` is built by running 6S for every combination of the values along each of its axes, with all
+of the other parameters taken from a base :class:`.SixS` instance. For example::
+
+  from Py6S.lut import LookupTable
+
+  lut = LookupTable.build(
+      s,
+      {"geometry.solar_z": np.arange(0, 80, 5), "aot550": [0.05, 0.1, 0.2, 0.4, 0.8], "wavelength": wavelengths},
+      progress="bar",
+  )
+  lut.save("lut.npz")
+
+Each axis is named by a dotted attribute path of the :class:`.SixS` instance, or is ``"wavelength"`` for the centre of
+a single wavelength (as set by ``s.wavelength = Wavelength(value)``). The table can then be used to approximate the
+outputs of any run which has the same parameters as the base instance apart from those on the axes::
+
+  s.run(approx=LookupTable.load("lut.npz"), tol=0.01)
+  print(s.outputs.pixel_radiance)
+
+This uses the lookup table if the run falls inside its grid and the estimated relative error of the interpolated
+outputs is below ``tol``, and runs 6S otherwise. The outputs are interpolated multilinearly, and the error is
+estimated from the curvature of the outputs along each axis (found from the neighbouring grid points), so is only an
+estimate. Grids need at least three values along an axis for the error along it to be estimated.
+
+Large tables can be stored at a reduced precision, as 16-bit floats or as integers scaled to the range of each
+output, checking that the error this causes is acceptable::
+
+  lut.save("lut.npz", precision="uint16", max_error=1e-4)
+
+The largest error of each output is recorded in the file, and is added to the estimated errors of the interpolation.
+The values are kept at that precision when the table is loaded, and are converted back as they are interpolated.
+
+"""
+
+import copy
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+
+from .batch import run_batch
+from .outputs import VECTOR_FIELDS, Outputs
+from .Params import Wavelength
+from .sixs_exceptions import ParameterError
+
+# The version of the file format written by LookupTable.save, and the versions which can be read
+LUT_VERSION = 2
+_READABLE_VERSIONS = (1, 2)
+
+# The types which the values of a table can be stored as (see LookupTable.quantise)
+PRECISIONS = ("float64", "float32", "float16", "uint16", "uint8")
+
+
+def _get_value(sixs, name):
+    """Returns the value of an axis for a :class:`.SixS` instance, or NaN if it doesn't have one."""
+    try:
+        if name == "wavelength":
+            if sixs.wavelength[1] != sixs.wavelength[2]:
+                return np.nan
+            return float(sixs.wavelength[1])
+
+        value = sixs
+        for part in name.split("."):
+            value = getattr(value, part)
+        return float(value)
+    except (AttributeError, IndexError, TypeError, ValueError):
+        return np.nan
+
+
+def _with_values(sixs, values):
+    """Returns a copy of a :class:`.SixS` instance with the axes set to the given values (a dictionary). Only the
+    objects which need to be changed are copied."""
+    s = copy.copy(sixs)
+    s.outputs = None
+
+    for name, value in values.items():
+        if name == "wavelength":
+            s.wavelength = Wavelength(value)
+            continue
+
+        parts = name.split(".")
+        obj = s
+        for part in parts[:-1]:
+            child = copy.copy(getattr(obj, part))
+            setattr(obj, part, child)
+            obj = child
+        setattr(obj, parts[-1], value)
+
+    return s
+
+
+class LookupTable(object):
+
+    """A lookup table of 6S outputs over a grid of parameter values.
+
+    Arguments:
+
+    * ``axes`` -- An ordered dictionary of the values along each axis of the grid, keyed by the name of the axis (see
+      the module documentation). The values along each axis must be increasing.
+    * ``values`` -- An array of the outputs at each point of the grid, with one dimension for each axis and a last
+      dimension for the outputs
+    * ``fields`` -- The names of the outputs, which must be in :data:`Py6S.outputs.VECTOR_FIELDS`
+    * ``base_input`` -- (Optional) The 6S input file of the base :class:`.SixS` instance with each axis set to its
+      first value, used to check whether a run can be approximated by the table
+    * ``offsets`` and ``scales`` -- (Optional) For tables whose values are stored as scaled integers, the offset and
+      scale of each output, such that the value is ``offset + scale * integer``. The largest integer of the type
+      represents NaN.
+    * ``quantisation_error`` -- (Optional) The largest error of each output caused by storing the values at reduced
+      precision, which is added to the estimated errors of the interpolation
+
+    Most users will create lookup tables with :meth:`build`, :meth:`load` or :meth:`quantise` rather than directly.
+
+    """
+
+    def __init__(
+        self,
+        axes,
+        values,
+        fields,
+        base_input=None,
+        offsets=None,
+        scales=None,
+        quantisation_error=None,
+    ):
+        self.axes = OrderedDict(
+            (name, np.asarray(grid, dtype=float)) for name, grid in axes.items()
+        )
+        self.values = np.asarray(values)
+        self.fields = list(fields)
+        self.base_input = base_input
+        self.offsets = None if offsets is None else np.asarray(offsets, dtype=float)
+        self.scales = None if scales is None else np.asarray(scales, dtype=float)
+        self.quantisation_error = (
+            None if quantisation_error is None else np.asarray(quantisation_error, dtype=float)
+        )
+
+        if np.issubdtype(self.values.dtype, np.integer) and (offsets is None or scales is None):
+            raise ParameterError(
+                "values", "The offsets and scales must be given for values stored as integers"
+            )
+
+        for name, grid in self.axes.items():
+            if grid.ndim != 1 or len(grid) < 2 or np.any(np.diff(grid) <= 0):
+                raise ParameterError(
+                    "axes",
+                    "The values along %s must be increasing, with at least two of them" % name,
+                )
+
+        for field in self.fields:
+            if field not in VECTOR_FIELDS:
+                raise ParameterError(
+                    "fields", "%s is not one of the numerical outputs in VECTOR_FIELDS" % field
+                )
+
+        shape = tuple(len(grid) for grid in self.axes.values()) + (len(self.fields),)
+        if self.values.shape != shape:
+            raise ParameterError(
+                "values", "Must have shape %s, not %s" % (shape, self.values.shape)
+            )
+
+        self._grids = list(self.axes.values())
+        self._field_index = dict((field, i) for i, field in enumerate(self.fields))
+
+    @classmethod
+    def build(cls, sixs, axes, output_name=None, **kwargs):
+        """Builds a lookup table by running 6S for every point of a grid.
+
+        Arguments:
+
+        * ``sixs`` -- The base :class:`.SixS` instance, from which all parameters other than the axes are taken
+        * ``axes`` -- A dictionary of the values along each axis (see the module documentation). An
+          :class:`~collections.OrderedDict` should be used to control the order of the axes.
+        * ``output_name`` -- (Optional) A list of the outputs to store, which must be in
+          :data:`Py6S.outputs.VECTOR_FIELDS`. By default all of them are stored, so that complete :class:`.Outputs`
+          can be approximated.
+
+        Any other keyword arguments (such as ``n``, ``progress`` or ``backend``) are passed to
+        :func:`Py6S.batch.run_batch`. Runs which fail are stored as NaN.
+
+        """
+        if output_name is None:
+            fields = list(VECTOR_FIELDS)
+        elif isinstance(output_name, str):
+            fields = [output_name]
+        else:
+            fields = list(output_name)
+
+        for field in fields:
+            if field not in VECTOR_FIELDS:
+                raise ParameterError(
+                    "output_name", "%s is not one of the numerical outputs in VECTOR_FIELDS" % field
+                )
+
+        axes = OrderedDict((name, np.asarray(grid, dtype=float)) for name, grid in axes.items())
+        names = list(axes.keys())
+
+        runs = [
+            _with_values(sixs, dict(zip(names, point)))
+            for point in itertools.product(*axes.values())
+        ]
+
+        kwargs.setdefault("on_error", "mask")
+        kwargs.setdefault("keep_outputs", False)
+        results = run_batch(runs, output_name=fields, **kwargs)
+        results = np.ma.asarray(results, dtype=float).filled(np.nan)
+
+        shape = tuple(len(grid) for grid in axes.values()) + (len(fields),)
+        base = _with_values(sixs, dict((name, grid[0]) for name, grid in axes.items()))
+
+        return cls(axes, results.reshape(shape), fields, base.generate_input_file())
+
+    def __len__(self):
+        return int(np.prod(self.values.shape[:-1]))
+
+    def _points(self, points):
+        if isinstance(points, dict):
+            missing = [name for name in self.axes if name not in points]
+            if missing:
+                raise ParameterError("points", "Missing values for: %s" % ", ".join(missing))
+            points = np.stack(
+                [np.atleast_1d(np.asarray(points[name], dtype=float)) for name in self.axes],
+                axis=-1,
+            )
+
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        if points.shape[-1] != len(self.axes):
+            raise ParameterError("points", "Each point must have %d values" % len(self.axes))
+
+        return points
+
+    def contains(self, points):
+        """Returns a boolean array of whether each point is inside the grid."""
+        points = self._points(points)
+        inside = np.ones(len(points), dtype=bool)
+        for a, grid in enumerate(self._grids):
+            inside &= (points[:, a] >= grid[0]) & (points[:, a] <= grid[-1])
+
+        return inside
+
+    def _locate(self, points):
+        """Returns the indices of the lower corner of the grid cell containing each point, and the fractional
+        position of each point within its cell along each axis."""
+        indices = np.empty(points.shape, dtype=np.intp)
+        fractions = np.empty(points.shape)
+        for a, grid in enumerate(self._grids):
+            i = np.clip(np.searchsorted(grid, points[:, a], side="right") - 1, 0, len(grid) - 2)
+            indices[:, a] = i
+            fractions[:, a] = (points[:, a] - grid[i]) / (grid[i + 1] - grid[i])
+
+        return indices, fractions
+
+    def _decode(self, values, columns):
+        """Converts stored values of the given outputs to floats."""
+        if self.scales is None:
+            return values.astype(float)
+
+        decoded = values * self.scales[columns] + self.offsets[columns]
+        decoded[values == np.iinfo(self.values.dtype).max] = np.nan
+        return decoded
+
+    def _interpolate(self, indices, fractions, columns, fixed_axis=None, fixed_index=None):
+        """Interpolates multilinearly between the corners of the grid cells, optionally with one axis fixed at the
+        given grid indices rather than interpolated along."""
+        axes = [a for a in range(len(self._grids)) if a != fixed_axis]
+        result = np.zeros((len(indices), len(columns)))
+
+        for corner in itertools.product((0, 1), repeat=len(axes)):
+            weight = np.ones(len(indices))
+            index = [None] * len(self._grids)
+            for a, c in zip(axes, corner):
+                index[a] = indices[:, a] + c
+                weight = weight * (fractions[:, a] if c else 1 - fractions[:, a])
+            if fixed_axis is not None:
+                index[fixed_axis] = fixed_index
+
+            corner_values = self._decode(self.values[tuple(index)][:, columns], columns)
+            # Corners with no weight are skipped, so that NaNs in them don't spread
+            result += np.where(weight[:, np.newaxis] > 0, weight[:, np.newaxis] * corner_values, 0)
+
+        return result
+
+    def _error(self, indices, fractions, columns):
+        """Estimates the error of the multilinear interpolation, from the curvature along each axis."""
+        error = np.zeros((len(indices), len(columns)))
+
+        for a, grid in enumerate(self._grids):
+            t = fractions[:, a][:, np.newaxis]
+            on_grid = (t == 0) | (t == 1)
+
+            if len(grid) < 3:
+                error += np.where(on_grid, 0, np.inf)
+                continue
+
+            i = indices[:, a]
+            curvature = np.zeros((len(indices), len(columns)))
+            for node in (i, i + 1):
+                m = np.clip(node, 1, len(grid) - 2)
+                f = [self._interpolate(indices, fractions, columns, a, m + k) for k in (-1, 0, 1)]
+                h1 = (grid[m] - grid[m - 1])[:, np.newaxis]
+                h2 = (grid[m + 1] - grid[m])[:, np.newaxis]
+                second = 2 * (h1 * f[2] - (h1 + h2) * f[1] + h2 * f[0]) / (h1 * h2 * (h1 + h2))
+                curvature = np.fmax(curvature, np.abs(second))
+
+            h = (grid[i + 1] - grid[i])[:, np.newaxis]
+            error += np.where(on_grid, 0, t * (1 - t) / 2 * h**2 * curvature)
+
+        if self.quantisation_error is not None:
+            error += self.quantisation_error[columns]
+
+        return error
+
+    def interpolate(self, points, output_name=None, return_error=False):
+        """Interpolates the outputs at many points.
+
+        Arguments:
+
+        * ``points`` -- The points, as a 2D array with a row for each point and a column for each axis (in the order
+          of ``axes``), or as a dictionary of arrays of the values along each axis
+        * ``output_name`` -- (Optional) The output, or list of outputs, to return. By default all of the outputs in
+          the table are returned.
+        * ``return_error`` -- (Optional) Whether to also return the estimated absolute error of each value
+
+        Return value:
+
+        An array with a value for each point (or, if ``output_name`` is a list or not given, a 2D array with a column
+        for each output), or a tuple of that and an array of the same shape of the estimated errors. Points outside
+        the grid are NaN.
+
+        """
+        points = self._points(points)
+
+        if output_name is None:
+            names = self.fields
+        elif isinstance(output_name, str):
+            names = [output_name]
+        else:
+            names = list(output_name)
+
+        try:
+            columns = [self._field_index[name] for name in names]
+        except KeyError as e:
+            raise ParameterError("output_name", "%s is not stored in the lookup table" % e.args[0])
+
+        indices, fractions = self._locate(points)
+        result = self._interpolate(indices, fractions, columns)
+        outside = ~self.contains(points)
+        result[outside] = np.nan
+
+        if return_error:
+            error = self._error(indices, fractions, columns)
+            error[outside] = np.nan
+
+        if isinstance(output_name, str):
+            result = result[:, 0]
+            if return_error:
+                error = error[:, 0]
+
+        if return_error:
+            return result, error
+        return result
+
+    def covers(self, sixs):
+        """Returns whether a :class:`.SixS` instance has the same parameters as the base instance of the table, apart
+        from the axes, and whether its values on the axes are inside the grid."""
+        point = np.array([_get_value(sixs, name) for name in self.axes])
+        if not np.all(np.isfinite(point)) or not self.contains(point)[0]:
+            return False
+
+        if self.base_input is None:
+            return True
+
+        base = _with_values(sixs, dict((name, grid[0]) for name, grid in self.axes.items()))
+        return base.generate_input_file() == self.base_input
+
+    def approximate(self, sixs, tol=None):
+        """Approximates the :class:`.Outputs` of a run by interpolating in the table.
+
+        Arguments:
+
+        * ``sixs`` -- The :class:`.SixS` instance to approximate the outputs of
+        * ``tol`` -- (Optional) The largest acceptable estimated relative error. This can be a single value applying
+          to all of the outputs in the table, or a dictionary giving the tolerance for particular outputs (in which
+          case only those outputs are checked). By default the error is not checked.
+
+        Return value:
+
+        The approximated :class:`.Outputs` (without the ``fulltext``), or None if the run isn't covered by the table
+        (see :meth:`covers`) or the estimated error is too large. Outputs which aren't stored in the table are not
+        set.
+
+        """
+        if not self.covers(sixs):
+            return None
+
+        point = np.array([[_get_value(sixs, name) for name in self.axes]])
+        indices, fractions = self._locate(point)
+        columns = list(range(len(self.fields)))
+        values = self._interpolate(indices, fractions, columns)[0]
+
+        if tol is not None:
+            if isinstance(tol, dict):
+                try:
+                    checked = [(self._field_index[name], limit) for name, limit in tol.items()]
+                except KeyError as e:
+                    raise ParameterError("tol", "%s is not stored in the lookup table" % e.args[0])
+            else:
+                checked = [(i, tol) for i in columns]
+
+            error = self._error(indices, fractions, columns)[0]
+            for i, limit in checked:
+                if np.isnan(values[i]):
+                    continue
+                if error[i] > limit * abs(values[i]):
+                    return None
+
+        vector = np.full(len(VECTOR_FIELDS), np.nan)
+        for field, value in zip(self.fields, values):
+            vector[VECTOR_FIELDS.index(field)] = value
+
+        return Outputs.from_vector(vector)
+
+    def quantise(self, precision, max_error=None):
+        """Returns a copy of the table with its values stored at a reduced precision, to save memory and disk space.
+
+        Arguments:
+
+        * ``precision`` -- The type to store the values as: ``"float32"`` or ``"float16"``, or ``"uint16"`` or
+          ``"uint8"`` to store each output as integers scaled to cover its range of values (which is usually more
+          accurate than ``"float16"`` for the same size). ``"float64"`` stores them at full precision.
+        * ``max_error`` -- (Optional) The largest acceptable error of each output, relative to the largest magnitude
+          of that output in the table, either as a single value or as a dictionary giving it for particular outputs.
+          A :class:`.ParameterError` is raised if the error would be any larger.
+
+        The largest error of each output is stored in the ``quantisation_error`` attribute of the new table, and is
+        included in the errors it estimates for interpolated values.
+
+        """
+        if precision not in PRECISIONS:
+            raise ParameterError("precision", "Must be one of: %s" % ", ".join(PRECISIONS))
+
+        columns = list(range(len(self.fields)))
+        values = self._decode(self.values, columns)
+        offsets = scales = None
+
+        if precision.startswith("float"):
+            with np.errstate(over="ignore"):
+                stored = values.astype(precision)
+            decoded = stored.astype(float)
+        else:
+            dtype = np.dtype(precision)
+            # The largest integer is kept for NaN
+            levels = np.iinfo(dtype).max - 1
+
+            flat = values.reshape(-1, len(self.fields))
+            finite = np.isfinite(flat)
+            low = np.array([np.min(c[f]) if f.any() else 0.0 for c, f in zip(flat.T, finite.T)])
+            high = np.array([np.max(c[f]) if f.any() else 0.0 for c, f in zip(flat.T, finite.T)])
+            offsets = low
+            scales = np.where(high > low, (high - low) / levels, 1.0)
+
+            with np.errstate(invalid="ignore"):
+                integers = np.clip(np.round((values - offsets) / scales), 0, levels)
+            stored = np.where(np.isfinite(values), integers, levels + 1).astype(dtype)
+            decoded = stored * scales + offsets
+            decoded[stored == levels + 1] = np.nan
+
+        # NaNs must stay NaNs (and only NaNs), so they count as infinite errors otherwise
+        difference = np.where(
+            np.isnan(values) == np.isnan(decoded), np.abs(decoded - values), np.inf
+        )
+        difference[np.isnan(values) & np.isnan(decoded)] = 0
+        error = np.max(difference.reshape(-1, len(self.fields)), axis=0)
+        if self.quantisation_error is not None:
+            error = error + self.quantisation_error
+
+        if max_error is not None:
+            if isinstance(max_error, dict):
+                try:
+                    limits = [(self._field_index[name], limit) for name, limit in max_error.items()]
+                except KeyError as e:
+                    raise ParameterError(
+                        "max_error", "%s is not stored in the lookup table" % e.args[0]
+                    )
+            else:
+                limits = [(i, max_error) for i in columns]
+
+            magnitude = np.nanmax(np.abs(values.reshape(-1, len(self.fields))), axis=0)
+            failed = [
+                "%s (%g)" % (self.fields[i], error[i] / magnitude[i] if magnitude[i] else error[i])
+                for i, limit in limits
+                if error[i] > limit * np.nan_to_num(magnitude[i])
+            ]
+            if failed:
+                raise ParameterError(
+                    "max_error",
+                    "Storing the values as %s would give errors which are too large for: %s"
+                    % (precision, ", ".join(failed)),
+                )
+
+        return LookupTable(
+            self.axes,
+            stored,
+            self.fields,
+            self.base_input,
+            offsets,
+            scales,
+            error if precision != "float64" or self.quantisation_error is not None else None,
+        )
+
+    def save(self, filename, precision=None, max_error=None):
+        """Saves the table to a compressed NumPy ``.npz`` file, which can be read with :meth:`load`.
+
+        If ``precision`` is given then the values are stored at that precision, checking that the errors are no
+        larger than ``max_error``, as for :meth:`quantise`. Otherwise they are saved as they are."""
+        table = self if precision is None else self.quantise(precision, max_error)
+
+        arrays = dict(("axis_%d" % a, grid) for a, grid in enumerate(self._grids))
+        if table.scales is not None:
+            arrays.update(offsets=table.offsets, scales=table.scales)
+        if table.quantisation_error is not None:
+            arrays["quantisation_error"] = table.quantisation_error
+
+        np.savez_compressed(
+            filename,
+            lut_version=LUT_VERSION,
+            axis_names=np.array(list(self.axes.keys())),
+            fields=np.array(self.fields),
+            base_input=np.array("" if self.base_input is None else self.base_input),
+            values=table.values,
+            **arrays
+        )
+
+    @classmethod
+    def load(cls, filename):
+        """Loads a table saved by :meth:`save`. Tables saved at a reduced precision are kept at that precision in
+        memory, and their values are converted back as they are interpolated."""
+        with np.load(filename) as data:
+            if int(data["lut_version"]) not in _READABLE_VERSIONS:
+                raise ParameterError(
+                    "filename", "Unsupported lookup table version %s" % data["lut_version"]
+                )
+
+            names = [str(name) for name in data["axis_names"]]
+            axes = OrderedDict((name, data["axis_%d" % a]) for a, name in enumerate(names))
+            base_input = str(data["base_input"]) or None
+
+            optional = dict(
+                (name, data[name] if name in data.files else None)
+                for name in ("offsets", "scales", "quantisation_error")
+            )
+
+            return cls(
+                axes, data["values"], [str(f) for f in data["fields"]], base_input, **optional
+            )
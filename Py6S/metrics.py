@@ -0,0 +1,375 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Metrics about 6S runs, in a form which can be collected by Prometheus.
+
+The metrics are collected by a hook registered with :mod:`Py6S.hooks`, so they cover every run - whether it is
+performed directly with :meth:`.SixS.run` or by one of the helper functions. To start collecting them::
+
+  from Py6S import metrics
+  metrics.enable()
+
+The metrics can then be written to a file in the Prometheus text format, for use with the textfile collector of
+the Prometheus node exporter::
+
+  metrics.REGISTRY.write_textfile("/var/lib/node_exporter/textfile/py6s.prom")
+
+or served over HTTP on a ``/metrics`` endpoint, for Prometheus to scrape directly::
+
+  server = metrics.REGISTRY.serve(9106)
+
+"""
+
+import math
+import os
+import socketserver
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from . import hooks
+from .sixs_exceptions import ParameterError
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+# http.server.ThreadingHTTPServer is only available from Python 3.7
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    elif math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+
+    items = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        items.append('%s="%s"' % (name, value))
+
+    return "{%s}" % ",".join(items)
+
+
+class _Metric(object):
+
+    """Base class for metrics, storing a value for each combination of label values."""
+
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels.keys()) != set(self.labelnames):
+            raise ParameterError(
+                "labels",
+                "Metric %s requires the labels: %s" % (self.name, ", ".join(self.labelnames)),
+            )
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        """Removes all recorded values."""
+        with self._lock:
+            self._values = {}
+
+    def samples(self):
+        """Returns a list of ``(name, labels, value)`` tuples for all of the values of this metric."""
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        """Returns this metric in the Prometheus text format."""
+        lines = [
+            "# HELP %s %s" % (self.name, self.documentation),
+            "# TYPE %s %s" % (self.name, self.metric_type),
+        ]
+        for name, labels, value in self.samples():
+            lines.append("%s%s %s" % (name, _format_labels(labels), _format_value(value)))
+
+        return "\n".join(lines) + "\n"
+
+
+class Counter(_Metric):
+
+    """A value which only ever increases, such as the number of runs performed."""
+
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        """Increases the counter (with the given label values) by ``amount``."""
+        if amount < 0:
+            raise ParameterError("amount", "Counters can only be increased")
+
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels):
+        """Returns the current value of the counter with the given label values."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+
+    """A value which can go up and down, such as the number of simulations waiting to be run."""
+
+    metric_type = "gauge"
+
+    def set(self, value, **labels):
+        """Sets the gauge (with the given label values) to ``value``."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def get(self, **labels):
+        """Returns the current value of the gauge with the given label values."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Histogram(_Metric):
+
+    """The distribution of a set of observations, such as the time taken by each run, counted into buckets."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        """Records a single observation (with the given label values)."""
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            data = self._values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data["counts"][i] += 1
+            data["sum"] += value
+            data["count"] += 1
+
+    def get(self, **labels):
+        """Returns a tuple of ``(count, sum)`` of the observations with the given label values."""
+        with self._lock:
+            data = self._values.get(self._key(labels))
+            if data is None:
+                return (0, 0.0)
+            return (data["count"], data["sum"])
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, data in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, data["counts"]):
+                    le = (("le", _format_value(bound)),)
+                    samples.append((self.name + "_bucket", key + le, count))
+                samples.append((self.name + "_sum", key, data["sum"]))
+                samples.append((self.name + "_count", key, data["count"]))
+
+        return samples
+
+
+class MetricsRegistry(object):
+
+    """A collection of metrics which are updated from the events reported to :mod:`Py6S.hooks`.
+
+    Attributes:
+
+    * ``runs_started`` -- Counter of the number of runs started
+    * ``runs_completed`` -- Counter of the number of runs completed successfully
+    * ``runs_shared`` -- Counter of the number of runs which shared the outputs of an identical run in progress,
+      rather than running 6S themselves
+    * ``runs_approximated`` -- Counter of the number of runs whose outputs were approximated from a lookup table
+    * ``runs_failed`` -- Counter of the number of runs which failed, labelled by the type of error (eg. ``ExecutionError``)
+    * ``run_duration`` -- Histogram of the total time taken by each successful run, in seconds
+    * ``stage_seconds`` -- Counter of the total time spent in each stage of a run (see :attr:`.Outputs.timings`)
+    * ``child_cpu_seconds`` -- Counter of the total CPU time used by the 6S processes
+    * ``queue_depth`` -- Gauge of the number of simulations waiting to be started by :func:`Py6S.batch.run_batch`
+    * ``cache_requests`` -- Counter of requests made to result caches, labelled by ``result`` (``hit`` or ``miss``).
+      These are reported to the hooks as ``cache_hit`` and ``cache_miss`` events.
+
+    """
+
+    def __init__(self, prefix="py6s"):
+        self.runs_started = Counter(prefix + "_runs_started_total", "Number of 6S runs started")
+        self.runs_completed = Counter(
+            prefix + "_runs_completed_total", "Number of 6S runs completed successfully"
+        )
+        self.runs_shared = Counter(
+            prefix + "_runs_shared_total",
+            "Number of 6S runs which shared the outputs of an identical run in progress",
+        )
+        self.runs_approximated = Counter(
+            prefix + "_runs_approximated_total",
+            "Number of 6S runs approximated from a lookup table",
+        )
+        self.runs_failed = Counter(
+            prefix + "_runs_failed_total", "Number of 6S runs which failed", ["error"]
+        )
+        self.run_duration = Histogram(
+            prefix + "_run_duration_seconds", "Total time taken by successful 6S runs"
+        )
+        self.stage_seconds = Counter(
+            prefix + "_run_stage_seconds_total",
+            "Total time spent in each stage of successful 6S runs",
+            ["stage"],
+        )
+        self.child_cpu_seconds = Counter(
+            prefix + "_child_cpu_seconds_total", "Total CPU time used by 6S processes"
+        )
+        self.queue_depth = Gauge(
+            prefix + "_batch_queue_depth", "Number of simulations in a batch waiting to be started"
+        )
+        self.cache_requests = Counter(
+            prefix + "_cache_requests_total", "Number of requests made to result caches", ["result"]
+        )
+
+        self.metrics = [
+            self.runs_started,
+            self.runs_completed,
+            self.runs_shared,
+            self.runs_approximated,
+            self.runs_failed,
+            self.run_duration,
+            self.stage_seconds,
+            self.child_cpu_seconds,
+            self.queue_depth,
+            self.cache_requests,
+        ]
+
+    def handle_event(self, event, info):
+        """Updates the metrics from an event. This is the hook registered by :meth:`enable`."""
+        if event == "run_started":
+            self.runs_started.inc()
+        elif event == "run_timings":
+            timings = info["timings"]
+            self.runs_completed.inc()
+            if info.get("shared"):
+                # The time and CPU were counted by the run whose outputs were shared
+                self.runs_shared.inc()
+            else:
+                self.run_duration.observe(timings["total"])
+                for stage, value in timings.items():
+                    if stage == "child_cpu":
+                        if value is not None:
+                            self.child_cpu_seconds.inc(value)
+                    elif stage != "total":
+                        self.stage_seconds.inc(value, stage=stage)
+        elif event == "run_approximated":
+            self.runs_approximated.inc()
+        elif event == "run_failed":
+            self.runs_failed.inc(error=type(info["error"]).__name__)
+        elif event == "queue_depth":
+            self.queue_depth.set(info["depth"])
+        elif event == "cache_hit":
+            self.cache_requests.inc(result="hit")
+        elif event == "cache_miss":
+            self.cache_requests.inc(result="miss")
+
+    def enable(self):
+        """Starts collecting metrics, by registering this registry with :mod:`Py6S.hooks`."""
+        hooks.add_hook(self.handle_event)
+
+    def disable(self):
+        """Stops collecting metrics. The values collected so far are kept."""
+        hooks.remove_hook(self.handle_event)
+
+    def clear(self):
+        """Resets all of the metrics."""
+        for metric in self.metrics:
+            metric.clear()
+
+    def render(self):
+        """Returns all of the metrics in the Prometheus text format."""
+        return "".join(metric.render() for metric in self.metrics)
+
+    def write_textfile(self, filename):
+        """Writes all of the metrics to the given file, for use with the textfile collector of the Prometheus node
+        exporter.
+
+        The file is written atomically (by writing to a temporary file and then renaming it), so the collector will
+        never read a partially-written file."""
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, tmp_name = tempfile.mkstemp(prefix=".tmp_Py6S_metrics_", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render())
+            os.chmod(tmp_name, 0o644)
+            os.replace(tmp_name, filename)
+        except Exception:
+            os.remove(tmp_name)
+            raise
+
+    def serve(self, port, addr=""):
+        """Serves the metrics over HTTP at ``http://addr:port/metrics``, in a background thread.
+
+        Returns the server object - call its ``shutdown`` method to stop serving."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = _ThreadingHTTPServer((addr, port), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return server
+
+
+# The default registry, used by enable() and disable()
+REGISTRY = MetricsRegistry()
+
+
+def enable():
+    """Starts collecting metrics in the default registry, :data:`REGISTRY`."""
+    REGISTRY.enable()
+
+
+def disable():
+    """Stops collecting metrics in the default registry, :data:`REGISTRY`."""
+    REGISTRY.disable()
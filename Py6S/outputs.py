@@ -16,8 +16,116 @@
 # along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
 
 import sys
-
-from .sixs_exceptions import OutputParsingError
+import time
+import zlib
+
+import numpy as np
+
+from .sixs_exceptions import OutputParsingError, ParameterError
+
+# The ways in which the full textual output from 6S can be retained (see Outputs.fulltext_policy)
+FULLTEXT_POLICIES = ("keep", "compress", "drop")
+
+# The version of the field order used by Outputs.to_vector. This must be increased whenever the fields below are
+# changed, so that vectors created with a different field order are never misinterpreted.
+VECTOR_VERSION = 1
+
+# The entries of the ``values`` dictionary stored in a vector, in order
+_VECTOR_VALUES = [
+    "version",
+    "month",
+    "day",
+    "solar_z",
+    "solar_a",
+    "view_z",
+    "view_a",
+    "scattering_angle",
+    "azimuthal_angle_difference",
+    "visibility",
+    "aot550",
+    "ground_pressure",
+    "ground_altitude",
+    "apparent_reflectance",
+    "apparent_radiance",
+    "total_gaseous_transmittance",
+    "wv_above_aerosol",
+    "wv_mixed_with_aerosol",
+    "wv_under_aerosol",
+    "percent_direct_solar_irradiance",
+    "percent_diffuse_solar_irradiance",
+    "percent_environmental_irradiance",
+    "atmospheric_intrinsic_reflectance",
+    "background_reflectance",
+    "pixel_reflectance",
+    "direct_solar_irradiance",
+    "diffuse_solar_irradiance",
+    "environmental_irradiance",
+    "atmospheric_intrinsic_radiance",
+    "background_radiance",
+    "pixel_radiance",
+    "solar_spectrum",
+    "measured_radiance",
+    "atmos_corrected_reflectance_lambertian",
+    "atmos_corrected_reflectance_brdf",
+    "coef_xa",
+    "coef_xb",
+    "coef_xc",
+    "int_funct_filt",
+    "int_solar_spectrum",
+    "water_component_foam",
+    "water_component_water",
+    "water_component_glint",
+    "apparent_polarized_reflectance",
+    "apparent_polarized_radiance",
+    "direction_of_plane_of_polarization",
+    "total_polarization_ratio",
+]
+
+# The entries of the ``values`` dictionary which are integers
+_INT_VALUES = ["month", "day", "solar_z", "solar_a", "view_z", "view_a"]
+
+# The transmittances stored in a vector, each of which has downward, upward and total values
+_VECTOR_TRANSMITTANCES = [
+    "global_gas",
+    "water",
+    "ozone",
+    "co2",
+    "oxygen",
+    "no2",
+    "ch4",
+    "co",
+    "rayleigh_scattering",
+    "aerosol_scattering",
+    "total_scattering",
+]
+
+# The Rayleigh/aerosol/total values stored in a vector
+_VECTOR_RATS = [
+    "spherical_albedo",
+    "optical_depth_total",
+    "optical_depth_plane",
+    "reflectance_I",
+    "reflectance_Q",
+    "reflectance_U",
+    "polarized_reflectance",
+    "direction_of_plane_polarization",
+    "phase_function_I",
+    "phase_function_Q",
+    "phase_function_U",
+    "primary_degree_of_polarization",
+    "single_scattering_albedo",
+]
+
+# The name of each value in a vector, in the form accepted as an ``output_name`` by the helper functions
+VECTOR_FIELDS = (
+    _VECTOR_VALUES
+    + [
+        "transmittance_%s.%s" % (name, part)
+        for name in _VECTOR_TRANSMITTANCES
+        for part in ("downward", "upward", "total")
+    ]
+    + ["%s.%s" % (name, part) for name in _VECTOR_RATS for part in ("rayleigh", "aerosol", "total")]
+)
 
 
 class Outputs(object):
@@ -27,7 +135,29 @@ class Outputs(object):
     Attributes:
 
      * ``fulltext`` -- The full output of the 6S executable. This can be written to a file with the write_output_file method.
+       The full output takes up several kilobytes for each run, so it can be compressed or dropped once the outputs have
+       been parsed - see ``fulltext_policy`` below.
+     * ``fulltext_policy`` -- What to do with the full output once it has been parsed. One of:
+
+       * ``"keep"`` -- (the default) Keep it as it is
+       * ``"compress"`` -- Keep it compressed with zlib, and decompress it whenever ``fulltext`` is accessed
+       * ``"drop"`` -- Discard it, after which accessing ``fulltext`` raises an :class:`.OutputParsingError`
+
+       This can be set for all runs by setting ``Outputs.fulltext_policy``, for individual runs with the
+       ``fulltext_policy`` attribute of :class:`.SixS`, or for a batch of runs with the ``fulltext_policy`` argument
+       of :func:`Py6S.batch.run_batch`.
      * ``values`` -- The main outputs from the 6S run, stored in a dictionary. Accessible either via standard dictionary notation (``s.outputs.values['pixel_radiance']``) or as attributes (``s.outputs.pixel_radiance``)
+     * ``timings`` -- The wall-clock time (in seconds) taken by each stage of the run, stored in a dictionary with the keys:
+
+       * ``render`` -- Creating the 6S input file from the parameters
+       * ``spawn`` -- Starting the 6S process
+       * ``execute`` -- Running 6S, until its output has been fully read
+       * ``capture`` -- Decoding the standard output and standard error of 6S
+       * ``parse`` -- Extracting the values from the output text, and applying the ``fulltext_policy``
+       * ``total`` -- The whole run, from start to finish
+       * ``child_cpu`` -- The CPU time (user + system) used by the 6S process. This is only included on platforms where it can be measured for the process alone (not on Windows).
+
+       Only ``capture`` and ``parse`` are set when an Outputs instance is created directly rather than by :meth:`.SixS.run`.
 
     Methods:
 
@@ -35,21 +165,30 @@ class Outputs(object):
      * :meth:`.extract_results` -- Function called by the constructor to parse the output into individual variables
      * :meth:`.to_int` -- Convert a string to an int, so that it works even if passed a float.
      * :meth:`.write_output_file` -- Write the full textual output of the 6S model to a file.
+     * :meth:`.to_vector` and :meth:`.from_vector` -- Convert the outputs to and from a compact array of numbers.
 
     """
 
-    # Stores the full textual output from 6S
-    fulltext = ""
+    # Stores the full textual output from 6S, as a string (or None if it has been dropped)
+    _fulltext = ""
+
+    # Stores the full textual output from 6S compressed with zlib, if it is being compressed
+    _compressed_fulltext = None
+
+    # The default policy for retaining the full textual output
+    fulltext_policy = "keep"
 
     # Stores the numerical values extracted from the textual output as a dictionary
 
-    def __init__(self, stdout, stderr):
+    def __init__(self, stdout, stderr, fulltext_policy=None):
         """Initialise the class with the stdout output from the model, and process
         it into the numerical outputs.
 
         Arguments:
          * ``stdout`` -- Standard output from the model run
          * ``stderr`` -- Standard error from the model run
+         * ``fulltext_policy`` -- (Optional) The policy for retaining the full textual output (see above). If not
+           given then ``Outputs.fulltext_policy`` is used.
 
         Will raise an :class:`.OutputParsingError` if the output cannot be parsed for any reason.
 
@@ -58,6 +197,9 @@ class Outputs(object):
         self.values = {}
         self.trans = {}
         self.rat = {}
+        self.timings = {}
+
+        stage_start = time.perf_counter()
 
         if len(stderr) > 0:
             # Something on standard error - so there's been an error
@@ -86,14 +228,63 @@ class Outputs(object):
         if sys.version_info[0] >= 3:
             self.fulltext = self.fulltext.decode()
 
+        self.timings["capture"] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
         self.extract_results()
+        self.retain_fulltext(fulltext_policy)
+        self.timings["parse"] = time.perf_counter() - stage_start
+
+    @property
+    def fulltext(self):
+        """The full textual output from 6S."""
+        if self._compressed_fulltext is not None:
+            return zlib.decompress(self._compressed_fulltext).decode("utf-8")
+        elif self._fulltext is None:
+            raise OutputParsingError(
+                "The full output from 6S is not available, as it was dropped after parsing"
+            )
+        return self._fulltext
+
+    @fulltext.setter
+    def fulltext(self, value):
+        self._fulltext = value
+        self._compressed_fulltext = None
+
+    def retain_fulltext(self, policy=None):
+        """Applies the given policy for retaining the full textual output (``"keep"``, ``"compress"`` or
+        ``"drop"``), or ``Outputs.fulltext_policy`` if no policy is given."""
+        if policy is None:
+            policy = Outputs.fulltext_policy
+
+        if policy not in FULLTEXT_POLICIES:
+            raise ParameterError(
+                "fulltext_policy", "Must be one of: %s" % ", ".join(FULLTEXT_POLICIES)
+            )
+
+        if policy == "compress" and self._compressed_fulltext is None:
+            text = self._fulltext
+            if text is not None:
+                self._compressed_fulltext = zlib.compress(text.encode("utf-8"))
+                self._fulltext = None
+        elif policy == "drop":
+            self._fulltext = None
+            self._compressed_fulltext = None
+
+    def __str__(self):
+        return self.fulltext
 
     def __getattr__(self, name):
         """Executed when an attribute is referenced and not found. This method is overridden
         to allow the user to access the outputs as ``outputs.variable`` rather than using the dictionary
         explicity"""
-        if name == "__array_struct__" or name == "__array_interface__" or name == "__array__":
-            raise AttributeError()
+        # Special methods (such as __array__ or __deepcopy__) are never outputs
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        # The dictionaries themselves don't exist yet while an instance is being unpickled
+        if name in ("values", "trans", "rat"):
+            raise AttributeError(name)
 
         # If there is a key with this name in the standard variables field then use it
         if name in self.values:
@@ -359,6 +550,90 @@ class Outputs(object):
 
         return float(spl[2])
 
+    def to_vector(self):
+        """Returns the numerical outputs as a 1D NumPy array of floats, which is much smaller and faster to transfer
+        (for example, between processes) than the Outputs instance itself.
+
+        The values are in the order given by ``VECTOR_FIELDS``, with NaN for any outputs which are not available.
+        The full textual output and the timings are not included. The Outputs can be recreated from the vector
+        using :meth:`from_vector`.
+
+        """
+        vector = np.full(len(VECTOR_FIELDS), np.nan)
+
+        for i, name in enumerate(_VECTOR_VALUES):
+            try:
+                vector[i] = float(self.values[name])
+            except (KeyError, TypeError, ValueError):
+                pass
+
+        i = len(_VECTOR_VALUES)
+        for name in _VECTOR_TRANSMITTANCES:
+            trans = self.trans.get(name, Transmittance())
+            vector[i : i + 3] = (trans.downward, trans.upward, trans.total)
+            i += 3
+
+        for name in _VECTOR_RATS:
+            rat = self.rat.get(name, RayleighAerosolTotal())
+            vector[i : i + 3] = (rat.rayleigh, rat.aerosol, rat.total)
+            i += 3
+
+        return vector
+
+    @classmethod
+    def from_vector(cls, vector, version=VECTOR_VERSION):
+        """Creates an Outputs instance from a vector created by :meth:`to_vector`.
+
+        The ``fulltext`` of the resulting instance is empty, and any outputs which were not available (ie. are NaN in
+        the vector) are not set.
+
+        Arguments:
+         * ``vector`` -- The vector of values
+         * ``version`` -- (Optional) The version of the field order used to create the vector, which must be the
+           current ``VECTOR_VERSION``
+
+        """
+        if version != VECTOR_VERSION or len(vector) != len(VECTOR_FIELDS):
+            raise OutputParsingError(
+                "Cannot read an outputs vector of version %s with %d values (expected version %d with %d values)"
+                % (version, len(vector), VECTOR_VERSION, len(VECTOR_FIELDS))
+            )
+
+        outputs = cls.__new__(cls)
+        outputs.values = {}
+        outputs.trans = {}
+        outputs.rat = {}
+        outputs.timings = {}
+
+        vector = [float(v) for v in vector]
+
+        for name, value in zip(_VECTOR_VALUES, vector):
+            if np.isnan(value):
+                continue
+            if name == "version":
+                outputs.values[name] = "%g" % value
+            elif name in _INT_VALUES:
+                outputs.values[name] = int(value)
+            else:
+                outputs.values[name] = value
+
+        i = len(_VECTOR_VALUES)
+        for name in _VECTOR_TRANSMITTANCES:
+            if not np.all(np.isnan(vector[i : i + 3])):
+                trans = Transmittance()
+                trans.downward, trans.upward, trans.total = vector[i : i + 3]
+                outputs.trans[name] = trans
+            i += 3
+
+        for name in _VECTOR_RATS:
+            if not np.all(np.isnan(vector[i : i + 3])):
+                rat = RayleighAerosolTotal()
+                rat.rayleigh, rat.aerosol, rat.total = vector[i : i + 3]
+                outputs.rat[name] = rat
+            i += 3
+
+        return outputs
+
     def write_output_file(self, filename):
         """Writes the full textual output of the 6S model run to the specified filename.
 
@@ -0,0 +1,213 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Classes for reporting the progress of a batch of 6S runs, such as those performed by the helper functions in
+:mod:`Py6S.SixSHelpers`.
+
+Any of these can be passed as the ``progress`` argument of the helper functions (or of
+:func:`Py6S.batch.run_batch`). For example, to show a progress bar while running for many wavelengths::
+
+  SixSHelpers.Wavelengths.run_vnir(s, output_name='pixel_radiance', progress=BarProgress())
+
+A plain function can also be passed, in which case it is called with a :class:`ProgressReport` each time a run
+finishes::
+
+  def report(r):
+      print("%d/%d done, %.1f runs/s, %.0fs remaining" % (r.completed, r.total, r.rate, r.eta))
+
+  SixSHelpers.Wavelengths.run_vnir(s, output_name='pixel_radiance', progress=report)
+
+"""
+
+import collections
+import logging
+import sys
+import time
+
+from .sixs_exceptions import ParameterError
+
+ProgressReport = collections.namedtuple(
+    "ProgressReport", ["completed", "total", "elapsed", "rate", "eta"]
+)
+ProgressReport.__doc__ = """The progress of a batch of runs.
+
+* ``completed`` -- The number of runs which have finished
+* ``total`` -- The total number of runs in the batch
+* ``elapsed`` -- The time since the batch started, in seconds
+* ``rate`` -- The number of runs finished per second
+* ``eta`` -- The estimated time until the batch finishes, in seconds (``None`` until the first run finishes)
+"""
+
+
+class Progress(object):
+
+    """Base class for progress reporters.
+
+    Subclasses should override :meth:`report`, which is called every time a run finishes, and can override
+    :meth:`finish`, which is called once the whole batch has finished."""
+
+    def start(self, total):
+        """Called when a batch of ``total`` runs is started."""
+        self.total = total
+        self.completed = 0
+        self.start_time = time.perf_counter()
+
+    def update(self, n=1):
+        """Called when ``n`` more runs have finished."""
+        self.completed += n
+        self.report(self.current())
+
+    def current(self):
+        """Returns a :class:`ProgressReport` describing the current progress."""
+        elapsed = time.perf_counter() - self.start_time
+
+        if self.completed > 0 and elapsed > 0:
+            rate = self.completed / elapsed
+            eta = (self.total - self.completed) / rate
+        else:
+            rate = 0.0
+            eta = None
+
+        return ProgressReport(self.completed, self.total, elapsed, rate, eta)
+
+    def report(self, report):
+        """Reports the given :class:`ProgressReport`. Does nothing in the base class."""
+        pass
+
+    def finish(self):
+        """Called when the batch has finished."""
+        pass
+
+
+class CallbackProgress(Progress):
+
+    """Calls a function with a :class:`ProgressReport` every time a run finishes."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def report(self, report):
+        self.callback(report)
+
+
+class LoggingProgress(Progress):
+
+    """Logs the progress of the batch using the standard :mod:`logging` module.
+
+    Arguments:
+
+    * ``logger`` -- (Optional) The logger to use. Defaults to the ``Py6S`` logger.
+    * ``level`` -- (Optional) The level to log at. Defaults to ``logging.INFO``.
+    * ``interval`` -- (Optional) The minimum time in seconds between log messages (defaults to 10s). The start and
+      end of the batch are always logged.
+
+    """
+
+    def __init__(self, logger=None, level=logging.INFO, interval=10.0):
+        if logger is None:
+            logger = logging.getLogger("Py6S")
+        self.logger = logger
+        self.level = level
+        self.interval = interval
+
+    def start(self, total):
+        super(LoggingProgress, self).start(total)
+        self.last_report = self.start_time
+        self.logger.log(self.level, "Starting %d 6S runs", total)
+
+    def report(self, report):
+        now = time.perf_counter()
+        if now - self.last_report < self.interval and report.completed < report.total:
+            return
+        self.last_report = now
+
+        self.logger.log(
+            self.level,
+            "Completed %d/%d 6S runs (%.2f runs/s, %s remaining)",
+            report.completed,
+            report.total,
+            report.rate,
+            _format_time(report.eta),
+        )
+
+    def finish(self):
+        report = self.current()
+        self.logger.log(
+            self.level,
+            "Finished %d 6S runs in %s (%.2f runs/s)",
+            report.completed,
+            _format_time(report.elapsed),
+            report.rate,
+        )
+
+
+class BarProgress(Progress):
+
+    """Shows a text progress bar, with the throughput and estimated time remaining.
+
+    Arguments:
+
+    * ``stream`` -- (Optional) The stream to write the bar to. Defaults to ``sys.stderr``.
+    * ``width`` -- (Optional) The width of the bar itself, in characters (defaults to 30)
+
+    """
+
+    def __init__(self, stream=None, width=30):
+        self.stream = stream
+        self.width = width
+
+    def report(self, report):
+        stream = self.stream if self.stream is not None else sys.stderr
+
+        filled = int(self.width * report.completed / max(report.total, 1))
+        bar = "#" * filled + "-" * (self.width - filled)
+        stream.write(
+            "\r[%s] %d/%d %.2f runs/s ETA %s"
+            % (bar, report.completed, report.total, report.rate, _format_time(report.eta))
+        )
+        stream.flush()
+
+    def finish(self):
+        stream = self.stream if self.stream is not None else sys.stderr
+        stream.write("\n")
+        stream.flush()
+
+
+def _format_time(seconds):
+    if seconds is None:
+        return "?"
+
+    seconds = int(round(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+
+    return "%d:%02d:%02d" % (hours, minutes, seconds)
+
+
+def get_progress(progress):
+    """Converts the value passed as a ``progress`` argument into a :class:`Progress` instance.
+
+    ``None`` gives a :class:`Progress` which reports nothing, and a function is wrapped in a
+    :class:`CallbackProgress`."""
+    if progress is None:
+        return Progress()
+    elif isinstance(progress, Progress):
+        return progress
+    elif callable(progress):
+        return CallbackProgress(progress)
+    else:
+        raise ParameterError("progress", "Must be a Progress instance, a function or None")
@@ -0,0 +1,458 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A database of the parameters and outputs of 6S runs, which can be searched for the runs nearest to a given set of
+parameters.
+
+Each run is stored with the values of a set of numerical parameters (by default the solar and view angles, the AOT
+and the wavelength) and its *context*: the rest of its configuration, such as the date, the atmospheric and aerosol
+profiles, altitudes, ground reflectance and any of the angles, AOT or wavelength band which aren't stored as
+parameters. Runs are only compared with other runs with the same context, using a
+k-d tree of their parameters. For example, to record every run made in this process::
+
+  from Py6S.rundb import RunDatabase
+
+  db = RunDatabase("runs.db")
+  db.enable()
+  ...  # Run 6S as normal
+
+and later, to find the runs closest to a new configuration::
+
+  for distance, record in db.nearest(s, k=5):
+      print(distance, record.parameters, record.outputs.pixel_radiance)
+
+or to find how far each of a grid of configurations is from the nearest existing run, to decide where more runs are
+needed::
+
+  distances = db.nearest_distances(grid, context=s)
+
+Distances are measured after dividing each parameter by its scale, so that a difference of one scale unit in any
+parameter counts the same. Note that azimuth angles are treated like any other number, so 359 and 1 degrees are
+considered far apart.
+
+Requires the scipy module to be installed for the nearest neighbour searches.
+
+"""
+
+import copy
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from . import hooks
+from .cache import _input_sections
+from .outputs import VECTOR_VERSION, Outputs
+from .sixs_exceptions import ParameterError
+from .streaming import _parameter_value
+
+
+def _wavelength(sixs):
+    return (sixs.wavelength[1] + sixs.wavelength[2]) / 2.0
+
+
+# The parameters stored by default, with the functions or attribute paths used to get them
+DEFAULT_PARAMETERS = OrderedDict(
+    [
+        ("solar_z", "geometry.solar_z"),
+        ("solar_a", "geometry.solar_a"),
+        ("view_z", "geometry.view_z"),
+        ("view_a", "geometry.view_a"),
+        ("aot550", "aot550"),
+        ("wavelength", _wavelength),
+    ]
+)
+
+# The scale of each of the default parameters, used when measuring distances
+DEFAULT_SCALES = {
+    "solar_z": 1.0,
+    "solar_a": 1.0,
+    "view_z": 1.0,
+    "view_a": 1.0,
+    "aot550": 0.01,
+    "wavelength": 0.01,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hash TEXT NOT NULL UNIQUE,
+    context TEXT NOT NULL,
+    parameters BLOB NOT NULL,
+    version INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    deck TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_context ON runs (context);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _without_parameter(sixs, path):
+    """Sets the attribute at a dotted path of a :class:`.SixS` instance to zero (if it is set), copying the objects
+    along the path first so that the original configuration isn't changed."""
+    names = path.split(".")
+    obj = sixs
+    try:
+        for name in names[:-1]:
+            child = copy.copy(getattr(obj, name))
+            setattr(obj, name, child)
+            obj = child
+    except AttributeError:
+        return
+
+    if getattr(obj, names[-1], None) is not None:
+        setattr(obj, names[-1], 0)
+
+
+def context_of(sixs, parameters=None):
+    """Returns the context of a :class:`.SixS` instance (the hash of the parts of its configuration which aren't
+    stored as parameters), as a hexadecimal string.
+
+    Arguments:
+
+    * ``sixs`` -- The :class:`.SixS` instance
+    * ``parameters`` -- (Optional) The parameters which are stored, in any of the forms accepted by
+      :class:`RunDatabase`. Defaults to ``DEFAULT_PARAMETERS``.
+
+    The context is the hash of the whole input file, with the values of the parameters given as attribute paths
+    replaced by zero. It therefore includes the month and day of the geometry, which set the Earth-Sun distance,
+    and any angles or AOT which aren't parameters. Parameters given as functions can't be removed from the input
+    file, except for the default wavelength parameter: the wavelength is left out of the context for runs at a
+    single wavelength, but the full definition of the band (including any filter function) is kept for runs over a
+    band, so that bands with the same centre are never compared."""
+    if parameters is None:
+        parameters = DEFAULT_PARAMETERS
+    getters = list(parameters.values()) if isinstance(parameters, dict) else list(parameters)
+
+    blank = copy.copy(sixs)
+    for getter in getters:
+        if isinstance(getter, str):
+            _without_parameter(blank, getter)
+
+    single_wavelength = _wavelength in getters and sixs.wavelength[1] == sixs.wavelength[2]
+    text = "".join(
+        text
+        for name, text in _input_sections(blank)
+        if not (name == "wavelength" and single_wavelength)
+    )
+
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class RunRecord(object):
+
+    """A run stored in a :class:`RunDatabase`.
+
+    Attributes:
+
+    * ``id`` -- The ID of the run in the database
+    * ``parameters`` -- An ordered dictionary of the values of the parameters of the run (NaN if not available)
+    * ``outputs`` -- The :class:`.Outputs` of the run, without the ``fulltext``
+    * ``deck`` -- The 6S input file of the run, which can be used to run it again
+
+    """
+
+    def __init__(self, id, parameters, outputs, deck):
+        self.id = id
+        self.parameters = parameters
+        self.outputs = outputs
+        self.deck = deck
+
+    def __repr__(self):
+        return "RunRecord(%d, %r)" % (self.id, dict(self.parameters))
+
+
+class RunDatabase(object):
+
+    """Stores the parameters and outputs of 6S runs in an SQLite database, and finds the runs nearest to a given
+    configuration.
+
+    Arguments:
+
+    * ``database`` -- (Optional) The SQLite database file, which is created if it doesn't exist. Defaults to
+      ``":memory:"``, which keeps the runs in memory only.
+    * ``parameters`` -- (Optional) The numerical parameters to store and search by, as a list of dotted attribute
+      paths of the :class:`.SixS` instance or a dictionary mapping names to such paths or to functions which are
+      called with the :class:`.SixS` instance, as for :class:`.ResultWriter`. Defaults to ``DEFAULT_PARAMETERS``.
+      Only the names are stored in the database, and these must match when an existing database is opened.
+    * ``scales`` -- (Optional) A dictionary of the scale of each parameter (see the module documentation). Any
+      parameters not given use their scale in ``DEFAULT_SCALES``, or 1.
+
+    Runs whose parameters can't all be found (for example, the angles of a run using one of the predefined
+    geometries) are stored, but are never returned by the nearest neighbour searches.
+
+    """
+
+    def __init__(self, database=":memory:", parameters=None, scales=None):
+        if parameters is None:
+            parameters = DEFAULT_PARAMETERS
+        elif not isinstance(parameters, dict):
+            parameters = OrderedDict((path, path) for path in parameters)
+
+        self.database = database
+        self.parameters = OrderedDict(parameters)
+        self.names = list(self.parameters.keys())
+
+        scales = dict(scales or {})
+        for name in scales:
+            if name not in self.parameters:
+                raise ParameterError("scales", "%s is not one of the parameters" % name)
+        self.scales = np.array(
+            [scales.get(name, DEFAULT_SCALES.get(name, 1.0)) for name in self.names], dtype=float
+        )
+
+        self._lock = threading.Lock()
+        self._trees = {}
+        self._db = sqlite3.connect(database, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.executescript(_SCHEMA)
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'parameters'").fetchone()
+            if row is None:
+                self._db.execute(
+                    "INSERT INTO meta (name, value) VALUES ('parameters', ?)",
+                    (" ".join(self.names),),
+                )
+            elif row[0].split() != self.names:
+                raise ParameterError(
+                    "parameters",
+                    "The database stores the parameters %s" % ", ".join(row[0].split()),
+                )
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def parameter_values(self, sixs):
+        """Returns a NumPy array of the values of the parameters of a :class:`.SixS` instance, with NaN for any which
+        can't be found."""
+        values = np.full(len(self.names), np.nan)
+        for i, getter in enumerate(self.parameters.values()):
+            try:
+                values[i] = float(_parameter_value(sixs, getter))
+            except (AttributeError, TypeError, ValueError):
+                pass
+
+        return values
+
+    def add(self, sixs, outputs=None):
+        """Stores a run, given the :class:`.SixS` instance and its :class:`.Outputs` (by default, the ``outputs``
+        attribute of the instance). Returns True if the run was added, or False if an identical run was already
+        stored."""
+        if outputs is None:
+            outputs = sixs.outputs
+        if outputs is None:
+            raise ParameterError("outputs", "The run has no outputs to store")
+
+        deck = sixs.generate_input_file()
+        row = (
+            hashlib.sha256(deck.encode("utf-8")).hexdigest(),
+            context_of(sixs, self.parameters),
+            self.parameter_values(sixs).tobytes(),
+            VECTOR_VERSION,
+            outputs.to_vector().tobytes(),
+            deck,
+            time.time(),
+        )
+
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO runs (hash, context, parameters, version, vector, deck, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            if cursor.rowcount:
+                self._trees.pop(row[1], None)
+
+        return cursor.rowcount > 0
+
+    def handle_event(self, event, info):
+        """Stores the run from a ``run_timings`` event. This is the hook registered by :meth:`enable`.
+
+        Runs whose input file wasn't generated from the parameters of their :class:`.SixS` instance (such as those of
+        :class:`.distributed.Worker`) are ignored, as their parameters aren't known."""
+        if event == "run_timings":
+            if info["input_file"] != info["sixs"].generate_input_file():
+                return
+            self.add(info["sixs"])
+
+    def enable(self):
+        """Starts storing every successful run made in this process, by registering with :mod:`Py6S.hooks`. Runs
+        made in other processes (such as by the ``"process"`` backend of :func:`Py6S.batch.run_batch`) must be
+        added with :meth:`add`."""
+        hooks.add_hook(self.handle_event)
+
+    def disable(self):
+        """Stops storing runs."""
+        hooks.remove_hook(self.handle_event)
+
+    def contexts(self):
+        """Returns a dictionary of the number of runs stored with each context."""
+        with self._lock:
+            rows = self._db.execute("SELECT context, COUNT(*) FROM runs GROUP BY context")
+            return dict(rows.fetchall())
+
+    def _make_record(self, row):
+        id, parameters, version, vector, deck = row
+        parameters = np.frombuffer(parameters, dtype=np.float64)
+        return RunRecord(
+            id,
+            OrderedDict(zip(self.names, parameters.tolist())),
+            Outputs.from_vector(np.frombuffer(vector, dtype=np.float64), version),
+            deck,
+        )
+
+    def get(self, id):
+        """Returns the :class:`RunRecord` of the run with the given ID."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, parameters, version, vector, deck FROM runs WHERE id = ?", (id,)
+            ).fetchone()
+        if row is None:
+            raise ParameterError("id", "No run with ID %s" % id)
+
+        return self._make_record(row)
+
+    def _tree(self, context):
+        """Returns the k-d tree of the runs with a context (and the IDs of the runs in it), building it if
+        necessary."""
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            raise ImportError("You must install scipy to search for the nearest runs")
+
+        with self._lock:
+            if context in self._trees:
+                return self._trees[context]
+
+            rows = self._db.execute(
+                "SELECT id, parameters FROM runs WHERE context = ? AND version = ?",
+                (context, VECTOR_VERSION),
+            ).fetchall()
+
+            ids = np.array([row[0] for row in rows], dtype=np.int64)
+            points = np.array(
+                [np.frombuffer(row[1], dtype=np.float64) for row in rows], dtype=np.float64
+            ).reshape(len(rows), len(self.names))
+
+            usable = np.all(np.isfinite(points), axis=1)
+            ids = ids[usable]
+            tree = cKDTree(points[usable] / self.scales) if len(ids) > 0 else None
+
+            self._trees[context] = (tree, ids)
+            return tree, ids
+
+    def _query_points(self, points):
+        if isinstance(points, dict):
+            points = [points]
+
+        if len(points) > 0 and isinstance(points[0], dict):
+            missing = [name for name in self.names if name not in points[0]]
+            if missing:
+                raise ParameterError("points", "Missing parameters: %s" % ", ".join(missing))
+            points = [[point[name] for name in self.names] for point in points]
+
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        if points.shape[1] != len(self.names):
+            raise ParameterError("points", "Each point must have %d parameters" % len(self.names))
+
+        return points / self.scales
+
+    def nearest(self, query, k=1, context=None, max_distance=np.inf):
+        """Finds the stored runs nearest to a configuration.
+
+        Arguments:
+
+        * ``query`` -- Either a :class:`.SixS` instance, or a dictionary of the values of the parameters
+        * ``k`` -- (Optional) The number of runs to return. Defaults to 1.
+        * ``context`` -- (Optional) Only runs with this context are returned, given either as a :class:`.SixS`
+          instance or as the context itself (see :func:`context_of`, which must be given the parameters of the
+          database). Defaults to the context of ``query``, and must be given if ``query`` is a dictionary.
+        * ``max_distance`` -- (Optional) Only return runs within this (scaled) distance
+
+        Return value:
+
+        A list of ``(distance, record)`` tuples, nearest first, where each ``record`` is a :class:`RunRecord`.
+        There may be fewer than ``k`` of them.
+
+        """
+        if isinstance(query, dict):
+            if context is None:
+                raise ParameterError(
+                    "context", "Must be given when searching for a set of parameters"
+                )
+            point = self._query_points(query)
+        else:
+            if context is None:
+                context = query
+            point = self.parameter_values(query)
+            if not np.all(np.isfinite(point)):
+                raise ParameterError("query", "Not all of the parameters could be found")
+            point = point[np.newaxis, :] / self.scales
+
+        if not isinstance(context, str):
+            context = context_of(context, self.parameters)
+
+        tree, ids = self._tree(context)
+        if tree is None:
+            return []
+
+        distances, indices = tree.query(
+            point[0], k=[i + 1 for i in range(k)], distance_upper_bound=max_distance
+        )
+
+        results = []
+        for distance, index in zip(distances, indices):
+            if np.isfinite(distance):
+                results.append((float(distance), self.get(int(ids[index]))))
+
+        return results
+
+    def nearest_distances(self, points, context):
+        """Returns the (scaled) distance from each of many configurations to the nearest stored run with the given
+        context, or infinity if there are no runs with the context.
+
+        Arguments:
+
+        * ``points`` -- A 2D array with a row of parameter values for each configuration, with the parameters in the
+          order of the ``names`` attribute, or a list of dictionaries of parameter values
+        * ``context`` -- The context of the runs, given either as a :class:`.SixS` instance or as the context itself
+
+        """
+        points = self._query_points(points)
+
+        if not isinstance(context, str):
+            context = context_of(context, self.parameters)
+
+        tree, ids = self._tree(context)
+        if tree is None:
+            return np.full(len(points), np.inf)
+
+        return tree.query(points)[0]
+
+    def close(self):
+        """Stops storing runs and closes the database."""
+        self.disable()
+        with self._lock:
+            self._db.close()
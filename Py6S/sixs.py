@@ -15,14 +15,19 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
+import copy
+import hashlib
 import os
 import subprocess
 import sys
 import tempfile
+import threading
+import time
 
 import numpy as np
-from scipy.interpolate import interp1d
 
+from . import hooks
 from .outputs import Outputs
 from .Params import (
     AeroProfile,
@@ -33,15 +38,102 @@ from .Params import (
     GroundReflectance,
     Wavelength,
 )
-from .sixs_exceptions import ExecutionError, ParameterError
+from .sixs_exceptions import Error, ExecutionError, ExecutionTimeoutError, ParameterError
 
 SIXSVERSION = "1.1"
 
+# Cache of the reflectance strings produced by SixS._refls_to_string, keyed by the spectrum
+# and the wavelength range, with the least recently used entries discarded first
+_REFLS_CACHE_SIZE = 64
+_refls_cache = collections.OrderedDict()
+_refls_cache_lock = threading.Lock()
+
+# Cache of the atmospheric correction coefficients produced by SixS.correction_coefficients, keyed by the
+# 6S input file, with the least recently used entries discarded first
+_COEFFICIENTS_CACHE_SIZE = 256
+_coefficients_cache = collections.OrderedDict()
+_coefficients_cache_lock = threading.Lock()
+
+# The number of values corrected at once by SixS.apply_correction
+CORRECTION_CHUNK_SIZE = 1048576
+
+# The runs currently in progress, keyed by executable and input file hash, so that identical runs
+# requested at the same time from different threads can share a single execution of 6S
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+# The longest time (in seconds) that a run with no timeout waits for an identical run in progress
+# before running 6S itself
+SINGLE_FLIGHT_WAIT = 60.0
+
 # Fix for Python 3 where basestring is not available
 if sys.version_info[0] >= 3:
     basestring = str
 
 
+def _read_pipe(pipe, chunks):
+    chunks.append(pipe.read())
+    pipe.close()
+
+
+def _communicate(process, timeout=None):
+    """Reads the standard output and standard error of a process until it finishes, like ``Popen.communicate``, and
+    returns them along with the CPU time (user + system) used by the process.
+
+    On POSIX the process is reaped with ``os.wait4``, which gives the CPU time of that process alone (unlike
+    ``resource.getrusage``, which includes every child process of this process). Elsewhere the CPU time is
+    ``None``. If the process doesn't finish within the timeout it is killed and ``subprocess.TimeoutExpired`` is
+    raised."""
+    if not hasattr(os, "wait4"):
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
+        return stdout, stderr, None
+
+    stdout, stderr = [], []
+    readers = [
+        threading.Thread(target=_read_pipe, args=(process.stdout, stdout)),
+        threading.Thread(target=_read_pipe, args=(process.stderr, stderr)),
+    ]
+    for reader in readers:
+        reader.daemon = True
+        reader.start()
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for reader in readers:
+        reader.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+    timed_out = any(reader.is_alive() for reader in readers)
+    if timed_out:
+        process.kill()
+
+    pid, status, usage = os.wait4(process.pid, 0)
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+
+    for reader in readers:
+        reader.join()
+
+    if timed_out:
+        raise subprocess.TimeoutExpired(process.args, timeout)
+
+    return stdout[0], stderr[0], usage.ru_utime + usage.ru_stime
+
+
+class _Flight(object):
+
+    """A run of 6S in progress, which other identical runs can wait for and share the results of."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.outputs = None
+        self.error = None
+
+
 class SixS(object):
 
     """Wrapper for the 6S Radiative Transfer Model.
@@ -108,6 +200,38 @@ class SixS(object):
       Note: only one of ``visibility`` or ``aot550`` can be set.
       When setting one, ensure the other is set to ``None``. (By default, ``s.visibility`` is set to None,
       so to set a visibility value you must also do ``s.aot550 = None``)
+
+    * ``timeout`` -- (Optional) The maximum time, in seconds, that a single run of 6S may take. If 6S takes longer
+      than this then it is stopped and an :class:`.ExecutionTimeoutError` is raised. For example::
+
+                            s.timeout = 60
+
+      By default there is no limit.
+
+    * ``single_flight`` -- (Optional) Whether to share the execution of 6S between identical runs. If this is True
+      and :meth:`.run` is called while another thread is already running 6S with exactly the same input file, then
+      it waits for that run to finish and uses a copy of its outputs, rather than starting another 6S process. For
+      example::
+
+                            s.single_flight = True
+
+      It waits for at most ``timeout`` seconds (or ``SINGLE_FLIGHT_WAIT`` seconds if there is no timeout), and then
+      runs 6S itself. By default every run executes 6S itself.
+
+    * ``fulltext_policy`` -- (Optional) What to do with the full textual output from 6S once it has been parsed:
+      ``"keep"``, ``"compress"`` or ``"drop"`` (see :class:`.Outputs`). For example::
+
+                            s.fulltext_policy = "compress"
+
+      By default the global setting ``Outputs.fulltext_policy`` is used.
+
+    * ``cache`` -- (Optional) A cache of the outputs of previous runs, such as a :class:`.ResultCache`. If this is set
+      then :meth:`.run` uses the cached outputs of any equivalent run, rather than running 6S, and adds the outputs of
+      the runs it does perform to the cache. For example::
+
+                            s.cache = ResultCache(steps={"angle": 0.1})
+
+      See :mod:`Py6S.cache` for how equivalent runs are found.
     """
 
     # Stores the outputs from 6S as an instance of the Outputs class
@@ -116,6 +240,18 @@ class SixS(object):
     min_wv = None
     max_wv = None
 
+    # The maximum time (in seconds) that a run may take, or None for no limit
+    timeout = None
+
+    # Whether to share a single execution of 6S between identical runs made at the same time
+    single_flight = False
+
+    # What to do with the full textual output once it has been parsed, or None to use Outputs.fulltext_policy
+    fulltext_policy = None
+
+    # The cache of outputs to use, or None to always run 6S
+    cache = None
+
     __version__ = "1.9.1"
 
     def __init__(self, path=None):
@@ -232,6 +368,20 @@ class SixS(object):
         return self.atmos_corr
 
     def _refls_to_string(self, arr):
+        """Converts a 2D array of wavelengths (column 0) and reflectances (column 1) to the string of reflectances
+        at 2.5nm spacing between ``min_wv`` and ``max_wv`` that 6S requires.
+
+        The results are cached, as the same spectrum is often used for many runs (for example, when running for
+        many wavelengths or angles)."""
+        arr = np.asarray(arr)
+        key = (arr.shape, arr.dtype.str, arr.tobytes(), self.min_wv, self.max_wv)
+
+        with _refls_cache_lock:
+            s = _refls_cache.get(key)
+            if s is not None:
+                _refls_cache.move_to_end(key)
+                return s
+
         wavelengths = arr[:, 0]
         reflectances = arr[:, 1]
 
@@ -240,22 +390,32 @@ class SixS(object):
         wavelengths = wavelengths[~np.isnan(reflectances)]
         reflectances = reflectances[~np.isnan(reflectances)]
 
+        order = np.argsort(wavelengths, kind="mergesort")
+        wavelengths = wavelengths[order]
+        reflectances = reflectances[order]
+
         # Create an array of the wavelengths that we want to get the reflectances at
         new_wavelengths = np.arange(self.min_wv, self.max_wv + 0.0025, 0.0025)
 
-        # We then interpolate to get the right places
-        calc_refl = interp1d(wavelengths, reflectances, bounds_error=False, fill_value=0.0)
-        new_reflectances = calc_refl(new_wavelengths)
+        # We then interpolate to get the right places, using zero outside of the range of the spectrum
+        new_reflectances = np.interp(new_wavelengths, wavelengths, reflectances, left=0.0, right=0.0)
+
+        # Format all of the values with a single format string, as np.savetxt does for each row. %r gives
+        # the same text as str() on each value did, so the input files are unchanged.
+        s = " ".join(["%r"] * len(new_reflectances)) % tuple(new_reflectances.tolist())
 
-        s = " ".join(map(str, new_reflectances))
+        with _refls_cache_lock:
+            _refls_cache[key] = s
+            while len(_refls_cache) > _REFLS_CACHE_SIZE:
+                _refls_cache.popitem(last=False)
 
         return s
 
-    def write_input_file(self, filename=None):
-        """Generates a 6S input file from the parameters stored in the object
-        and writes it to the given filename.
+    def generate_input_file(self):
+        """Generates the contents of a 6S input file from the parameters stored in the object,
+        and returns it as a string.
 
-        The input file is guaranteed to be a valid 6S input file which can be run manually if required
+        This is the text which :meth:`.write_input_file` writes to the file.
 
         """
 
@@ -316,6 +476,27 @@ class SixS(object):
 
         input_file += self._create_atmos_corr_lines()
 
+        return input_file
+
+    def input_hash(self):
+        """Returns a hash of the 6S input file generated from the parameters stored in the object, as a hexadecimal
+        string.
+
+        Runs with the same hash have identical input files, and so will give identical outputs."""
+        return hashlib.sha256(self.generate_input_file().encode("utf-8")).hexdigest()
+
+    def write_input_file(self, filename=None):
+        """Generates a 6S input file from the parameters stored in the object
+        and writes it to the given filename.
+
+        The input file is guaranteed to be a valid 6S input file which can be run manually if required
+
+        """
+        return self._write_input_file(self.generate_input_file(), filename)
+
+    def _write_input_file(self, input_file, filename=None):
+        """Writes the given input file text to the given filename (or a temporary file if no filename is given), and
+        returns the filename."""
         if filename is None:
             # No filename given, so write to temporary file
             tmp_file = tempfile.NamedTemporaryFile(prefix="tmp_Py6S_input_", delete=False)
@@ -335,33 +516,255 @@ class SixS(object):
 
         return name
 
-    def run(self):
+    def run(self, approx=None, tol=None):
         """Runs the 6S model and stores the outputs in the output variable.
 
-        May raise an :class:`.ExecutionError` if the 6S executable cannot be found."""
+        Arguments:
 
+        * ``approx`` -- (Optional) A :class:`.LookupTable` to approximate the outputs from, rather than running 6S,
+          when the run is covered by the table. 6S is run as normal if it isn't. See :mod:`Py6S.lut`.
+        * ``tol`` -- (Optional) The largest acceptable estimated relative error when approximating the outputs, as for
+          :meth:`.LookupTable.approximate`. By default the outputs are approximated whenever the run is covered by
+          the table.
+
+        The time taken by each stage of the run is stored in ``s.outputs.timings`` (see :attr:`.Outputs.timings`),
+        and is also passed to any hooks registered in :mod:`Py6S.hooks` as a ``run_timings`` event.
+
+        May raise an :class:`.ExecutionError` if the 6S executable cannot be found, an :class:`.ExecutionTimeoutError`
+        if 6S takes longer than ``timeout`` seconds, or an :class:`.OutputParsingError` if the output from 6S cannot
+        be understood.
+
+        If ``single_flight`` is True and an identical run is already in progress in another thread, this waits for it
+        and uses a copy of its :class:`.Outputs` (reporting a ``run_timings`` event with ``shared`` set to True).
+
+        If ``cache`` is set, each run first looks for the outputs of an equivalent run in the cache, reporting a
+        ``cache_hit`` or ``cache_miss`` event to the hooks. On a hit the cached :class:`.Outputs` are used (each of
+        the caches in :mod:`Py6S.cache` returns a new instance from every lookup), and 6S isn't run at all.
+
+        Runs whose outputs are approximated from ``approx`` report a ``run_approximated`` event to the hooks (rather
+        than ``run_timings``), and their outputs don't have the ``fulltext``."""
+
+        hooks.emit("run_started", sixs=self)
+
+        try:
+            if approx is not None:
+                outputs = approx.approximate(self, tol)
+                if outputs is not None:
+                    self.outputs = outputs
+                    hooks.emit("run_approximated", sixs=self)
+                    return
+
+            key = None
+            if self.cache is not None:
+                key = self.cache.key(self)
+                outputs = self.cache.get(key)
+                if outputs is not None:
+                    self.outputs = outputs
+                    hooks.emit("cache_hit", sixs=self, key=key)
+                    return
+                hooks.emit("cache_miss", sixs=self, key=key)
+
+            if self.single_flight:
+                self._run_single_flight()
+            else:
+                self._run()
+
+            if key is not None:
+                self.cache.put(key, self.outputs)
+        except Error as e:
+            hooks.emit("run_failed", sixs=self, error=e)
+            raise
+
+    def _run_single_flight(self):
+        """Performs the work of :meth:`run`, sharing the execution with any identical run already in progress."""
+        start = time.perf_counter()
+        input_file = self.generate_input_file()
+        render_time = time.perf_counter() - start
+
+        key = (self.sixs_path, hashlib.sha256(input_file.encode("utf-8")).hexdigest())
+
+        with _in_flight_lock:
+            flight = _in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                _in_flight[key] = flight
+
+        if not leader:
+            wait = SINGLE_FLIGHT_WAIT if self.timeout is None else self.timeout
+            if flight.done.wait(wait):
+                if flight.error is not None:
+                    raise flight.error
+
+                if flight.outputs is not None:
+                    self.outputs = copy.deepcopy(flight.outputs)
+                    hooks.emit(
+                        "run_timings",
+                        timings=self.outputs.timings,
+                        sixs=self,
+                        input_file=input_file,
+                        shared=True,
+                    )
+                    return
+
+            # The other run was interrupted or is taking too long, so run 6S ourselves
+            self._run(input_file, render_time)
+            return
+
+        try:
+            self._run(input_file, render_time)
+            flight.outputs = self.outputs
+        except Error as e:
+            flight.error = e
+            raise
+        finally:
+            with _in_flight_lock:
+                del _in_flight[key]
+            flight.done.set()
+
+    def _run(self, input_file=None, render_time=0.0):
+        """Performs the work of :meth:`run`, without reporting the start or failure of the run to the hooks.
+
+        If the input file text has already been generated then it can be passed in, along with the time taken to
+        generate it."""
         if self.sixs_path is None:
             raise ExecutionError("6S executable not found.")
 
-        # Create the input file as a temporary file
-        tmp_file_name = self.write_input_file()
-
-        # Run the process and get the stdout from it
-        process = subprocess.Popen(
-            "%s < %s" % (self.sixs_path, tmp_file_name),
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        outputs = process.communicate()
-        self.outputs = Outputs(outputs[0], outputs[1])
+        timings = {}
+        start = time.perf_counter() - render_time
 
-        # Remove the temporary file
-        os.remove(tmp_file_name)
+        # Create the input file as a temporary file
+        if input_file is None:
+            input_file = self.generate_input_file()
+        tmp_file_name = self._write_input_file(input_file)
+        timings["render"] = time.perf_counter() - start
+
+        process = None
+        try:
+            # Run the process and get the stdout from it
+            stage_start = time.perf_counter()
+            with open(tmp_file_name, "rb") as stdin_file:
+                process = subprocess.Popen(
+                    [self.sixs_path],
+                    stdin=stdin_file,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                )
+            timings["spawn"] = time.perf_counter() - stage_start
+
+            stage_start = time.perf_counter()
+            try:
+                stdout, stderr, child_cpu = _communicate(process, self.timeout)
+            except subprocess.TimeoutExpired:
+                raise ExecutionTimeoutError(
+                    "6S did not finish within the timeout of %s seconds, and was stopped."
+                    % self.timeout
+                )
+            timings["execute"] = time.perf_counter() - stage_start
+            if child_cpu is not None:
+                timings["child_cpu"] = child_cpu
+        finally:
+            # Make sure that 6S never keeps running after we've given up on it (for example, if
+            # we've been interrupted), and that the temporary file is always removed
+            if process is not None and process.poll() is None:
+                process.kill()
+                process.wait()
+            os.remove(tmp_file_name)
+
+        self.outputs = Outputs(stdout, stderr, self.fulltext_policy)
 
         if self.outputs.version != SIXSVERSION:
             raise ExecutionError("Running unsupported 6SV version. Py6S requires 6SV1.1")
 
+        self.outputs.timings.update(timings)
+        self.outputs.timings["total"] = time.perf_counter() - start
+
+        hooks.emit("run_timings", timings=self.outputs.timings, sixs=self, input_file=input_file)
+
+    def correction_coefficients(self):
+        """Runs 6S to calculate the coefficients used for Lambertian atmospheric correction, and returns them as a
+        tuple of ``(xa, xb, xc)``.
+
+        These are the coefficients that 6S reports as ``coef_xa``, ``coef_xb`` and ``coef_xc``, and can be used to
+        correct a radiance ``L`` (in W/m^2/sr/um) to a surface reflectance with::
+
+          y = xa * L - xb
+          reflectance = y / (1 + xc * y)
+
+        which is what :meth:`apply_correction` does for whole arrays of radiances.
+
+        The ``atmos_corr`` parameter is ignored, and the ``outputs`` attribute is not changed. The results are cached,
+        so 6S is only run once for each set of parameters.
+
+        """
+        # A shallow copy is enough, as running only changes the outputs attribute
+        s = copy.copy(self)
+        s.outputs = None
+        s.atmos_corr = AtmosCorr.AtmosCorrLambertianFromRadiance(100.0)
+        key = s.generate_input_file()
+
+        with _coefficients_cache_lock:
+            coefficients = _coefficients_cache.get(key)
+            if coefficients is not None:
+                _coefficients_cache.move_to_end(key)
+                return coefficients
+
+        s.run()
+        coefficients = (s.outputs.coef_xa, s.outputs.coef_xb, s.outputs.coef_xc)
+
+        with _coefficients_cache_lock:
+            _coefficients_cache[key] = coefficients
+            while len(_coefficients_cache) > _COEFFICIENTS_CACHE_SIZE:
+                _coefficients_cache.popitem(last=False)
+
+        return coefficients
+
+    def apply_correction(self, radiance, out=None, chunk_size=CORRECTION_CHUNK_SIZE):
+        """Performs Lambertian atmospheric correction on an array of radiances, using the coefficients from
+        :meth:`correction_coefficients`.
+
+        The correction is done a chunk at a time, so the array can be a memory-mapped file (such as a
+        :class:`numpy.memmap`) which is too large to fit in memory.
+
+        Arguments:
+
+        * ``radiance`` -- A NumPy array of any shape containing radiances at the sensor, in W/m^2/sr/um
+        * ``out`` -- (Optional) An array of the same shape to put the results in, for example another
+          :class:`numpy.memmap`. If not given then a new array is created (with a floating point type of the same
+          precision as ``radiance``).
+        * ``chunk_size`` -- (Optional) The approximate number of values to correct at once
+
+        Return value:
+
+        An array of the same shape as ``radiance`` containing the atmospherically-corrected surface reflectances
+        (``out``, if it was given).
+
+        """
+        radiance = np.asanyarray(radiance)
+        if out is None:
+            out = np.empty(radiance.shape, dtype=np.result_type(radiance.dtype, np.float32))
+        elif out.shape != radiance.shape:
+            raise ParameterError("out", "Must have the same shape as the radiance array")
+
+        if chunk_size < 1:
+            raise ParameterError("chunk_size", "Must be at least 1")
+
+        xa, xb, xc = self.correction_coefficients()
+
+        if radiance.ndim == 0:
+            y = xa * radiance - xb
+            out[...] = y / (1 + xc * y)
+            return out
+
+        # Chunks are taken along the first axis, so that they are views of the arrays (and of
+        # contiguous regions of memory-mapped files)
+        rows = max(1, chunk_size // max(1, radiance[0].size))
+        for start in range(0, radiance.shape[0], rows):
+            y = xa * radiance[start : start + rows] - xb
+            out[start : start + rows] = y / (1 + xc * y)
+
+        return out
+
     def produce_debug_report(self):
         """Prints out information about the configuration of Py6S generally, and the current
         SixS object specifically, which will be useful when debugging problems."""
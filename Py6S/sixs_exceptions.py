@@ -73,3 +73,16 @@ class ExecutionError(Error):
 
     def __str__(self):
         return self.msg
+
+
+class ExecutionTimeoutError(ExecutionError):
+
+    """Exception raised when a 6S run takes longer than the allowed time, and has been stopped.
+
+    Call as:
+
+    ExecutionTimeoutError(message)
+
+    """
+
+    pass
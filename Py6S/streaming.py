@@ -0,0 +1,244 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Writing the results of large batches of runs to a Parquet or Arrow file as they finish, rather than keeping them
+all in memory.
+
+Pass a :class:`ResultWriter` as the ``writer`` argument of :func:`Py6S.batch.run_batch` (or of any of the helper
+functions), and a row is written for each run, containing the values of the chosen parameters and outputs. For
+example::
+
+  from Py6S.streaming import ResultWriter
+
+  with ResultWriter("sweep.parquet", parameters=["geometry.view_a", "geometry.view_z"]) as writer:
+      SixSHelpers.Angles.run360(s, "view", output_name=["pixel_radiance", "pixel_reflectance"], writer=writer)
+
+The file can then be read with any tool that understands Parquet, such as pandas::
+
+  df = pandas.read_parquet("sweep.parquet")
+
+Requires the pyarrow module to be installed.
+
+"""
+
+import numbers
+import os
+
+from .sixs_exceptions import ParameterError
+
+FORMATS = ("parquet", "arrow")
+
+_EXTENSIONS = {".arrow": "arrow", ".feather": "arrow", ".ipc": "arrow"}
+
+
+def _parameter_value(run, getter):
+    if callable(getter):
+        value = getter(run)
+    else:
+        value = run
+        for part in getter.split("."):
+            value = getattr(value, part)
+
+    if value is None or isinstance(value, (numbers.Number, str)):
+        return value
+    return str(value)
+
+
+class ResultWriter(object):
+
+    """Writes the results of runs to a Parquet or Arrow IPC file, a group of rows at a time.
+
+    Arguments:
+
+    * ``filename`` -- The file to write. Any existing file is replaced.
+    * ``parameters`` -- (Optional) The parameters of each run to store alongside its outputs, as a list of dotted
+      attribute paths of the :class:`.SixS` instance (for example ``geometry.view_z`` or ``aot550``), or a
+      dictionary mapping column names to such paths or to functions which are called with the :class:`.SixS`
+      instance and return the value to store.
+    * ``format`` -- (Optional) Either ``"parquet"`` or ``"arrow"``. By default this is chosen from the extension of
+      ``filename``, with ``.arrow``, ``.feather`` and ``.ipc`` files written in the Arrow format, and any others in
+      Parquet.
+    * ``row_group_size`` -- (Optional) The number of rows to hold in memory before writing them to the file as a
+      single row group (or Arrow record batch). Defaults to 10000.
+    * ``compression`` -- (Optional) The compression to use for Parquet files. Defaults to ``"snappy"``.
+
+    Each row contains the ``index`` of the run in the batch, the parameters, the outputs and an ``error`` column,
+    which is empty unless the run failed. Outputs are stored as numbers. Parameters are stored as numbers, unless
+    any run has a value for them which isn't a number, in which case all of their values are stored as text.
+    The writer must be closed once all of the results have been written (or used as a context manager), and the
+    file is written even if there were no results.
+
+    """
+
+    def __init__(
+        self, filename, parameters=None, format=None, row_group_size=10000, compression="snappy"
+    ):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError(
+                "You must install pyarrow to write results to a Parquet or Arrow file"
+            )
+        self._pyarrow = pyarrow
+
+        if format is None:
+            format = _EXTENSIONS.get(os.path.splitext(filename)[1].lower(), "parquet")
+        if format not in FORMATS:
+            raise ParameterError("format", "Must be one of: %s" % ", ".join(FORMATS))
+
+        if row_group_size < 1:
+            raise ParameterError("row_group_size", "Must be at least 1")
+
+        if parameters is None:
+            parameters = {}
+        elif not isinstance(parameters, dict):
+            parameters = dict((path, path) for path in parameters)
+
+        self.filename = filename
+        self.parameters = parameters
+        self.format = format
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.rows_written = 0
+
+        self._rows = []
+        self._schema = None
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self, runs, outputs):
+        """Sets the columns of the file before any rows are written. This is called by :func:`Py6S.batch.run_batch`.
+
+        Arguments:
+
+        * ``runs`` -- The :class:`.SixS` instances that will be run, from which the types of the parameters are found
+        * ``outputs`` -- The names of the output columns
+
+        """
+        string_parameters = set(
+            name
+            for name, getter in self.parameters.items()
+            if any(isinstance(_parameter_value(run, getter), str) for run in runs)
+        )
+        schema = self._create_schema(outputs, string_parameters)
+
+        if self._schema is None:
+            self._open(schema)
+        elif self._schema.names != schema.names:
+            raise ParameterError(
+                "outputs", "Must be the same as those already written to %s" % self.filename
+            )
+
+    def write(self, index, run, values, error=None):
+        """Adds a row for a run to the file.
+
+        Arguments:
+
+        * ``index`` -- The index of the run in its batch
+        * ``run`` -- The :class:`.SixS` instance, from which the parameters are taken
+        * ``values`` -- A dictionary of the outputs to store, keyed by column name
+        * ``error`` -- (Optional) The exception that the run failed with, if it failed
+
+        """
+        row = {"index": index}
+        for name, getter in self.parameters.items():
+            row[name] = _parameter_value(run, getter)
+        row.update(values)
+        row["error"] = None if error is None else "%s: %s" % (type(error).__name__, error)
+
+        self._rows.append(row)
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+
+    def _create_schema(self, outputs, string_parameters=()):
+        pa = self._pyarrow
+
+        fields = [pa.field("index", pa.int64())]
+        for name in self.parameters:
+            fields.append(
+                pa.field(name, pa.string() if name in string_parameters else pa.float64())
+            )
+        for name in outputs:
+            fields.append(pa.field(name, pa.float64()))
+        fields.append(pa.field("error", pa.string()))
+
+        return pa.schema(fields)
+
+    def _open(self, schema):
+        self._schema = schema
+        if self.format == "parquet":
+            import pyarrow.parquet
+
+            self._writer = pyarrow.parquet.ParquetWriter(
+                self.filename, schema, compression=self.compression
+            )
+        else:
+            import pyarrow.ipc
+
+            self._writer = pyarrow.ipc.new_file(self.filename, schema)
+
+    def flush(self):
+        """Writes the rows held in memory to the file."""
+        if not self._rows:
+            return
+
+        pa = self._pyarrow
+
+        if self._schema is None:
+            # Rows written without calling start first, so the columns are taken from them
+            outputs = [
+                name
+                for name in self._rows[0]
+                if name not in self.parameters and name not in ("index", "error")
+            ]
+            string_parameters = set(
+                name
+                for name in self.parameters
+                if any(isinstance(row.get(name), str) for row in self._rows)
+            )
+            self._open(self._create_schema(outputs, string_parameters))
+
+        columns = {}
+        for field in self._schema:
+            values = [row.get(field.name) for row in self._rows]
+            if field.type == pa.string():
+                values = [None if value is None else str(value) for value in values]
+            columns[field.name] = values
+
+        table = pa.Table.from_pydict(columns, schema=self._schema)
+        if self.format == "parquet":
+            self._writer.write_table(table, row_group_size=len(self._rows))
+        else:
+            self._writer.write_table(table)
+
+        self.rows_written += len(self._rows)
+        self._rows = []
+
+    def close(self):
+        """Writes any rows held in memory and closes the file."""
+        self.flush()
+        if self._schema is None:
+            # Nothing has been written, so write an empty file with just the index, parameters and error
+            self._open(self._create_schema([]))
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
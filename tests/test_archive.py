@@ -0,0 +1,133 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from Py6S import OutputParsingError, SixS
+from Py6S.archive import ArchiveReader, ArchiveWriter
+from Py6S.batch import run_batch
+
+
+def deck_hash(deck):
+    return hashlib.sha256(deck.encode("utf-8")).hexdigest()
+
+
+class ArchiveTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "runs.py6s")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_runs(self, n, chunk_size=3):
+        with ArchiveWriter(self.filename, chunk_size=chunk_size) as archive:
+            for i in range(n):
+                archive.add_text("deck %d\n" % i, "output %d\n" % i)
+
+    def test_read_text(self):
+        self.write_runs(10)
+
+        with ArchiveReader(self.filename) as archive:
+            self.assertEqual(len(archive), 10)
+            self.assertEqual(archive.keys()[0], deck_hash("deck 0\n"))
+            self.assertEqual(archive.read(deck_hash("deck 7\n")), ("deck 7\n", "output 7\n"))
+            self.assertNotIn(deck_hash("deck 10\n"), archive)
+
+            with self.assertRaises(KeyError):
+                archive.read(deck_hash("deck 10\n"))
+
+    def test_duplicates_stored_once(self):
+        with ArchiveWriter(self.filename) as archive:
+            self.assertTrue(archive.add_text("deck\n", "first\n"))
+            self.assertFalse(archive.add_text("deck\n", "second\n"))
+
+        with ArchiveReader(self.filename) as archive:
+            self.assertEqual(len(archive), 1)
+            self.assertEqual(archive.read(deck_hash("deck\n"))[1], "first\n")
+
+    def test_append(self):
+        self.write_runs(4)
+
+        with ArchiveWriter(self.filename) as archive:
+            self.assertIn(deck_hash("deck 2\n"), archive)
+            self.assertFalse(archive.add_text("deck 2\n", "output 2\n"))
+            archive.add_text("new deck\n", "new output\n")
+
+        with ArchiveReader(self.filename) as archive:
+            self.assertEqual(len(archive), 5)
+            self.assertEqual(archive.read(deck_hash("new deck\n"))[1], "new output\n")
+
+    def test_partial_chunk_ignored(self):
+        self.write_runs(6)
+        size = os.path.getsize(self.filename)
+        with open(self.filename, "r+b") as f:
+            f.truncate(size - 5)
+
+        with ArchiveReader(self.filename) as archive:
+            self.assertEqual(len(archive), 3)
+
+        with ArchiveWriter(self.filename) as archive:
+            archive.add_text("deck 5\n", "output 5\n")
+
+        with ArchiveReader(self.filename) as archive:
+            self.assertEqual(len(archive), 4)
+            self.assertEqual(archive.read(deck_hash("deck 5\n"))[1], "output 5\n")
+
+    def test_not_an_archive(self):
+        with open(self.filename, "w") as f:
+            f.write("Some other file")
+
+        with self.assertRaises(OutputParsingError):
+            ArchiveReader(self.filename)
+
+    def test_archive_runs(self):
+        runs = [SixS() for i in range(3)]
+        for i, run in enumerate(runs):
+            run.aot550 = 0.1 * (i + 1)
+
+        with ArchiveWriter(self.filename) as archive:
+            archive.enable()
+            run_batch(runs)
+
+        with ArchiveReader(self.filename) as archive:
+            keys = [run.input_hash() for run in reversed(runs)]
+            outputs = archive.load_outputs(keys, fulltext_policy="compress")
+
+            for run, output in zip(reversed(runs), outputs):
+                self.assertEqual(output.pixel_radiance, run.outputs.pixel_radiance)
+                self.assertEqual(output.fulltext, run.outputs.fulltext)
+
+    def test_dropped_fulltext(self):
+        s = SixS()
+        s.fulltext_policy = "drop"
+
+        with ArchiveWriter(self.filename) as archive:
+            archive.enable()
+            try:
+                with self.assertWarns(UserWarning):
+                    s.run()
+            finally:
+                archive.disable()
+
+        self.assertGreater(s.outputs.pixel_radiance, 0)
+        with ArchiveReader(self.filename) as archive:
+            self.assertEqual(len(archive), 0)
@@ -0,0 +1,107 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import numpy as np
+
+from Py6S import ExecutionError, OutputParsingError, ParameterError, SixS
+from Py6S.arrayjobs import ingest_outputs, read_manifest, write_batch
+from Py6S.batch import RunFailure, results_array, run_batch
+from Py6S.sixs_exceptions import Error
+
+
+class ArrayJobTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        self.runs = [SixS() for i in range(5)]
+        for i, run in enumerate(self.runs):
+            run.aot550 = 0.1 * (i + 1)
+
+        write_batch(self.runs, self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_tasks(self, first, count):
+        env = dict(os.environ, SIXS=self.runs[0].sixs_path)
+        subprocess.check_call(
+            ["sh", os.path.join(self.directory, "run_task.sh"), str(first), str(count)], env=env
+        )
+
+    def test_manifest(self):
+        manifest = read_manifest(self.directory)
+
+        self.assertEqual(manifest["count"], 5)
+        self.assertEqual(manifest["runs"][2]["hash"], self.runs[2].input_hash())
+        with open(os.path.join(self.directory, manifest["runs"][2]["input"])) as f:
+            self.assertEqual(f.read(), self.runs[2].generate_input_file())
+
+    def test_ingest(self):
+        self.run_tasks(0, 3)
+        self.run_tasks(3, 10)
+
+        names = ["pixel_radiance", "transmittance_total_scattering.total"]
+        results = ingest_outputs(self.directory, output_name=names)
+        expected = run_batch(self.runs, output_name=names)
+
+        self.assertFalse(np.any(results.mask))
+        np.testing.assert_allclose(results, expected)
+        self.assertEqual(results_array(results, names)["pixel_radiance"].shape, (5,))
+
+    def test_missing_and_failed(self):
+        self.run_tasks(0, 3)
+        with open(os.path.join(self.directory, "outputs", "000001.txt"), "w") as f:
+            f.write("Not a 6S output")
+
+        results = ingest_outputs(self.directory, output_name="pixel_radiance")
+        np.testing.assert_array_equal(results.mask, [False, True, False, True, True])
+
+        results = ingest_outputs(self.directory, on_error="collect")
+        self.assertGreater(results[0].pixel_radiance, 0)
+        self.assertIsInstance(results[1], RunFailure)
+        self.assertIsInstance(results[1].error, OutputParsingError)
+        self.assertIsInstance(results[3].error, ExecutionError)
+        self.assertEqual(results[3].input_file, self.runs[3].generate_input_file())
+
+        with self.assertRaises(Error):
+            ingest_outputs(self.directory, on_error="raise")
+
+    def test_stale_outputs(self):
+        self.run_tasks(0, 5)
+        with open(os.path.join(self.directory, "outputs", "000002.sha256"), "w") as f:
+            f.write(self.runs[0].input_hash())
+
+        results = ingest_outputs(self.directory, on_error="collect")
+        self.assertGreater(results[1].pixel_radiance, 0)
+        self.assertIsInstance(results[2], RunFailure)
+        self.assertIsInstance(results[2].error, ExecutionError)
+
+        # Writing a new batch to the directory removes the outputs of the old one
+        write_batch(self.runs[:3], self.directory)
+        self.assertEqual(os.listdir(os.path.join(self.directory, "outputs")), [])
+        results = ingest_outputs(self.directory, output_name="pixel_radiance")
+        np.testing.assert_array_equal(results.mask, [True, True, True])
+
+    def test_no_manifest(self):
+        with self.assertRaises(ParameterError):
+            ingest_outputs(os.path.join(self.directory, "inputs"))
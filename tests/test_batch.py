@@ -0,0 +1,309 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import threading
+import unittest
+
+import numpy as np
+import pytest
+
+import Py6S.sixs as sixs_module
+from Py6S import ExecutionError, OutputParsingError, Outputs, ParameterError, SixS, hooks
+from Py6S.batch import RunFailure, results_array, results_dataset, run_batch
+
+
+def broken_sixs():
+    s = SixS()
+    s.sixs_path = None
+    return s
+
+
+class ErrorPolicyTests(unittest.TestCase):
+    def test_raise(self):
+        with self.assertRaises(ExecutionError):
+            run_batch([SixS(), broken_sixs()], output_name="apparent_radiance")
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ParameterError):
+            run_batch([SixS()], on_error="ignore")
+
+    def test_mask(self):
+        results = run_batch(
+            [SixS(), broken_sixs(), SixS()], output_name="apparent_radiance", on_error="mask"
+        )
+
+        self.assertEqual(list(results.mask), [False, True, False])
+        self.assertTrue(np.isnan(results.data[1]))
+        self.assertEqual(results[0], results[2])
+
+    def test_mask_outputs(self):
+        results = run_batch([broken_sixs(), broken_sixs()], on_error="mask")
+
+        self.assertTrue(np.all(results.mask))
+        self.assertIsNone(results.data[0])
+
+    def test_collect(self):
+        s = broken_sixs()
+        results = run_batch([s], output_name="apparent_radiance", on_error="collect")
+
+        self.assertIsInstance(results[0], RunFailure)
+        self.assertIsInstance(results[0].error, ExecutionError)
+        self.assertEqual(results[0].input_file, s.generate_input_file())
+
+    def test_collect_dataset(self):
+        pytest.importorskip("xarray")
+        results = run_batch(
+            [SixS(), broken_sixs()],
+            output_name=["apparent_radiance", "pixel_radiance"],
+            on_error="collect",
+        )
+
+        dataset = results_dataset(
+            results, ["apparent_radiance", "pixel_radiance"], ["run"], {"run": [0, 1]}
+        )
+        self.assertEqual(dataset.apparent_radiance.values[0], results[0][0])
+        self.assertTrue(np.isnan(dataset.apparent_radiance.values[1]))
+        self.assertTrue(np.isnan(dataset.pixel_radiance.values[1]))
+
+
+class RetryTests(unittest.TestCase):
+    def test_retries(self):
+        events = []
+
+        def hook(event, info):
+            if event == "run_started":
+                events.append(event)
+
+        hooks.add_hook(hook)
+        try:
+            with self.assertRaises(ExecutionError):
+                run_batch([broken_sixs()], retries=2, backoff=0)
+        finally:
+            hooks.remove_hook(hook)
+
+        self.assertEqual(len(events), 3)
+
+
+class MultipleOutputTests(unittest.TestCase):
+    def test_list(self):
+        names = ["apparent_radiance", "transmittance_total_scattering.total"]
+        runs = [SixS(), SixS()]
+        results = results_array(run_batch(runs, output_name=names), names)
+
+        self.assertEqual(sorted(results.keys()), sorted(names))
+        self.assertEqual(results["apparent_radiance"].shape, (2,))
+        self.assertEqual(
+            results["transmittance_total_scattering.total"][0],
+            runs[0].outputs.transmittance_total_scattering.total,
+        )
+
+    def test_dict_masked(self):
+        names = {"rad": "apparent_radiance", "sph": "spherical_albedo.total"}
+        results = run_batch([SixS(), broken_sixs()], output_name=names, on_error="mask")
+        results = results_array(results, names)
+
+        self.assertEqual(sorted(results.keys()), ["rad", "sph"])
+        self.assertEqual(list(results["sph"].mask), [False, True])
+
+    def test_keep_outputs(self):
+        s = SixS()
+        run_batch([s], output_name="apparent_radiance", keep_outputs=False)
+
+        self.assertIsNone(s.outputs)
+
+
+def count_events(name, func):
+    events = []
+
+    def hook(event, info):
+        if event == name:
+            events.append(info)
+
+    hooks.add_hook(hook)
+    try:
+        result = func()
+    finally:
+        hooks.remove_hook(hook)
+
+    return result, len(events)
+
+
+class DeduplicationTests(unittest.TestCase):
+    def test_duplicates_run_once(self):
+        runs = [broken_sixs(), broken_sixs(), broken_sixs()]
+        runs[2].aot550 = 0.1
+
+        results, started = count_events("run_started", lambda: run_batch(runs, on_error="collect"))
+
+        self.assertEqual(started, 2)
+        self.assertEqual(len(results), 3)
+        self.assertIs(results[0], results[1])
+        self.assertIsNot(results[0], results[2])
+
+    def test_no_deduplication(self):
+        runs = [broken_sixs(), broken_sixs()]
+
+        results, started = count_events(
+            "run_started", lambda: run_batch(runs, on_error="collect", deduplicate=False)
+        )
+
+        self.assertEqual(started, 2)
+
+    def test_duplicate_outputs(self):
+        runs = [SixS(), SixS()]
+        results = run_batch(runs, output_name="apparent_radiance")
+
+        self.assertEqual(results[0], results[1])
+        self.assertIsNot(runs[0].outputs, runs[1].outputs)
+        self.assertEqual(runs[0].outputs.apparent_radiance, runs[1].outputs.apparent_radiance)
+
+        runs = [SixS(), SixS()]
+        results = run_batch(runs)
+        self.assertIs(results[1], runs[1].outputs)
+        self.assertIsNot(results[0], results[1])
+
+    def test_failed_duplicate_outputs(self):
+        s = SixS()
+        s.run()
+        runs = [broken_sixs(), broken_sixs()]
+        runs[1].outputs = s.outputs
+        results = run_batch(runs, on_error="collect")
+
+        self.assertIsInstance(results[1], RunFailure)
+        self.assertIs(results[0], results[1])
+        self.assertIsNone(runs[1].outputs)
+
+    def test_input_hash(self):
+        a, b = SixS(), SixS()
+        self.assertEqual(a.input_hash(), b.input_hash())
+
+        b.aot550 = 0.1
+        self.assertNotEqual(a.input_hash(), b.input_hash())
+
+
+class SingleFlightTests(unittest.TestCase):
+    def test_concurrent_identical_runs(self):
+        runs = [SixS() for i in range(4)]
+        for run in runs:
+            run.single_flight = True
+        events = []
+
+        def hook(event, info):
+            if event == "run_timings":
+                events.append(info.get("shared", False))
+
+        threads = [threading.Thread(target=run.run) for run in runs]
+        hooks.add_hook(hook)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            hooks.remove_hook(hook)
+
+        self.assertEqual(len(events), 4)
+        self.assertGreaterEqual(events.count(False), 1)
+        for run in runs:
+            self.assertEqual(run.outputs.apparent_radiance, runs[0].outputs.apparent_radiance)
+        for run in runs[1:]:
+            self.assertIsNot(run.outputs, runs[0].outputs)
+
+    def test_off_by_default(self):
+        self.assertFalse(SixS().single_flight)
+
+    def test_stuck_run(self):
+        # An identical run which never finishes must not block other runs forever
+        s = SixS()
+        s.single_flight = True
+        s.timeout = 0.1
+        input_file = s.generate_input_file()
+        key = (s.sixs_path, hashlib.sha256(input_file.encode("utf-8")).hexdigest())
+
+        with sixs_module._in_flight_lock:
+            sixs_module._in_flight[key] = sixs_module._Flight()
+        try:
+            s.run()
+        finally:
+            with sixs_module._in_flight_lock:
+                del sixs_module._in_flight[key]
+
+        self.assertGreater(s.outputs.apparent_radiance, 0)
+
+
+class ProcessBackendTests(unittest.TestCase):
+    def make_runs(self):
+        runs = [SixS() for i in range(4)]
+        for i, run in enumerate(runs):
+            run.aot550 = 0.1 * (i + 1)
+        return runs
+
+    def test_matches_thread_backend(self):
+        names = ["pixel_radiance", "transmittance_total_scattering.total", "solar_z"]
+        expected = run_batch(self.make_runs(), output_name=names)
+
+        for shared in (False, True):
+            results = run_batch(
+                self.make_runs(), output_name=names, backend="process", shared_memory=shared
+            )
+            np.testing.assert_allclose(results, expected)
+
+    def test_outputs_rebuilt(self):
+        runs = self.make_runs()
+        results = run_batch(runs, backend="process")
+
+        self.assertIs(runs[0].outputs, results[0])
+        self.assertEqual(results[0].version, "1.1")
+        self.assertIsInstance(results[0].view_a, int)
+
+    def test_failures_collected(self):
+        results = run_batch([broken_sixs()], backend="process", on_error="collect")
+
+        self.assertIsInstance(results[0], RunFailure)
+        self.assertIsInstance(results[0].error, ExecutionError)
+
+    def test_invalid_backend(self):
+        with self.assertRaises(ParameterError):
+            run_batch([SixS()], backend="cluster")
+
+
+class FulltextPolicyTests(unittest.TestCase):
+    def tearDown(self):
+        Outputs.fulltext_policy = "keep"
+
+    def test_batch_policy(self):
+        runs = [SixS(), SixS()]
+        runs[1].aot550 = 0.5
+        results = run_batch(runs, fulltext_policy="drop")
+
+        for outputs in results:
+            self.assertGreater(outputs.apparent_radiance, 0)
+            with self.assertRaises(OutputParsingError):
+                outputs.fulltext
+
+    def test_global_policy(self):
+        Outputs.fulltext_policy = "compress"
+        s = SixS()
+        s.run()
+
+        self.assertIsNone(s.outputs._fulltext)
+        self.assertIn("6SV version", s.outputs.fulltext)
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ParameterError):
+            run_batch([SixS()], fulltext_policy="shred")
@@ -0,0 +1,79 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pytest
+
+from Py6S import ParameterError, SixS
+from Py6S.bulk import read_outputs
+
+
+class ReadOutputsTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        self.runs = [SixS() for i in range(3)]
+        for i, run in enumerate(self.runs):
+            run.aot550 = 0.1 * (i + 1)
+            run.run()
+            run.outputs.write_output_file(os.path.join(self.directory, "output_%d.txt" % i))
+
+        with open(os.path.join(self.directory, "output_bad.txt"), "w") as f:
+            f.write("Not a 6S output")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_directory(self):
+        table = read_outputs(self.directory)
+
+        self.assertEqual(len(table), 3)
+        self.assertEqual(len(table.skipped), 1)
+        self.assertTrue(table.skipped[0][0].endswith("output_bad.txt"))
+        np.testing.assert_allclose(
+            table["pixel_radiance"], [run.outputs.pixel_radiance for run in self.runs]
+        )
+
+    def test_glob_and_names(self):
+        table = read_outputs(
+            os.path.join(self.directory, "output_[01].txt"),
+            output_name={"radiance": "pixel_radiance", "t": "transmittance_total_scattering.total"},
+        )
+
+        self.assertEqual(list(table.columns.keys()), ["radiance", "t"])
+        self.assertEqual(table["t"][1], self.runs[1].outputs.transmittance_total_scattering.total)
+
+    def test_unknown_output(self):
+        with self.assertRaises(ParameterError):
+            read_outputs(self.directory, output_name="fulltext")
+
+    def test_parquet(self):
+        pytest.importorskip("pyarrow")
+        pandas = pytest.importorskip("pandas")
+
+        table = read_outputs(self.directory, output_name=["pixel_radiance", "solar_z"])
+        filename = os.path.join(self.directory, "outputs.parquet")
+        table.to_parquet(filename)
+
+        df = pandas.read_parquet(filename)
+        self.assertEqual(list(df.columns), ["filename", "pixel_radiance", "solar_z"])
+        np.testing.assert_allclose(df["pixel_radiance"], table["pixel_radiance"])
@@ -0,0 +1,232 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from Py6S import ExecutionError, GroundReflectance, ParameterError, SixS
+from Py6S.cache import Cache, CacheServer, RemoteCache, ResultCache, SQLiteCache, canonical_key
+from Py6S.metrics import MetricsRegistry
+
+
+class CanonicalKeyTests(unittest.TestCase):
+    def test_small_differences(self):
+        s1 = SixS()
+        s2 = SixS()
+        # These are written to the input file as 32.000001 and 32.000000
+        s1.geometry.solar_z = 32.0000006
+        s2.geometry.solar_z = 32.0000004
+        s2.aot550 += 1e-5
+
+        self.assertNotEqual(s1.input_hash(), s2.input_hash())
+        self.assertEqual(canonical_key(s1), canonical_key(s2))
+
+    def test_steps(self):
+        s1 = SixS()
+        s2 = SixS()
+        s2.geometry.view_z += 0.04
+
+        self.assertNotEqual(canonical_key(s1), canonical_key(s2))
+        self.assertEqual(canonical_key(s1, {"angle": 0.1}), canonical_key(s2, {"angle": 0.1}))
+        self.assertNotEqual(canonical_key(s1, {"angle": 0.1}), canonical_key(s1))
+
+    def test_reflectance(self):
+        s1 = SixS()
+        s2 = SixS()
+        s1.ground_reflectance = GroundReflectance.HomogeneousLambertian(0.3)
+        s2.ground_reflectance = GroundReflectance.HomogeneousLambertian(0.30000001)
+
+        self.assertEqual(canonical_key(s1), canonical_key(s2))
+
+        s2.ground_reflectance = GroundReflectance.HomogeneousLambertian(0.31)
+        self.assertNotEqual(canonical_key(s1), canonical_key(s2))
+
+    def test_codes_not_rounded(self):
+        s1 = SixS()
+        s2 = SixS()
+        s2.geometry.month = 8
+
+        self.assertNotEqual(canonical_key(s1, {"angle": 10}), canonical_key(s2, {"angle": 10}))
+
+    def test_executable(self):
+        directory = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(directory, name) for name in ("a", "b", "c")]
+            for path, build in zip(paths, (b"build 1", b"build 1", b"build 2")):
+                with open(path, "wb") as f:
+                    f.write(build)
+
+            keys = []
+            for path in paths:
+                s = SixS()
+                s.sixs_path = path
+                keys.append(canonical_key(s))
+        finally:
+            shutil.rmtree(directory)
+
+        # The same build in different places shares keys, but different builds don't
+        self.assertEqual(keys[0], keys[1])
+        self.assertNotEqual(keys[0], keys[2])
+
+    def test_invalid_steps(self):
+        with self.assertRaises(ParameterError):
+            canonical_key(SixS(), {"pressure": 1})
+        with self.assertRaises(ParameterError):
+            ResultCache(steps={"angle": 0})
+
+
+class CacheInterfaceTests(unittest.TestCase):
+    def test_incomplete_cache(self):
+        class IncompleteCache(Cache):
+            def put(self, key, outputs):
+                pass
+
+        with self.assertRaises(TypeError):
+            IncompleteCache()
+
+
+class ResultCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.registry.enable()
+
+    def tearDown(self):
+        self.registry.disable()
+
+    def test_run(self):
+        cache = ResultCache(steps={"angle": 0.1})
+
+        s = SixS()
+        s.cache = cache
+        s.run()
+        first = s.outputs
+
+        s.geometry.solar_z += 0.01
+        s.run()
+        self.assertIsNot(s.outputs, first)
+        self.assertEqual(s.outputs.pixel_radiance, first.pixel_radiance)
+
+        s.geometry.solar_z += 1
+        s.run()
+        self.assertIsNot(s.outputs, first)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(self.registry.cache_requests.get(result="hit"), 1)
+        self.assertEqual(self.registry.cache_requests.get(result="miss"), 2)
+        self.assertEqual(self.registry.runs_completed.get(), 2)
+
+    def test_copies(self):
+        cache = ResultCache()
+        s = SixS()
+        s.run()
+        cache.put("a", s.outputs)
+
+        s.outputs.values["pixel_radiance"] = -1.0
+        outputs = cache.get("a")
+        self.assertGreater(outputs.pixel_radiance, 0)
+
+        outputs.values["pixel_radiance"] = -1.0
+        self.assertGreater(cache.get("a").pixel_radiance, 0)
+
+    def test_size(self):
+        cache = ResultCache(size=2)
+        for i in range(3):
+            cache.put(str(i), i)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("0"))
+        self.assertEqual(cache.get("2"), 2)
+
+    def test_failed_run_not_cached(self):
+        s = SixS()
+        s.sixs_path = None
+        s.cache = ResultCache()
+
+        with self.assertRaises(ExecutionError):
+            s.run()
+        self.assertEqual(len(s.cache), 0)
+
+
+class SharedCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = os.path.join(self.directory, "cache.db")
+
+        self.s = SixS()
+        self.s.run()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sqlite(self):
+        cache = SQLiteCache(self.database)
+        cache.put("a", self.s.outputs)
+
+        # A separate connection, as another process would have
+        other = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(len(other), 1)
+        self.assertEqual(list(other.get_many(["a", "b"]).keys()), ["a"])
+        self.assertEqual(other.get("a").pixel_radiance, self.s.outputs.pixel_radiance)
+        self.assertIsNone(other.get("b"))
+
+        other.close()
+        cache.close()
+
+    def test_run_with_sqlite(self):
+        cache = SQLiteCache(self.database)
+
+        s = SixS()
+        s.cache = cache
+        s.run()
+        s.run()
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(s.outputs.pixel_radiance, self.s.outputs.pixel_radiance)
+        self.assertEqual(s.outputs.fulltext, "")
+        cache.close()
+
+    def test_server(self):
+        server = CacheServer(ResultCache(), token="secret")
+        url = server.serve(addr="127.0.0.1")
+        try:
+            remote = RemoteCache(url, token="secret")
+            remote.put("a", self.s.outputs)
+
+            self.assertEqual(len(server.cache), 1)
+            self.assertEqual(remote.get("a").pixel_radiance, self.s.outputs.pixel_radiance)
+            self.assertEqual(remote.get_many(["b"]), {})
+
+            # Without the token nothing is found or stored
+            remote = RemoteCache(url)
+            self.assertIsNone(remote.get("a"))
+            remote.put("b", self.s.outputs)
+            self.assertEqual(len(server.cache), 1)
+        finally:
+            server.shutdown()
+
+    def test_server_unavailable(self):
+        server = CacheServer(ResultCache())
+        url = server.serve(addr="127.0.0.1")
+        server.shutdown()
+
+        s = SixS()
+        s.cache = RemoteCache(url, timeout=1)
+        s.run()
+        self.assertEqual(s.outputs.pixel_radiance, self.s.outputs.pixel_radiance)
@@ -0,0 +1,187 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from Py6S import ExecutionError, ParameterError, SixS, SixSHelpers, hooks
+from Py6S.batch import run_batch
+from Py6S.distributed import Coordinator, Worker
+from Py6S.sixs_exceptions import Error
+
+# The longest time (in seconds) that a test waits for the workers to finish a job
+WAIT_TIMEOUT = 60.0
+
+requires_6s = unittest.skipIf(SixS().sixs_path is None, "6S executable not found")
+
+
+def run_worker(url):
+    Worker(url, n=2, poll_interval=0.05, idle_timeout=1.0).run()
+
+
+class CoordinatorTests(unittest.TestCase):
+    def setUp(self):
+        self.coordinator = Coordinator(lease_time=60.0)
+
+    def tearDown(self):
+        self.coordinator.close()
+
+    def test_claim_and_complete(self):
+        ids = self.coordinator.submit(["deck 1", "deck 2"], timeout=10.0)
+
+        jobs = self.coordinator.claim("worker", count=5)
+        self.assertEqual([job["id"] for job in jobs], ids)
+        self.assertEqual(jobs[0]["deck"], "deck 1")
+        self.assertEqual(jobs[0]["timeout"], 10.0)
+        self.assertEqual(self.coordinator.claim("worker"), [])
+
+        self.coordinator.complete(ids[0], vector=[1.0, 2.0])
+        self.coordinator.complete(ids[1], error_type="OutputParsingError", error="Bad output")
+
+        results = self.coordinator.results(ids)
+        np.testing.assert_array_equal(results[ids[0]][0], [1.0, 2.0])
+        self.assertEqual(str(results[ids[1]][1]), "Bad output")
+        self.assertEqual(self.coordinator.counts()["done"], 1)
+
+    def test_retries(self):
+        (job_id,) = self.coordinator.submit(["deck"], retries=1)
+
+        self.coordinator.claim("worker")
+        self.coordinator.complete(job_id, error_type="ExecutionError", error="Crashed")
+        self.assertEqual(self.coordinator.results([job_id]), {})
+
+        self.coordinator.claim("worker")
+        self.coordinator.complete(job_id, error_type="ExecutionError", error="Crashed")
+        self.assertIsInstance(self.coordinator.results([job_id])[job_id][1], ExecutionError)
+
+    def test_expired_lease(self):
+        self.coordinator.lease_time = 0.0
+        (job_id,) = self.coordinator.submit(["deck"])
+
+        self.coordinator.claim("worker 1")
+        self.assertEqual(self.coordinator.claim("worker 2")[0]["id"], job_id)
+
+    def test_persistent(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "jobs.db")
+            coordinator = Coordinator(filename)
+            ids = coordinator.submit(["deck 1", "deck 2"])
+            coordinator.close()
+
+            coordinator = Coordinator(filename)
+            self.assertEqual(coordinator.counts(ids)["pending"], 2)
+            coordinator.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+@requires_6s
+class WorkerTests(unittest.TestCase):
+    def test_run_timings_input_file(self):
+        s = SixS()
+        s.geometry.view_z = 10
+        deck = s.generate_input_file()
+        events = []
+
+        def hook(event, info):
+            if event == "run_timings":
+                events.append(info)
+
+        hooks.add_hook(hook)
+        try:
+            result = Worker("http://127.0.0.1:1").run_job({"id": 1, "deck": deck, "timeout": None})
+        finally:
+            hooks.remove_hook(hook)
+
+        self.assertIn("vector", result)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["input_file"], deck)
+
+
+@requires_6s
+class DistributedBackendTests(unittest.TestCase):
+    def setUp(self):
+        self.coordinator = Coordinator()
+        url = self.coordinator.serve(0, "127.0.0.1")
+
+        self.workers = [multiprocessing.Process(target=run_worker, args=(url,)) for i in range(2)]
+        for worker in self.workers:
+            worker.start()
+
+    def wait_for(self, func, *args, **kwargs):
+        """Calls the function in a thread, failing the test if it doesn't return within WAIT_TIMEOUT."""
+        results = []
+        thread = threading.Thread(target=lambda: results.append(func(*args, **kwargs)), daemon=True)
+        thread.start()
+        thread.join(WAIT_TIMEOUT)
+        if not results:
+            self.fail("The batch was not finished within %s seconds" % WAIT_TIMEOUT)
+        return results[0]
+
+    def tearDown(self):
+        for worker in self.workers:
+            worker.join(WAIT_TIMEOUT)
+            if worker.is_alive():
+                worker.terminate()
+        self.coordinator.close()
+
+    def test_matches_thread_backend(self):
+        runs = [SixS() for i in range(4)]
+        for i, run in enumerate(runs):
+            run.aot550 = 0.1 * (i + 1)
+
+        names = ["pixel_radiance", "transmittance_total_scattering.total"]
+        expected = run_batch(runs, output_name=names)
+        results = self.wait_for(
+            run_batch, runs, output_name=names, backend="distributed", coordinator=self.coordinator
+        )
+        np.testing.assert_allclose(results, expected)
+
+        wavelengths, values = self.wait_for(
+            SixSHelpers.Wavelengths.run_wavelengths,
+            SixS(),
+            [0.5, 0.6],
+            output_name="pixel_radiance",
+            backend="distributed",
+            coordinator=self.coordinator,
+        )
+        self.assertEqual(len(values), 2)
+
+    def test_failed_job(self):
+        (job_id,) = self.coordinator.submit(["Not a 6S input file"])
+
+        deadline = time.time() + WAIT_TIMEOUT
+        results = {}
+        while not results:
+            if time.time() > deadline:
+                self.fail("The job was not finished within %s seconds" % WAIT_TIMEOUT)
+            time.sleep(0.05)
+            results = self.coordinator.results([job_id])
+
+        self.assertIsInstance(results[job_id][1], Error)
+
+    def test_coordinator_required(self):
+        with self.assertRaises(ParameterError):
+            run_batch([SixS()], backend="distributed")
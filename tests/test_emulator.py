@@ -0,0 +1,94 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+
+import numpy as np
+
+from Py6S import ParameterError, SixS
+from Py6S.emulator import Emulator, latin_hypercube
+
+
+class EmulatorTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.emulator = Emulator.train(
+            SixS(),
+            OrderedDict([("geometry.solar_z", (0, 60)), ("aot550", (0.1, 0.8))]),
+            100,
+            ["pixel_radiance", "apparent_reflectance"],
+            degree=4,
+            seed=1,
+        )
+
+    def test_validation(self):
+        self.assertEqual(list(self.emulator.validation.keys()), self.emulator.outputs)
+        for errors in self.emulator.validation.values():
+            self.assertEqual(sorted(errors.keys()), ["max_error", "max_relative_error", "rmse"])
+            self.assertLess(errors["max_relative_error"], 0.05)
+
+    def test_predict(self):
+        s = SixS()
+        s.geometry.solar_z = 37.3
+        s.aot550 = 0.33
+        s.run()
+
+        predicted = self.emulator.predict({"geometry.solar_z": [37.3], "aot550": [0.33]})
+        self.assertEqual(predicted.shape, (1, 2))
+        self.assertAlmostEqual(predicted[0, 0] / s.outputs.pixel_radiance, 1, places=2)
+
+        with self.assertRaises(ParameterError):
+            self.emulator.predict({"aot550": [0.33]})
+
+    def test_save_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "emulator.npz")
+            self.emulator.save(filename)
+            emulator = Emulator.load(filename)
+        finally:
+            shutil.rmtree(directory)
+
+        points = latin_hypercube([(0, 60), (0.1, 0.8)], 10, seed=2)
+        np.testing.assert_allclose(emulator.predict(points), self.emulator.predict(points))
+        self.assertEqual(emulator.validation, self.emulator.validation)
+
+    def test_fit(self):
+        points = latin_hypercube([(-1, 1), (0, 2)], 50, seed=3)
+        values = np.stack(
+            [points[:, 0] ** 2 + points[:, 1], 3 * points[:, 0] * points[:, 1]], axis=1
+        )
+        values[0] = np.nan
+
+        emulator = Emulator.fit(points, values, ["a", "b"], ["x", "y"], degree=2, holdout=0)
+        self.assertIsNone(emulator.validation)
+        np.testing.assert_allclose(emulator.predict([[0.5, 1.0]]), [[1.25, 1.5]], atol=1e-6)
+
+        with self.assertRaises(ParameterError):
+            Emulator.fit(points[:5], values[:5], ["a", "b"], ["x", "y"], degree=2)
+
+    def test_ridge_unbiased(self):
+        # With the constant term unpenalised, the residuals of a ridge fit still average to zero
+        points = np.linspace(-1, 1, 41)[:, np.newaxis]
+        values = 3 + points**2
+
+        emulator = Emulator.fit(points, values, ["a"], ["x"], degree=2, ridge=10.0, holdout=0)
+        self.assertAlmostEqual(emulator.predict(points).mean(), values.mean())
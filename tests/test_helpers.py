@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
 import os.path
 import unittest
 import urllib
@@ -22,7 +23,17 @@ import urllib
 import numpy as np
 import pytest
 
-from Py6S import AtmosProfile, OutputParsingError, ParameterError, SixS, SixSHelpers
+from Py6S import (
+    AtmosProfile,
+    GroundReflectance,
+    OutputParsingError,
+    ParameterError,
+    SixS,
+    SixSHelpers,
+    Wavelength,
+    hooks,
+)
+from Py6S.progress import BarProgress
 
 test_dir = os.path.relpath(os.path.dirname(__file__))
 
@@ -504,6 +515,202 @@ class AllAnglesTests(unittest.TestCase):
         np.testing.assert_allclose(results[0], res0)
 
 
+class AngleDeduplicationTests(unittest.TestCase):
+    def count_runs(self, **kwargs):
+        s = SixS()
+        s.sixs_path = None
+        s.geometry.solar_a = 0
+        started = []
+
+        def hook(event, info):
+            if event == "run_started":
+                started.append(info["sixs"])
+
+        hooks.add_hook(hook)
+        try:
+            results = SixSHelpers.Angles.run360(
+                s, "view", na=5, nz=3, output_name="pixel_reflectance", on_error="mask", **kwargs
+            )
+        finally:
+            hooks.remove_hook(hook)
+
+        self.assertEqual(results[0].shape, (15,))
+        return len(started)
+
+    def test_duplicates_run_once(self):
+        # Azimuths of 0 and 360 are the same, and all azimuths at zenith 0 are the same
+        self.assertEqual(self.count_runs(), 9)
+
+    def test_symmetric(self):
+        # With the sun at azimuth 0, view azimuths of 90 and 270 are mirror images
+        self.assertEqual(self.count_runs(symmetric=True), 7)
+
+    def test_results_scattered(self):
+        s = SixS()
+        results, azimuths, zeniths, sa, sz = SixSHelpers.Angles.run360(
+            s, "view", na=5, nz=3, output_name="pixel_reflectance"
+        )
+        results = results.reshape(5, 3)
+
+        np.testing.assert_allclose(results[0], results[4])
+        np.testing.assert_allclose(results[:, 0], results[0, 0])
+
+
+class ProgressTests(unittest.TestCase):
+    def test_progress_callback(self):
+        s = SixS()
+        reports = []
+
+        SixSHelpers.Wavelengths.run_wavelengths(
+            s, [0.4, 0.5, 0.6], output_name="apparent_radiance", progress=reports.append
+        )
+
+        self.assertEqual([r.completed for r in reports], [1, 2, 3])
+        self.assertEqual(reports[-1].total, 3)
+        self.assertEqual(reports[-1].eta, 0)
+        self.assertGreater(reports[-1].rate, 0)
+
+    def test_progress_bar(self):
+        s = SixS()
+        stream = io.StringIO()
+
+        SixSHelpers.Angles.run_principal_plane(
+            s, output_name="apparent_radiance", progress=BarProgress(stream)
+        )
+
+        self.assertIn("35/35", stream.getvalue())
+
+
+class LambertianSurfacesTests(unittest.TestCase):
+    def test_matches_direct_runs(self):
+        s = SixS()
+        s.wavelength = Wavelength(0.5)
+        refls = np.array([0.05, 0.23, 0.61])
+        app_refl, app_rad = SixSHelpers.LambertianSurfaces.run(s, refls)
+
+        for rho, refl, rad in zip(refls, app_refl, app_rad):
+            s.ground_reflectance = GroundReflectance.HomogeneousLambertian(rho)
+            s.run()
+            self.assertAlmostEqual(refl, s.outputs.apparent_reflectance, delta=1e-5)
+            self.assertAlmostEqual(rad, s.outputs.apparent_radiance, delta=0.01)
+
+    def test_spectra(self):
+        s = SixS()
+        spectra = [np.array([[0.4, 0.1], [0.9, 0.6]]), np.array([[0.4, 0.3], [0.9, 0.3]])]
+        wv, app_refl, app_rad = SixSHelpers.LambertianSurfaces.run_wavelengths(
+            s, [0.5, 0.8], spectra
+        )
+
+        np.testing.assert_allclose(wv, [0.5, 0.8])
+        self.assertEqual(app_refl.shape, (2, 2))
+        self.assertEqual(app_rad.shape, (2, 2))
+
+        s.wavelength = Wavelength(0.8)
+        s.ground_reflectance = GroundReflectance.HomogeneousLambertian(0.5)
+        s.run()
+        self.assertAlmostEqual(app_refl[0, 1], s.outputs.apparent_reflectance, delta=1e-5)
+
+    def test_single_spectrum(self):
+        # A single spectrum with two points, at two wavelengths, has the same shape as a 2x2 array
+        # of reflectances, and must be treated as one surface
+        s = SixS()
+        spectrum = np.array([[0.4, 0.1], [0.9, 0.6]])
+        wv, app_refl, app_rad = SixSHelpers.LambertianSurfaces.run_wavelengths(
+            s, [0.5, 0.8], spectrum
+        )
+        self.assertEqual(app_refl.shape, (1, 2))
+
+        wv, refl_matrix, rad_matrix = SixSHelpers.LambertianSurfaces.run_wavelengths(
+            s, [0.5, 0.8], reflectances=np.interp([0.5, 0.8], spectrum[:, 0], spectrum[:, 1])[None]
+        )
+        np.testing.assert_allclose(refl_matrix, app_refl)
+
+        with self.assertRaises(ParameterError):
+            SixSHelpers.LambertianSurfaces.run_wavelengths(s, [0.5, 0.8], reflectances=spectrum[0])
+        with self.assertRaises(ParameterError):
+            SixSHelpers.LambertianSurfaces.run_wavelengths(s, [0.5, 0.8])
+
+
+class MultipleOutputTests(unittest.TestCase):
+    def test_wavelengths_multiple_outputs(self):
+        s = SixS()
+        wv, res = SixSHelpers.Wavelengths.run_wavelengths(
+            s,
+            [0.5, 0.6],
+            output_name={"rad": "apparent_radiance", "trans": "total_gaseous_transmittance"},
+        )
+
+        self.assertEqual(sorted(res.keys()), ["rad", "trans"])
+        wv, rad = SixSHelpers.Wavelengths.run_wavelengths(
+            s, [0.5, 0.6], output_name="apparent_radiance"
+        )
+        np.testing.assert_allclose(res["rad"], rad)
+
+    def test_run360_multiple_outputs(self):
+        s = SixS()
+        names = ["pixel_reflectance", "apparent_radiance"]
+        results, azimuths, zeniths, sa, sz = SixSHelpers.Angles.run360(
+            s, "view", na=4, nz=3, output_name=names
+        )
+
+        self.assertEqual(results["pixel_reflectance"].shape, (12,))
+        self.assertEqual(results["apparent_radiance"].shape, (12,))
+
+
+class DatasetOutputTests(unittest.TestCase):
+    def setUp(self):
+        pytest.importorskip("xarray")
+
+    def test_wavelengths_dataset(self):
+        s = SixS()
+        names = ["apparent_radiance", "transmittance_total_scattering.total"]
+        ds = SixSHelpers.Wavelengths.run_wavelengths(
+            s, [0.5, 0.6, 0.7], output_name=names, as_dataset=True
+        )
+
+        self.assertEqual(ds["apparent_radiance"].dims, ("wavelength",))
+        np.testing.assert_allclose(ds["wavelength"], [0.5, 0.6, 0.7])
+
+        wv, res = SixSHelpers.Wavelengths.run_wavelengths(s, [0.6], output_name=names[1])
+        self.assertAlmostEqual(float(ds[names[1]].sel(wavelength=0.6)), res[0])
+
+    def test_bands_dataset(self):
+        s = SixS()
+        ds = SixSHelpers.Wavelengths.run_landsat_etm(
+            s, output_name="apparent_radiance", as_dataset=True
+        )
+
+        self.assertEqual(ds.sizes["wavelength"], 6)
+        self.assertAlmostEqual(float(ds["wavelength"][0]), 0.4775, delta=0.002)
+
+    def test_run360_dataset(self):
+        s = SixS()
+        ds = SixSHelpers.Angles.run360(
+            s, "view", na=4, nz=3, output_name="pixel_reflectance", as_dataset=True
+        )
+
+        self.assertEqual(ds["pixel_reflectance"].dims, ("view_a", "view_z"))
+        self.assertEqual(ds["pixel_reflectance"].shape, (4, 3))
+        self.assertEqual(ds.attrs["solar_z"], s.geometry.solar_z)
+
+        results = SixSHelpers.Angles.run360(s, "view", na=4, nz=3, output_name="pixel_reflectance")
+        np.testing.assert_allclose(ds["pixel_reflectance"].values.ravel(), results[0])
+
+    def test_principal_plane_dataset(self):
+        s = SixS()
+        ds = SixSHelpers.Angles.run_principal_plane(
+            s, output_name="pixel_reflectance", as_dataset=True
+        )
+
+        self.assertEqual(ds.sizes["view_z"], 35)
+        self.assertEqual(ds["view_a"].dims, ("view_z",))
+
+    def test_dataset_requires_output_name(self):
+        s = SixS()
+        with self.assertRaises(ParameterError):
+            SixSHelpers.Wavelengths.run_wavelengths(s, [0.5], as_dataset=True)
+
+
 class AERONETImportTest(unittest.TestCase):
     def test_import_aeronet(self):
         s = SixS()
@@ -0,0 +1,179 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+
+import numpy as np
+
+from Py6S import AeroProfile, ParameterError, SixS, Wavelength
+from Py6S.lut import LookupTable
+from Py6S.metrics import MetricsRegistry
+
+
+class LookupTableTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.lut = LookupTable.build(
+            SixS(),
+            OrderedDict(
+                [("geometry.solar_z", np.arange(0, 61, 10)), ("aot550", [0.1, 0.2, 0.3, 0.4])]
+            ),
+            output_name=["pixel_radiance", "apparent_reflectance", "solar_z"],
+        )
+
+    def run_6s(self, solar_z, aot550):
+        s = SixS()
+        s.geometry.solar_z = solar_z
+        s.aot550 = aot550
+        s.run()
+        return s.outputs
+
+    def test_grid_points(self):
+        values = self.lut.interpolate({"geometry.solar_z": [20, 50], "aot550": [0.3, 0.1]})
+
+        for row, (solar_z, aot550) in zip(values, [(20, 0.3), (50, 0.1)]):
+            outputs = self.run_6s(solar_z, aot550)
+            self.assertAlmostEqual(row[0], outputs.pixel_radiance)
+            self.assertAlmostEqual(row[1], outputs.apparent_reflectance)
+
+    def test_interpolation_error(self):
+        values, error = self.lut.interpolate(
+            [[25, 0.15], [33, 0.32], [70, 0.2]], "pixel_radiance", return_error=True
+        )
+
+        for value, estimate, point in zip(values[:2], error[:2], [(25, 0.15), (33, 0.32)]):
+            actual = abs(value - self.run_6s(*point).pixel_radiance)
+            self.assertGreater(estimate, 0)
+            self.assertLess(actual, 0.01 * value)
+
+        self.assertTrue(np.isnan(values[2]))
+
+    def test_run_approx(self):
+        registry = MetricsRegistry()
+        registry.enable()
+        try:
+            s = SixS()
+            s.geometry.solar_z = 25
+            s.aot550 = 0.15
+            s.run(approx=self.lut)
+            self.assertEqual(s.outputs.fulltext, "")
+            self.assertAlmostEqual(
+                s.outputs.pixel_radiance,
+                self.lut.interpolate([[25, 0.15]], "pixel_radiance")[0],
+            )
+            self.assertEqual(registry.runs_approximated.get(), 1)
+
+            # A tolerance which can't be met, so 6S is run
+            s.run(approx=self.lut, tol=1e-12)
+            self.assertNotEqual(s.outputs.fulltext, "")
+
+            s.run(approx=self.lut, tol={"pixel_radiance": 0.05})
+            self.assertEqual(s.outputs.fulltext, "")
+            self.assertEqual(registry.runs_approximated.get(), 2)
+        finally:
+            registry.disable()
+
+    def test_not_covered(self):
+        s = SixS()
+        s.geometry.solar_z = 25
+        s.aot550 = 0.15
+        self.assertTrue(self.lut.covers(s))
+
+        s.aot550 = 0.5
+        self.assertFalse(self.lut.covers(s))
+
+        s.aot550 = 0.15
+        s.aero_profile = AeroProfile.PredefinedType(AeroProfile.Urban)
+        self.assertFalse(self.lut.covers(s))
+
+        s.aero_profile = AeroProfile.PredefinedType(AeroProfile.Maritime)
+        s.wavelength = Wavelength(0.6)
+        self.assertFalse(self.lut.covers(s))
+        s.run(approx=self.lut)
+        self.assertNotEqual(s.outputs.fulltext, "")
+
+    def test_save_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "lut.npz")
+            self.lut.save(filename)
+            lut = LookupTable.load(filename)
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(list(lut.axes.keys()), ["geometry.solar_z", "aot550"])
+        self.assertEqual(lut.fields, self.lut.fields)
+        self.assertEqual(lut.base_input, self.lut.base_input)
+        np.testing.assert_array_equal(lut.values, self.lut.values)
+
+    def test_quantise(self):
+        original = self.lut._decode(self.lut.values, [0, 1, 2])
+
+        for precision in ("float32", "float16", "uint16", "uint8"):
+            lut = self.lut.quantise(precision)
+            self.assertEqual(lut.values.dtype, np.dtype(precision))
+
+            decoded = lut._decode(lut.values, [0, 1, 2])
+            error = np.max(np.abs(decoded - original).reshape(-1, 3), axis=0)
+            self.assertTrue(np.all(error <= lut.quantisation_error))
+
+            # Interpolation is no further from the full precision table than the quantisation error
+            points = [[25, 0.15], [33, 0.32]]
+            values, estimate = lut.interpolate(points, return_error=True)
+            difference = np.abs(values - self.lut.interpolate(points))
+            self.assertTrue(np.all(difference <= lut.quantisation_error + 1e-12))
+            self.assertTrue(np.all(estimate >= lut.quantisation_error))
+
+    def test_quantise_max_error(self):
+        lut = self.lut.quantise("uint16", max_error=1e-3)
+        self.assertEqual(lut.values.dtype, np.uint16)
+
+        with self.assertRaises(ParameterError):
+            self.lut.quantise("uint8", max_error=1e-6)
+        with self.assertRaises(ParameterError):
+            self.lut.quantise("float16", max_error={"pixel_radiance": 1e-9})
+        with self.assertRaises(ParameterError):
+            self.lut.quantise("uint8", max_error={"pixel_reflectance": 0.1})
+        with self.assertRaises(ParameterError):
+            self.lut.quantise("int4")
+
+    def test_save_load_quantised(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "lut.npz")
+            self.lut.save(filename, precision="uint16", max_error=1e-3)
+            lut = LookupTable.load(filename)
+        finally:
+            shutil.rmtree(directory)
+
+        expected = self.lut.quantise("uint16")
+        self.assertEqual(lut.values.dtype, np.uint16)
+        np.testing.assert_array_equal(lut.values, expected.values)
+        np.testing.assert_array_equal(lut.quantisation_error, expected.quantisation_error)
+        np.testing.assert_allclose(
+            lut.interpolate([[25, 0.15]]), expected.interpolate([[25, 0.15]])
+        )
+
+    def test_invalid(self):
+        with self.assertRaises(ParameterError):
+            LookupTable({"aot550": [0.2, 0.1]}, np.zeros((2, 1)), ["pixel_radiance"])
+        with self.assertRaises(ParameterError):
+            self.lut.interpolate([[25, 0.15]], "pixel_reflectance")
@@ -0,0 +1,98 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+import urllib.request
+
+from Py6S import ExecutionError, OutputParsingError, SixS, hooks
+from Py6S.metrics import MetricsRegistry
+
+
+class MetricsTests(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def send_run(self, total=1.5):
+        self.registry.handle_event("run_started", {})
+        timings = {"render": 0.1, "execute": total / 2, "child_cpu": 1.2, "total": total}
+        self.registry.handle_event("run_timings", {"timings": timings})
+
+    def test_run_counters(self):
+        self.send_run()
+        self.send_run(total=0.05)
+        self.registry.handle_event("run_started", {})
+        self.registry.handle_event("run_failed", {"error": OutputParsingError("bad")})
+
+        self.assertEqual(self.registry.runs_started.get(), 3)
+        self.assertEqual(self.registry.runs_completed.get(), 2)
+        self.assertEqual(self.registry.runs_failed.get(error="OutputParsingError"), 1)
+        self.assertEqual(self.registry.run_duration.get(), (2, 1.55))
+        self.assertAlmostEqual(self.registry.child_cpu_seconds.get(), 2.4)
+
+    def test_render(self):
+        self.send_run()
+        self.registry.handle_event("cache_hit", {})
+        self.registry.handle_event("queue_depth", {"depth": 12})
+        text = self.registry.render()
+
+        self.assertIn("# TYPE py6s_runs_started_total counter", text)
+        self.assertIn("py6s_runs_completed_total 1.0", text)
+        self.assertIn('py6s_run_duration_seconds_bucket{le="1.0"} 0', text)
+        self.assertIn('py6s_run_duration_seconds_bucket{le="2.5"} 1', text)
+        self.assertIn('py6s_run_duration_seconds_bucket{le="+Inf"} 1', text)
+        self.assertIn('py6s_run_stage_seconds_total{stage="render"} 0.1', text)
+        self.assertIn('py6s_cache_requests_total{result="hit"} 1.0', text)
+        self.assertIn("py6s_batch_queue_depth 12.0", text)
+
+    def test_write_textfile(self):
+        self.send_run()
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "py6s.prom")
+        self.registry.write_textfile(filename)
+
+        with open(filename) as f:
+            self.assertEqual(f.read(), self.registry.render())
+        self.assertEqual(os.listdir(directory), ["py6s.prom"])
+
+    def test_serve(self):
+        self.send_run()
+        server = self.registry.serve(0, "127.0.0.1")
+        try:
+            url = "http://127.0.0.1:%d/metrics" % server.server_address[1]
+            body = urllib.request.urlopen(url).read().decode("utf-8")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(body, self.registry.render())
+
+    def test_enable_failed_run(self):
+        s = SixS()
+        s.sixs_path = None
+
+        self.registry.enable()
+        try:
+            with self.assertRaises(ExecutionError):
+                s.run()
+        finally:
+            self.registry.disable()
+
+        self.assertEqual(self.registry.runs_started.get(), 1)
+        self.assertEqual(self.registry.runs_failed.get(error="ExecutionError"), 1)
+        self.assertNotIn(self.registry.handle_event, hooks._hooks)
@@ -0,0 +1,160 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pytest
+
+from Py6S import AeroProfile, ParameterError, SixS, Wavelength
+from Py6S.distributed import Worker
+from Py6S.rundb import RunDatabase, context_of
+
+pytest.importorskip("scipy")
+
+
+class RunDatabaseTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = RunDatabase(os.path.join(self.directory, "runs.db"))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.directory)
+
+    def test_records_runs(self):
+        self.db.enable()
+        for view_z in (0, 10, 20):
+            s = SixS()
+            s.geometry.view_z = view_z
+            s.run()
+        s.run()
+        self.db.disable()
+
+        self.assertEqual(len(self.db), 3)
+        self.assertEqual(list(self.db.contexts().values()), [3])
+
+    def test_ignores_ready_made_decks(self):
+        # A worker runs an input file on a default SixS instance, whose parameters don't match it
+        s = SixS()
+        s.geometry.view_z = 10
+
+        self.db.enable()
+        try:
+            Worker("http://127.0.0.1:1").run_job(
+                {"id": 1, "deck": s.generate_input_file(), "timeout": None}
+            )
+        finally:
+            self.db.disable()
+
+        self.assertEqual(len(self.db), 0)
+
+    def test_nearest(self):
+        runs = []
+        for view_z in (0, 10, 20):
+            s = SixS()
+            s.geometry.view_z = view_z
+            s.run()
+            self.db.add(s)
+            runs.append(s)
+
+        query = SixS()
+        query.geometry.view_z = 12
+        results = self.db.nearest(query, k=2)
+
+        self.assertEqual([r.parameters["view_z"] for d, r in results], [10, 20])
+        self.assertAlmostEqual(results[0][0], 2.0)
+        self.assertEqual(results[0][1].outputs.pixel_radiance, runs[1].outputs.pixel_radiance)
+
+        point = dict(results[0][1].parameters)
+        point["aot550"] += 0.02
+        results = self.db.nearest(point, context=query)
+        self.assertAlmostEqual(results[0][0], 2.0)
+
+        self.assertEqual(self.db.nearest(query, max_distance=1), [])
+
+    def test_context(self):
+        s = SixS()
+        s.run()
+        self.db.add(s)
+
+        other = SixS()
+        other.aero_profile = AeroProfile.PredefinedType(AeroProfile.Urban)
+        self.assertNotEqual(context_of(s), context_of(other))
+
+        other = SixS()
+        other.geometry.month = 1
+        self.assertNotEqual(context_of(s), context_of(other))
+
+        # Bands with the same centre but different filter functions
+        band = SixS()
+        band.wavelength = Wavelength(0.5, 0.51)
+        other = SixS()
+        other.wavelength = Wavelength(0.5, 0.51, [0.5, 1.0, 1.0, 1.0, 0.5])
+        self.assertNotEqual(context_of(band), context_of(other))
+        self.assertEqual(self.db.parameter_values(other)[-1], 0.505)
+        self.assertEqual(self.db.nearest(other), [])
+
+        distances = self.db.nearest_distances(
+            [[32, 264, 23, 190, 0.5, 0.5], [32, 264, 23, 190, 0.6, 0.5]], context=s
+        )
+        np.testing.assert_allclose(distances, [0, 10])
+        self.assertTrue(np.isinf(self.db.nearest_distances([[0] * 6], context=other)[0]))
+
+    def test_context_parameters(self):
+        s = SixS()
+        other = SixS()
+        other.geometry.solar_z = 10
+        other.geometry.view_z = 10
+        other.aot550 = 0.3
+        self.assertEqual(context_of(s), context_of(other))
+
+        # Anything which isn't stored as a parameter is part of the context
+        parameters = ["geometry.solar_z"]
+        self.assertNotEqual(context_of(s, parameters), context_of(other, parameters))
+        other = SixS()
+        other.aot550 = 0.3
+        self.assertNotEqual(context_of(s, parameters), context_of(other, parameters))
+        other = SixS()
+        other.wavelength = Wavelength(0.6)
+        self.assertNotEqual(context_of(s, parameters), context_of(other, parameters))
+
+        db = RunDatabase(parameters=parameters)
+        s.run()
+        db.add(s)
+        other = SixS()
+        other.geometry.solar_z = 40
+        self.assertEqual(len(db.nearest(other)), 1)
+        other.geometry.view_z = 40
+        self.assertEqual(db.nearest(other), [])
+
+    def test_reopen(self):
+        s = SixS()
+        s.run()
+        self.db.add(s)
+        self.assertFalse(self.db.add(s))
+
+        filename = os.path.join(self.directory, "runs.db")
+        other = RunDatabase(filename)
+        self.assertEqual(len(other), 1)
+        other.close()
+
+        with self.assertRaises(ParameterError):
+            RunDatabase(filename, parameters=["aot550"])
@@ -0,0 +1,140 @@
+# This file is part of Py6S.
+#
+# Copyright 2012 Robin Wilson and contributors listed in the CONTRIBUTORS file.
+#
+# Py6S is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Py6S is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Py6S.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pytest
+
+from Py6S import SixS, SixSHelpers
+from Py6S.batch import run_batch
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from Py6S.streaming import ResultWriter  # noqa: E402
+
+
+class ResultWriterTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_runs(self):
+        runs = [SixS() for i in range(5)]
+        for i, run in enumerate(runs):
+            run.aot550 = 0.1 * (i % 3 + 1)
+        runs[4].sixs_path = None
+        return runs
+
+    def test_parquet(self):
+        filename = os.path.join(self.directory, "results.parquet")
+        runs = self.make_runs()
+
+        with ResultWriter(filename, parameters=["aot550"], row_group_size=2) as writer:
+            result = run_batch(
+                runs,
+                output_name=["pixel_radiance", "solar_z"],
+                on_error="mask",
+                writer=writer,
+                deduplicate=False,
+            )
+        self.assertIsNone(result)
+
+        f = pq.ParquetFile(filename)
+        self.assertEqual(f.metadata.num_row_groups, 3)
+
+        table = f.read().to_pydict()
+        order = np.argsort(table["index"])
+        self.assertEqual(list(np.array(table["aot550"])[order]), [run.aot550 for run in runs])
+
+        expected = run_batch(runs[:4], output_name="pixel_radiance")
+        np.testing.assert_allclose(np.array(table["pixel_radiance"])[order][:4], expected)
+        self.assertTrue(np.isnan(np.array(table["pixel_radiance"])[order][4]))
+        self.assertIn("ExecutionError", np.array(table["error"])[order][4])
+
+    def test_duplicates_written(self):
+        filename = os.path.join(self.directory, "results.arrow")
+        runs = self.make_runs()[:4]
+
+        for backend in ("thread", "process"):
+            with ResultWriter(filename) as writer:
+                run_batch(runs, output_name="pixel_radiance", writer=writer, backend=backend)
+
+            with pa.ipc.open_file(filename) as reader:
+                table = reader.read_all().to_pydict()
+
+            self.assertEqual(sorted(table["index"]), [0, 1, 2, 3])
+            values = dict(zip(table["index"], table["pixel_radiance"]))
+            self.assertEqual(values[0], values[3])
+
+    def test_helper(self):
+        filename = os.path.join(self.directory, "results.parquet")
+
+        with ResultWriter(filename, parameters=["geometry.view_z"]) as writer:
+            zeniths, results = SixSHelpers.Angles.run_principal_plane(
+                SixS(), output_name="pixel_radiance", writer=writer
+            )
+
+        self.assertIsNone(results)
+        table = pq.read_table(filename).to_pydict()
+        self.assertEqual(sorted(set(table["geometry.view_z"])), list(range(0, 90, 5)))
+
+    def test_schema_from_all_runs(self):
+        # The first row group has only a failed run and numerical parameters, so the types of the
+        # columns can't be taken from it
+        filename = os.path.join(self.directory, "results.parquet")
+        runs = self.make_runs()[::-1]
+        parameters = {"label": lambda run: run.aot550 if run.aot550 < 0.25 else "high"}
+
+        with ResultWriter(filename, parameters=parameters, row_group_size=1) as writer:
+            run_batch(
+                runs,
+                output_name="pixel_radiance",
+                on_error="mask",
+                writer=writer,
+                deduplicate=False,
+            )
+
+        table = pq.read_table(filename)
+        self.assertEqual(table.schema.field("label").type, pa.string())
+        self.assertEqual(table.schema.field("pixel_radiance").type, pa.float64())
+        labels = dict(zip(table.column("index").to_pylist(), table.column("label").to_pylist()))
+        self.assertEqual(labels[0], "0.2")
+        self.assertEqual(labels[2], "high")
+
+    def test_empty(self):
+        filename = os.path.join(self.directory, "results.parquet")
+
+        with ResultWriter(filename, parameters=["aot550"]) as writer:
+            run_batch([], output_name=["pixel_radiance", "solar_z"], writer=writer)
+
+        table = pq.read_table(filename)
+        self.assertEqual(table.num_rows, 0)
+        self.assertEqual(
+            table.schema.names, ["index", "aot550", "pixel_radiance", "solar_z", "error"]
+        )
+
+        filename = os.path.join(self.directory, "results.arrow")
+        ResultWriter(filename).close()
+        with pa.ipc.open_file(filename) as reader:
+            self.assertEqual(reader.schema.names, ["index", "error"])
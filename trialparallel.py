@@ -1,47 +1,41 @@
+import sys
 import time
-from random import random
 
 import numpy as np
-from IPython.parallel import Client, depend, dependent, require
 
 import Py6S
+from Py6S.batch import run_batch
+from Py6S.distributed import Coordinator
 
+# Start workers on any number of machines with:
+#   python -m Py6S.distributed worker http://<this machine>:8765 -n <number of cores>
 
-@require("random", "Py6S")
-def run(azimuth, zenith):
+
+def make_run(azimuth, zenith):
     s = Py6S.SixS()
     s.ground_reflectance = Py6S.GroundReflectance.HomogeneousRoujean(0.037, 0.0, 0.133)
     s.geometry.view_a = azimuth
     s.geometry.view_z = zenith
-    print(zenith)
-    s.run()
-    return s.outputs.pixel_radiance
-
-
-pstart = time.time()
-c = Client()
+    return s
 
-lv = c.load_balanced_view()
-
-tasks = []
 
 azimuths = np.linspace(0, 360, 36)
 zeniths = np.linspace(0, 80, 8)
 
-for azimuth in azimuths:
-    for zenith in zeniths:
-        tasks.append(lv.apply(run, azimuth, zenith))
+runs = [make_run(azimuth, zenith) for azimuth in azimuths for zenith in zeniths]
+
+coordinator = Coordinator(sys.argv[1] if len(sys.argv) > 1 else ":memory:")
+print("Serving jobs at %s" % coordinator.serve(8765))
 
-result = [task.get() for task in tasks]
+pstart = time.time()
+result = run_batch(
+    runs, output_name="pixel_radiance", backend="distributed", coordinator=coordinator
+)
 pend = time.time()
 print(result)
 
 sstart = time.time()
-res = []
-for azimuth in azimuths:
-    for zenith in zeniths:
-        res.append(run(azimuth, zenith))
-
+res = run_batch(runs, output_name="pixel_radiance", n=1)
 send = time.time()
 
 print("Parallel %f" % (pend - pstart))